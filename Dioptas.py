@@ -1,3 +1,7 @@
+import multiprocessing
+
 from dioptas import main
 
-main()
+if __name__ == '__main__':
+    multiprocessing.freeze_support()  # batch integration uses worker processes, also in frozen executables
+    main()
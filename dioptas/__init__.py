@@ -37,7 +37,6 @@ try:
 except ImportError:
     from io import StringIO
 import traceback
-from qtpy import QtWidgets, QtCore
 
 dioptas_version = __version__[:5]
 
@@ -47,13 +46,8 @@ icons_path = os.path.join(resources_path, 'icons')
 data_path = os.path.join(resources_path, 'data')
 style_path = os.path.join(resources_path, 'style')
 
-# Enable scaling for high DPI displays
-QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_EnableHighDpiScaling, True)
-
 from ._desktop_shortcuts import make_shortcut
 
-from .widgets.UtilityWidgets import ErrorMessageBox
-
 
 def excepthook(exc_type, exc_value, traceback_obj):
     """
@@ -91,12 +85,19 @@ def excepthook(exc_type, exc_value, traceback_obj):
         f.close()
     except IOError:
         pass
+    from .widgets.UtilityWidgets import ErrorMessageBox
     errorbox = ErrorMessageBox()
     errorbox.setText(str(notice) + str(msg) + str(version_info))
     errorbox.exec_()
 
 
 def main():
+    # widgets are only imported here, so that the model can be used without them (e.g. by dioptas-integrate)
+    from qtpy import QtWidgets, QtCore
+
+    # Enable scaling for high DPI displays
+    QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_EnableHighDpiScaling, True)
+
     app = QtWidgets.QApplication([])
     # sys.excepthook = excepthook
     from sys import platform as _platform
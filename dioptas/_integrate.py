@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Command line batch integration (dioptas-integrate). Only the model is used, no widgets are imported and no display
+is needed, so this can be run on compute nodes.
+
+Typical usage::
+
+    dioptas-integrate -c CeO2.poni -m detector.mask -o patterns --workers 16 "run5/*.tif"
+    dioptas-integrate -p experiment.dio --cake-formats .tif run5/
+    dioptas-integrate -c CeO2.poni --series -o patterns lambda_run_m1.nxs
+    dioptas-integrate -c CeO2.poni -o patterns --container run5.h5 "run5/*.tif"
+"""
+
+from __future__ import print_function
+
+import argparse
+import glob
+import os
+import multiprocessing
+
+import h5py
+
+from . import __version__
+from .model.Configuration import Configuration
+from .model.BatchIntegrator import BatchIntegrator
+from .model.SeriesIntegrator import SeriesIntegrator
+from .model.ImgModel import image_file_types
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        prog='dioptas-integrate',
+        description='Integrates 2D X-ray diffraction images to patterns or cakes without starting the Dioptas GUI.')
+    parser.add_argument('images', nargs='+',
+                        help='image files, glob patterns or directories (all image files inside are used)')
+
+    calibration_group = parser.add_mutually_exclusive_group(required=True)
+    calibration_group.add_argument('-p', '--project', help='Dioptas project file (*.dio) with the configuration')
+    calibration_group.add_argument('-c', '--calibration', help='pyFAI calibration file (*.poni)')
+
+    parser.add_argument('--configuration', type=int, default=None,
+                        help='index of the configuration in the project, defaults to the selected one')
+    parser.add_argument('-m', '--mask', help='mask file, overrides the mask of the project')
+    parser.add_argument('-o', '--output', default=None,
+                        help='output directory, defaults to the pattern directory of the project or the current '
+                             'directory')
+    parser.add_argument('-f', '--formats', default=None,
+                        help='comma separated pattern file formats, e.g. ".xy,.chi,.fxye" (default: .xy). Use "" to '
+                             'only integrate cakes.')
+    parser.add_argument('--cake-formats', default='',
+                        help='comma separated cake file formats, e.g. ".tif,.txt" (default: no cakes)')
+    parser.add_argument('--unit', choices=['2th_deg', 'q_A^-1', 'd_A'], default=None,
+                        help='integration unit, overrides the unit of the project (default: 2th_deg)')
+    parser.add_argument('--num-points', type=int, default=None,
+                        help='number of radial points, defaults to automatic binning')
+    parser.add_argument('--azimuth-points', type=int, default=None, help='number of azimuthal points in cakes')
+    parser.add_argument('--container', default=None,
+                        help='HDF5 file collecting all patterns (relative to the output directory), files already in '
+                             'an existing container are skipped. Pattern files are only written if formats are given '
+                             'explicitly.')
+    parser.add_argument('--container-cakes', action='store_true', help='also save the cakes into the container')
+    parser.add_argument('--series', action='store_true',
+                        help='integrate all frames of multi-frame files (Lambda, Karabo, SPE) into one HDF5 file per '
+                             'input file (<name>.h5), the pattern and cake formats are ignored')
+    parser.add_argument('--chunk-size', type=int, default=16,
+                        help='number of frames read at once in series mode (default: 16)')
+    parser.add_argument('-w', '--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not print the progress')
+    parser.add_argument('--version', action='version', version='%(prog)s {0}'.format(__version__))
+    return parser
+
+
+def collect_image_files(image_arguments):
+    """
+    Creates the list of image files from filenames, glob patterns and directories.
+    """
+    filenames = []
+    for image_argument in image_arguments:
+        if os.path.isdir(image_argument):
+            directory_files = [os.path.join(image_argument, f) for f in sorted(os.listdir(image_argument))
+                               if f.lower().endswith(tuple(image_file_types))]
+            filenames.extend(directory_files)
+        else:
+            filenames.extend(sorted(glob.glob(image_argument)))
+    return filenames
+
+
+def parse_formats(formats):
+    return [file_format.strip() for file_format in formats.split(',') if file_format.strip() != '']
+
+
+def load_configuration(args, first_filename, parser):
+    """
+    Creates the configuration used for the integration either from a project file or a calibration file.
+    :rtype: Configuration
+    """
+    if args.project is not None:
+        with h5py.File(args.project, 'r') as f:
+            configurations_group = f.get('configurations')
+            ind = args.configuration
+            if ind is None:
+                ind = configurations_group.attrs['selected_configuration']
+            configuration_group = configurations_group.get(str(ind))
+            if configuration_group is None:
+                parser.error('configuration {0} does not exist in {1}'.format(ind, args.project))
+            configuration = Configuration()
+            configuration.load_from_hdf5(configuration_group)
+        configuration.auto_integrate_pattern = False
+    else:
+        configuration = Configuration()
+        configuration.auto_integrate_pattern = False
+        configuration.calibration_model.load(args.calibration)
+
+    if args.mask is not None:
+        # the mask dimension is given by the images
+        configuration.img_model.load(first_filename)
+        if not configuration.mask_model.load_mask(args.mask):
+            parser.error('mask {0} does not have the same dimension as the images'.format(args.mask))
+        configuration.use_mask = True
+
+    if args.unit is not None:
+        configuration._integration_unit = args.unit
+    if args.num_points is not None:
+        configuration._integration_rad_points = args.num_points
+    if args.azimuth_points is not None:
+        configuration._cake_azimuth_points = args.azimuth_points
+    return configuration
+
+
+def get_output_directory(args, configuration):
+    working_directory = args.output
+    if working_directory is None:
+        working_directory = configuration.working_directories.get('pattern', '') or os.getcwd()
+    if not os.path.isdir(working_directory):
+        os.makedirs(working_directory)
+    return working_directory
+
+
+def integrate_series(args, configuration, filenames):
+    """
+    Integrates every given file as an image series into one HDF5 file.
+    """
+    working_directory = get_output_directory(args, configuration)
+    series_integrator = SeriesIntegrator(configuration, chunk_size=args.chunk_size)
+
+    for filename in filenames:
+        output_filename = os.path.join(working_directory, os.path.splitext(os.path.basename(filename))[0] + '.h5')
+
+        def print_progress(ind, num_frames):
+            if not args.quiet and ((ind + 1) % 100 == 0 or ind + 1 == num_frames):
+                print('{0}: [{1}/{2}]'.format(filename, ind + 1, num_frames))
+
+        series_integrator.integrate(filename, output_filename, callback=print_progress)
+    return 0
+
+
+def main(argv=None):
+    parser = create_parser()
+    args = parser.parse_args(argv)
+
+    filenames = collect_image_files(args.images)
+    if len(filenames) == 0:
+        parser.error('no image files found')
+
+    configuration = load_configuration(args, filenames[0], parser)
+
+    if args.series:
+        return integrate_series(args, configuration, filenames)
+
+    if args.formats is None:
+        file_formats = [] if args.container else ['.xy']
+    else:
+        file_formats = parse_formats(args.formats)
+    cake_formats = parse_formats(args.cake_formats)
+    if len(file_formats) == 0 and len(cake_formats) == 0 and args.container is None:
+        parser.error('neither pattern nor cake formats nor a container specified')
+
+    working_directory = get_output_directory(args, configuration)
+
+    def print_progress(ind, filename):
+        if not args.quiet:
+            print('[{0}/{1}] {2}'.format(ind + 1, len(filenames), filename))
+
+    batch_integrator = BatchIntegrator(configuration, working_directory, file_formats, cake_formats,
+                                       num_workers=args.workers, container_filename=args.container,
+                                       container_cakes=args.container_cakes)
+    batch_integrator.integrate(filenames, callback=print_progress)
+    return 0
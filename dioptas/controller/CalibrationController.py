@@ -470,9 +470,9 @@ class CalibrationController(object):
 
         # get options
         algorithm = str(self.widget.options_peaksearch_algorithm_cb.currentText())
-        delta_tth = np.float(self.widget.options_delta_tth_txt.text())
-        intensity_min_factor = np.float(self.widget.options_intensity_mean_factor_sb.value())
-        intensity_max = np.float(self.widget.options_intensity_limit_txt.text())
+        delta_tth = float(self.widget.options_delta_tth_txt.text())
+        intensity_min_factor = float(self.widget.options_intensity_mean_factor_sb.value())
+        intensity_max = float(self.widget.options_intensity_limit_txt.text())
 
         self.model.calibration_model.setup_peak_search_algorithm(algorithm)
 
@@ -481,10 +481,9 @@ class CalibrationController(object):
         else:
             mask = None
 
-        self.model.calibration_model.search_peaks_on_ring(0, delta_tth, intensity_min_factor, intensity_max, mask)
-        self.widget.peak_num_sb.setValue(2)
-        progress_dialog.setValue(1)
-        self.model.calibration_model.search_peaks_on_ring(1, delta_tth, intensity_min_factor, intensity_max, mask)
+        # the first two rings are searched with the same starting geometry
+        self.model.calibration_model.search_peaks_on_rings([0, 1], delta_tth, intensity_min_factor, intensity_max,
+                                                           mask)
         self.widget.peak_num_sb.setValue(3)
         if len(self.model.calibration_model.points):
             self.model.calibration_model.refine()
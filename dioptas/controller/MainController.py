@@ -26,6 +26,7 @@ from qtpy import QtWidgets, QtCore
 
 from ..widgets.MainWidget import MainWidget
 from ..model.DioptasModel import DioptasModel
+from ..model.util.HelperModule import FileNameIterator
 from ..widgets.UtilityWidgets import save_file_dialog, open_file_dialog
 
 from . import CalibrationController
@@ -54,6 +55,9 @@ class MainController(object):
             self.settings_directory = settings_directory
 
         self.model = DioptasModel()
+        if use_settings:
+            # the creation times of the files in the image and pattern directories are kept for iterating by time
+            FileNameIterator.index_cache_directory = os.path.join(self.settings_directory, 'file_index')
 
         self.calibration_controller = CalibrationController(self.widget.calibration_widget,
                                                             self.model)
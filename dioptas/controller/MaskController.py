@@ -373,7 +373,7 @@ class MaskController(object):
         filename = save_file_dialog(self.widget, "Save mask data",
                                     os.path.join(self.model.working_directories['mask'],
                                                  img_filename + '.mask'),
-                                    filter='Mask (*.mask)')
+                                    filter='Mask (*.mask);;Packed mask (*.h5)')
 
         if filename is not '':
             self.model.working_directories['mask'] = os.path.dirname(filename)
@@ -381,7 +381,7 @@ class MaskController(object):
 
     def load_mask_btn_click(self):
         filename = open_file_dialog(self.widget, caption="Load mask data",
-                                    directory=self.model.working_directories['mask'], filter='*.mask')
+                                    directory=self.model.working_directories['mask'], filter='Mask (*.mask *.h5)')
 
         if filename is not '':
             self.model.working_directories['mask'] = os.path.dirname(filename)
@@ -394,7 +394,7 @@ class MaskController(object):
 
     def add_mask_btn_click(self):
         filename = open_file_dialog(self.widget, caption="Add mask data",
-                                    directory=self.model.working_directories['mask'], filter='*.mask')
+                                    directory=self.model.working_directories['mask'], filter='Mask (*.mask *.h5)')
 
         if filename is not '':
             self.model.working_directories['mask'] = os.path.dirname(filename)
@@ -26,6 +26,8 @@ from PIL import Image
 from qtpy import QtWidgets, QtCore
 
 from ...widgets.UtilityWidgets import open_file_dialog, open_files_dialog, save_file_dialog
+from ...model.BatchIntegrator import BatchIntegrator
+from ...model.util.CosmicRemoval import get_thread_safe_start_method
 # imports for type hinting in PyCharm -- DO NOT DELETE
 from ...widgets.integration import IntegrationWidget
 from ...model.DioptasModel import DioptasModel
@@ -236,23 +238,34 @@ class ImageController(object):
                                                           len(filenames))
         self._set_up_batch_processing()
 
-        for ind in range(len(filenames)):
-            filename = str(filenames[ind])
-            base_filename = os.path.basename(filename)
-
-            progress_dialog.setValue(ind)
-            progress_dialog.setLabelText("Integrating: " + base_filename)
+        integrated_filenames = []
 
+        def update_progress(ind, filename):
+            integrated_filenames.append(filename)
+            progress_dialog.setValue(ind + 1)
+            progress_dialog.setLabelText("Integrated: " + os.path.basename(filename))
+            QtWidgets.QApplication.processEvents()
+            return not progress_dialog.wasCanceled()
+
+        container_filename = None
+        if self.widget.pattern_batch_container_cb.isChecked():
+            # the images of a batch are usually in one directory, which also names the container
+            container_filename = os.path.basename(os.path.dirname(os.path.abspath(filenames[0]))) + '.h5'
+
+        batch_integrator = BatchIntegrator(self.model.current_configuration, working_directory,
+                                           file_formats=self._get_pattern_file_endings(),
+                                           container_filename=container_filename,
+                                           start_method=get_thread_safe_start_method())
+        batch_integrator.integrate(filenames, callback=update_progress)
+
+        # show the last integrated image and its pattern
+        if integrated_filenames:
+            filename = integrated_filenames[-1]
             self.model.img_model.blockSignals(True)
             self.model.img_model.load(filename)
             self.model.img_model.blockSignals(False)
-
             x, y = self.integrate_pattern()
-            self._save_pattern(base_filename, working_directory, x, y)
-
-            QtWidgets.QApplication.processEvents()
-            if progress_dialog.wasCanceled():
-                break
+            self.model.pattern_model.set_pattern(x, y, filename, unit=self.get_integration_unit())
 
         progress_dialog.close()
         self._tear_down_batch_processing()
@@ -635,7 +648,7 @@ class ImageController(object):
             return
         cur_tth = self.get_current_pattern_tth()
         self.widget.img_widget.set_circle_line(
-            self.model.calibration_model.get_two_theta_array(), cur_tth / 180 * np.pi)
+            self.model.calibration_model.get_two_theta_ring(cur_tth / 180 * np.pi))
 
     def _update_image_mouse_click_pos(self):
         if self.clicked_tth is None or not self.model.calibration_model.is_calibrated:
@@ -789,8 +802,7 @@ class ImageController(object):
                 y = np.array([y])
                 tth = self.model.calibration_model.get_two_theta_img(x, y)
                 azi = self.model.calibration_model.get_azi_img(x, y) / np.pi * 180
-                self.widget.img_widget.set_circle_line(
-                    self.model.calibration_model.get_two_theta_array(), tth)
+                self.widget.img_widget.set_circle_line(self.model.calibration_model.get_two_theta_ring(tth))
             else:  # in the case of whatever
                 tth = 0
                 azi = 0
@@ -910,25 +922,14 @@ class ImageController(object):
                     if self.roi_active:
                         self.widget.img_widget.activate_roi()
 
+            elif self.widget.img_mode == 'Cake':
+                # the displayed cake might be combined from several configurations
+                self.model.current_configuration.save_cake(
+                    filename, cake=(self.model.cake_data, self.model.cake_tth, self.model.cake_azi))
             elif filename.endswith('.tiff') or filename.endswith('.tif'):
-                if self.widget.img_mode == 'Image':
-                    im_array = np.int32(self.model.img_data)
-                elif self.widget.img_mode == 'Cake':
-                    im_array = np.int32(self.model.cake_data)
-                im_array = np.flipud(im_array)
+                im_array = np.flipud(np.int32(self.model.img_data))
                 im = Image.fromarray(im_array)
                 im.save(filename)
-            elif filename.endswith('.txt') or filename.endswith('.csv'):
-                if self.widget.img_mode == 'Image':
-                    return
-                elif self.widget.img_mode == 'Cake':  # saving cake data as a text file for export.
-                    with open(filename, 'w') as out_file:  # this is done in an odd and slow way because the headers
-                        # should be floats and the data itself int.
-                        cake_tth = np.insert(self.model.cake_tth, 0, 0)
-                        np.savetxt(out_file, cake_tth[None], fmt='%6.3f')
-                        for azi, row in zip(self.model.cake_azi, self.model.cake_data):
-                            row_str = " ".join(["{:6.0f}".format(el) for el in row])
-                            out_file.write("{:6.2f}".format(azi) + row_str + '\n')
 
     def update_gui_from_configuration(self):
         self.widget.img_mask_btn.setChecked(self.model.use_mask)
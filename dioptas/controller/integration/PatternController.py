@@ -166,7 +166,7 @@ class PatternController(object):
             self.widget, "Save Pattern Data.",
             os.path.join(self.model.working_directories['pattern'],
                          img_filename + '.xy'),
-            ('Data (*.xy);;Data (*.chi);;Data (*.dat);;GSAS (*.fxye);;png (*.png);;svg (*.svg)'))
+            ('Data (*.xy);;Data (*.chi);;Data (*.dat);;GSAS (*.fxye);;HDF5 (*.h5);;png (*.png);;svg (*.svg)'))
 
         if filename is not '':
             if filename.endswith('.png'):
@@ -342,7 +342,7 @@ class PatternController(object):
     def set_image_line_position(self, tth):
         if self.model.calibration_model.is_calibrated:
             self.widget.img_widget.set_circle_line(
-                self.model.calibration_model.get_two_theta_array(), tth / 180 * np.pi)
+                self.model.calibration_model.get_two_theta_ring(tth / 180 * np.pi))
 
     def show_pattern_mouse_position(self, x, _):
         tth_str, d_str, q_str, azi_str = self.get_position_strings(x)
@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+import multiprocessing
+import uuid
+from copy import deepcopy
+
+import numpy as np
+
+from .Configuration import Configuration
+from .util import Pattern
+from .util.BatchContainer import BatchContainerFile, source_filename_key
+
+logger = logging.getLogger(__name__)
+
+# configuration used by the current worker process, created once by _initialize_worker
+_worker_configuration = None
+_worker_output = None
+
+
+class BatchIntegrator(object):
+    """
+    Integrates a list of image files with the settings of a Configuration and saves the resulting patterns and
+    optionally cakes. The images are processed (load -> correct -> integrate -> save) in a pool of worker processes,
+    each of them holding its own copy of the configuration. The BatchIntegrator does not emit any signals, progress is
+    reported through an optional callback function, therefore it can also be used without a running Qt application.
+
+    The saved patterns are identical to the ones created by the batch integration in the GUI. Additionally (or
+    instead, by giving no file formats) all patterns can be collected in a single HDF5 container file, see
+    BatchContainerFile. Images which are already in an existing container file are skipped, so an interrupted batch
+    can be continued by integrating the same files again.
+    """
+
+    def __init__(self, configuration, working_directory=None, file_formats=None, cake_formats=None,
+                 num_workers=None, container_filename=None, container_cakes=False, start_method=None):
+        """
+        :param configuration: configuration whose calibration, mask, corrections and integration settings are used
+        :type configuration: Configuration
+        :param working_directory: output directory for the integrated patterns, defaults to the pattern working
+                                  directory of the configuration
+        :param file_formats: list of file endings for the patterns (e.g. ['.xy', '.chi']), defaults to the
+                             integrated_patterns_file_formats of the configuration
+        :param cake_formats: list of file endings for the cakes (e.g. ['.tif', '.txt']). Cakes are only integrated
+                             when at least one format is given.
+        :param num_workers: number of worker processes, defaults to the number of CPUs. With 1 worker all files are
+                            processed in the current process.
+        :param container_filename: filename of an HDF5 container file collecting all patterns, relative filenames
+                                   are relative to the working directory
+        :param container_cakes: whether the cakes are also saved into the container file
+        :param start_method: multiprocessing start method of the worker processes, defaults to the start method of
+                             the platform. When called from the GUI this should be a thread safe start method, see
+                             CosmicRemoval.get_thread_safe_start_method.
+        """
+        if working_directory is None:
+            working_directory = configuration.working_directories['pattern']
+        if file_formats is None:
+            file_formats = configuration.integrated_patterns_file_formats
+        if cake_formats is None:
+            cake_formats = []
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+
+        self.working_directory = working_directory
+        self.file_formats = list(file_formats)
+        self.cake_formats = list(cake_formats)
+        self.num_workers = max(int(num_workers), 1)
+        self.container_filename = None
+        if container_filename is not None:
+            self.container_filename = os.path.join(working_directory, container_filename)
+        self.container_cakes = container_cakes
+        self.start_method = start_method
+        self.settings = get_configuration_settings(configuration)
+
+    def integrate(self, filenames, callback=None):
+        """
+        Integrates all given files and saves the patterns into the working directory.
+        :param filenames: list of image filenames
+        :param callback: function called after each processed file with the arguments (index, filename). If it
+                         returns False, the remaining files will not be processed.
+        :return: list of the saved pattern and cake filenames, followed by the container filename if a container file
+                 is used
+        """
+        filenames = [str(filename) for filename in filenames]
+
+        container = None
+        if self.container_filename is not None:
+            container = BatchContainerFile(self.container_filename).open()
+            num_files = len(filenames)
+            filenames = [filename for filename in filenames
+                         if source_filename_key(filename) not in container.integrated_filenames]
+            if len(filenames) < num_files:
+                logger.info("Skipping {0} files which are already in {1}.".format(num_files - len(filenames),
+                                                                                 self.container_filename))
+
+        try:
+            return self._integrate(filenames, container, callback)
+        finally:
+            if container is not None:
+                container.close()
+
+    def _integrate(self, filenames, container, callback):
+        if len(filenames) == 0:
+            return []
+
+        # files are written under a temporary name first, which is unique for this batch
+        temp_marker = uuid.uuid4().hex
+        output = (self.working_directory, self.file_formats, self.cake_formats,
+                  container is not None, self.container_cakes, temp_marker)
+        saved_filenames = []
+
+        def process_result(result, filename):
+            file_saved_filenames, container_row = result
+            saved_filenames.extend(file_saved_filenames)
+            if container_row is not None:
+                container.add_pattern(filename, **container_row)
+
+        num_workers = min(self.num_workers, len(filenames))
+        if num_workers == 1:
+            _initialize_worker(self.settings, output)
+            try:
+                for ind, filename in enumerate(filenames):
+                    process_result(_integrate_file(filename), filename)
+                    if callback is not None and callback(ind, filename) is False:
+                        break
+            finally:
+                _reset_worker()
+        else:
+            context = multiprocessing.get_context(self.start_method)
+            pool = context.Pool(num_workers, initializer=_initialize_worker, initargs=(self.settings, output))
+            terminated = False
+            try:
+                for ind, result in enumerate(pool.imap(_integrate_file, filenames)):
+                    process_result(result, filenames[ind])
+                    if callback is not None and callback(ind, filenames[ind]) is False:
+                        pool.terminate()
+                        terminated = True
+                        break
+                else:
+                    pool.close()
+            except Exception:
+                pool.terminate()
+                terminated = True
+                raise
+            finally:
+                pool.join()
+                if terminated:
+                    remove_temporary_files(self.working_directory, temp_marker)
+
+        if container is not None:
+            saved_filenames.append(self.container_filename)
+        return saved_filenames
+
+
+def get_configuration_settings(configuration):
+    """
+    Collects everything needed to reproduce the integration of a configuration in another process into a picklable
+    dictionary.
+    :type configuration: Configuration
+    :return: dictionary with the integration settings
+    """
+    img_model = configuration.img_model
+    calibration_model = configuration.calibration_model
+    mask_model = configuration.mask_model
+    pattern = configuration.pattern_model.pattern
+
+    pyfai_parameter = calibration_model.pattern_geometry.getPyFAI()
+    pyfai_parameter['polarization_factor'] = calibration_model.polarization_factor
+    pyfai_parameter['wavelength'] = calibration_model.wavelength
+    # the pattern geometry might be supersampled, the settings need the original pixel size
+    pyfai_parameter['pixel1'] = calibration_model.orig_pixel1
+    pyfai_parameter['pixel2'] = calibration_model.orig_pixel2
+
+    settings = {
+        'pyfai_parameter': pyfai_parameter,
+        'calibration_filename': calibration_model.filename,
+        'distortion_spline_filename': calibration_model.distortion_spline_filename,
+        'correct_solid_angle': calibration_model.correct_solid_angle,
+        'img_transformations': img_model.get_transformations_string_list(),
+        'supersampling_factor': img_model.supersampling_factor,
+        'factor': img_model.factor,
+        'background_data': None,
+        'background_scaling': img_model.background_scaling,
+        'background_offset': img_model.background_offset,
+        'img_corrections': deepcopy(img_model.img_corrections),
+        'use_mask': configuration.use_mask,
+        'mask_data': np.copy(mask_model.get_img()),
+        'roi': mask_model.roi,
+        'mask_supersampling_factor': mask_model.supersampling_factor,
+        'integration_unit': configuration.integration_unit,
+        'integration_rad_points': configuration.integration_rad_points,
+        'cake_azimuth_points': configuration.cake_azimuth_points,
+        'cake_azimuth_range': configuration.cake_azimuth_range,
+        'background_pattern': None,
+        'auto_background_subtraction': pattern.auto_background_subtraction,
+        'auto_background_subtraction_parameters': pattern.auto_background_subtraction_parameters,
+        'auto_background_subtraction_roi': pattern.auto_background_subtraction_roi,
+    }
+
+    if img_model.has_background():
+        settings['background_data'] = img_model.untransformed_background_data
+
+    background_pattern = configuration.pattern_model.background_pattern
+    if background_pattern is not None:
+        settings['background_pattern'] = (background_pattern.original_x, background_pattern.original_y)
+
+    return settings
+
+
+def create_configuration(settings):
+    """
+    Creates a new Configuration from settings obtained by get_configuration_settings. Automatic integration is
+    disabled in the returned configuration.
+    :return: configuration
+    :rtype: Configuration
+    """
+    configuration = Configuration()
+    configuration.auto_integrate_pattern = False
+
+    calibration_model = configuration.calibration_model
+    calibration_model.set_pyFAI(settings['pyfai_parameter'])
+    calibration_model.filename = settings['calibration_filename']
+    calibration_model.correct_solid_angle = settings['correct_solid_angle']
+    if settings['distortion_spline_filename'] is not None:
+        calibration_model.load_distortion(settings['distortion_spline_filename'])
+
+    img_model = configuration.img_model
+    img_model.blockSignals(True)
+    img_model.load_transformations_string_list(settings['img_transformations'])
+    img_model.supersampling_factor = settings['supersampling_factor']
+    img_model.factor = settings['factor']
+    img_model.background_scaling = settings['background_scaling']
+    img_model.background_offset = settings['background_offset']
+    if settings['background_data'] is not None:
+        img_model._background_data = settings['background_data']
+        img_model._perform_background_transformations()
+    img_model._img_corrections = settings['img_corrections']
+    calibration_model.set_supersampling(settings['supersampling_factor'])
+
+    configuration.use_mask = settings['use_mask']
+    configuration.mask_model.set_dimension(settings['mask_data'].shape)
+    configuration.mask_model.set_mask(settings['mask_data'])
+    configuration.mask_model.roi = settings['roi']
+    configuration.mask_model.set_supersampling(settings['mask_supersampling_factor'])
+
+    configuration._integration_unit = settings['integration_unit']
+    configuration._integration_rad_points = settings['integration_rad_points']
+    configuration._cake_azimuth_points = settings['cake_azimuth_points']
+    configuration._cake_azimuth_range = settings['cake_azimuth_range']
+
+    pattern_model = configuration.pattern_model
+    if settings['background_pattern'] is not None:
+        x, y = settings['background_pattern']
+        pattern_model.background_pattern = Pattern(x, y, 'background_pattern')
+    if settings['auto_background_subtraction']:
+        pattern_model.pattern.set_auto_background_subtraction(settings['auto_background_subtraction_parameters'],
+                                                              settings['auto_background_subtraction_roi'],
+                                                              recalc_pattern=False)
+    return configuration
+
+
+def get_temporary_filename(filename, temp_marker):
+    """
+    Creates the name of the hidden temporary file a file is written to before it is moved into place. The file ending
+    is kept, since it determines the file format.
+    :param temp_marker: string identifying the temporary files of a batch
+    """
+    directory, base_filename = os.path.split(filename)
+    name, file_ending = os.path.splitext(base_filename)
+    return os.path.join(directory, '.{0}.{1}.part{2}'.format(name, temp_marker, file_ending))
+
+
+def save_atomically(save_function, filename, temp_marker):
+    """
+    Calls save_function with a temporary filename and renames the written file to filename afterwards. This way a
+    terminated worker process never leaves a half written file behind under the final name.
+    :param save_function: function writing a file, called with the filename as only argument
+    :param temp_marker: string identifying the temporary files of a batch, see remove_temporary_files
+    """
+    temp_filename = get_temporary_filename(filename, temp_marker)
+    try:
+        save_function(temp_filename)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+
+def remove_temporary_files(working_directory, temp_marker):
+    """
+    Removes the temporary files left behind by terminated worker processes.
+    :param temp_marker: string identifying the temporary files of the batch
+    """
+    for directory in (working_directory, os.path.join(working_directory, 'bkg_subtracted')):
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            if filename.startswith('.') and '.{0}.part'.format(temp_marker) in filename:
+                try:
+                    os.remove(os.path.join(directory, filename))
+                except OSError:
+                    logger.warning("Could not remove the temporary file {0}.".format(filename))
+
+
+def save_integrated_pattern(configuration, base_filename, working_directory, file_formats, temp_marker=None):
+    """
+    Saves the current pattern of the configuration in all given file formats. When a background is set, the
+    background subtracted pattern is additionally saved into the 'bkg_subtracted' sub-folder.
+    :type configuration: Configuration
+    :param base_filename: filename of the integrated image (without directory)
+    :param temp_marker: if given, the patterns are written to temporary files first, see save_atomically
+    :return: list of saved filenames
+    """
+
+    def save_pattern(filename, subtract_background=False):
+        if temp_marker is None:
+            configuration.save_pattern(filename, subtract_background=subtract_background)
+        else:
+            save_atomically(lambda temp_filename: configuration.save_pattern(
+                temp_filename, subtract_background=subtract_background, header_filename=filename),
+                filename, temp_marker)
+
+    pattern_model = configuration.pattern_model
+    x, y = pattern_model.pattern.original_x, pattern_model.pattern.original_y
+
+    saved_filenames = []
+    for file_ending in file_formats:
+        filename = os.path.join(working_directory, os.path.splitext(base_filename)[0] + file_ending)
+        pattern_model.set_pattern(x, y, filename, unit=configuration.integration_unit)
+        save_pattern(filename)
+        saved_filenames.append(filename)
+
+        if pattern_model.pattern.has_background():
+            directory = os.path.join(working_directory, 'bkg_subtracted')
+            if not os.path.exists(directory):
+                try:
+                    os.mkdir(directory)
+                except OSError:  # might have been created by another worker in the meantime
+                    pass
+            filename = os.path.join(directory, pattern_model.pattern.name + file_ending)
+            save_pattern(filename, subtract_background=True)
+            saved_filenames.append(filename)
+    return saved_filenames
+
+
+def get_container_row(configuration, include_cake=False):
+    """
+    Collects the integration results of the current image of the configuration for BatchContainerFile.add_pattern.
+    :type configuration: Configuration
+    :return: dictionary with the keyword arguments of add_pattern (except the source filename)
+    """
+    pattern = configuration.pattern_model.pattern
+    row = {
+        'x': pattern.original_x,
+        'y': pattern.original_y,
+        'unit': configuration.integration_unit,
+        'motors_info': dict(configuration.img_model.motors_info),
+        'calibration_header': configuration.calibration_model.create_file_header(),
+    }
+    if pattern.has_background():
+        row['x_bkg_subtracted'], row['y_bkg_subtracted'] = pattern.data
+    if include_cake:
+        calibration_model = configuration.calibration_model
+        row['cake'] = (calibration_model.cake_img, calibration_model.cake_tth, calibration_model.cake_azi)
+    return row
+
+
+def _initialize_worker(settings, output):
+    global _worker_configuration, _worker_output
+    _worker_configuration = create_configuration(settings)
+    _worker_output = output
+
+
+def _reset_worker():
+    global _worker_configuration, _worker_output
+    _worker_configuration = None
+    _worker_output = None
+
+
+def _integrate_file(filename):
+    """
+    Loads, integrates and saves a single image file with the configuration of the current worker.
+    :return: tuple of the list of saved pattern and cake filenames and the row for the container file (None if no
+             container file is used)
+    """
+    configuration = _worker_configuration
+    working_directory, file_formats, cake_formats, use_container, container_cakes, temp_marker = _worker_output
+    base_filename = os.path.basename(filename)
+
+    configuration.img_model.load(filename)
+    configuration.update_mask_dimension()
+
+    saved_filenames = []
+    if file_formats or use_container:
+        configuration.integrate_image_1d()
+        saved_filenames.extend(save_integrated_pattern(configuration, base_filename, working_directory,
+                                                       file_formats, temp_marker))
+    if cake_formats or (use_container and container_cakes):
+        configuration.integrate_image_2d()
+        for file_ending in cake_formats:
+            cake_filename = os.path.join(working_directory, os.path.splitext(base_filename)[0] + file_ending)
+            save_atomically(configuration.save_cake, cake_filename, temp_marker)
+            saved_filenames.append(cake_filename)
+    container_row = None
+    if use_container:
+        container_row = get_container_row(configuration, container_cakes)
+    logger.info("Batch integrated {0}.".format(filename))
+    return saved_filenames, container_row
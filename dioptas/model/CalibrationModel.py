@@ -30,29 +30,33 @@ from pyFAI.calibrant import Calibrant
 from pyFAI.geometryRefinement import GeometryRefinement
 from pyFAI.massif import Massif
 from qtpy import QtCore
-from skimage.measure import find_contours
 
 from .. import calibrants_path
 from .util.HelperModule import get_base_name
+from .util.IntegratorCache import integrator_cache
+from .util.PixelLookup import PixelLookup
+from .util.RingPixelIndex import RingPixelIndex
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
 class CalibrationModel(QtCore.QObject):
-    def __init__(self, img_model=None):
+    def __init__(self, img_model=None, integrator_cache=integrator_cache):
         super(CalibrationModel, self).__init__()
         """
         :param img_model:
         :type img_model: ImgModel
+        :param integrator_cache: cache of the azimuthal integrators used for the 1d and 2d integration, by default
+                                 it is shared between all calibration models
+        :type integrator_cache: IntegratorCache
         """
         self.img_model = img_model
+        self.integrator_cache = integrator_cache
         self.points = []
         self.points_index = []
         self.pattern_geometry = AzimuthalIntegrator()
-        self.pattern_geometry_img_shape = None
         self.cake_geometry = None
-        self.cake_geometry_img_shape = None
         self.calibrant = Calibrant()
         self.pattern_geometry.wavelength = 0.3344e-10
         self.start_values = {'dist': 200e-3,
@@ -87,8 +91,13 @@ class CalibrationModel(QtCore.QObject):
         self.cake_img = np.zeros((2048, 2048))
         self.cake_tth = None
         self.cake_azi = None
+        self.cake_sum_signal = None
+        self.cake_sum_normalization = None
+        self.cake_count = None
 
         self.peak_search_algorithm = None
+        self._ring_pixel_index = RingPixelIndex()
+        self._pixel_lookup = PixelLookup()
 
     def find_peaks_automatic(self, x, y, peak_ind):
         """
@@ -205,57 +214,74 @@ class CalibrationModel(QtCore.QObject):
                      The mask should be given as an 2d array with the same dimensions as the image, where 1 denotes a
                      masked pixel and all others should be 0.
         """
-        self.reset_supersampling()
+        self.search_peaks_on_rings([ring_index], delta_tth, min_mean_factor, upper_limit, mask)
+
+    def search_peaks_on_rings(self, ring_indices, delta_tth=0.1, min_mean_factor=1,
+                              upper_limit=55000, mask=None):
+        """
+        Searches for peaks on several expected rings with the current calibration, see search_peaks_on_ring for the
+        parameters. The pixels of the rings are taken from a RingPixelIndex, so that the two theta values of the whole
+        image do not have to be calculated for every ring and every small change of the geometry.
+
+        :param ring_indices: list of ring indices
+        """
         if not self.is_calibrated:
             return
 
-        # transform delta from degree into radians
-        delta_tth = delta_tth / 180.0 * np.pi
-
-        # get appropriate two theta value for the ring number
+        # get appropriate two theta values for the ring numbers
         tth_calibrant_list = self.calibrant.get_2th()
-        if ring_index >= len(tth_calibrant_list):
+        if max(ring_indices) >= len(tth_calibrant_list):
             raise NotEnoughSpacingsInCalibrant()
-        tth_calibrant = np.float(tth_calibrant_list[ring_index])
-
-        # get the calculated two theta values for the whole image
-        tth_array = self.pattern_geometry.twoThetaArray(self.img_model._img_data.shape)
 
-        # create mask based on two_theta position
-        ring_mask = abs(tth_array - tth_calibrant) <= delta_tth
+        # transform delta from degree into radians
+        delta_tth = delta_tth / 180.0 * np.pi
 
+        supersampled = self.supersampling_factor != 1
+        self.reset_supersampling()
+        try:
+            for ring_index in ring_indices:
+                res = self._search_peaks_on_ring(float(tth_calibrant_list[ring_index]), delta_tth, min_mean_factor,
+                                                 upper_limit, mask)
+                # Store the result
+                if len(res):
+                    self.points.append(np.array(res))
+                    self.points_index.append(ring_index)
+        finally:
+            self.set_supersampling()
+            if supersampled:
+                self.pattern_geometry.reset()
+
+    def _search_peaks_on_ring(self, tth_calibrant, delta_tth, min_mean_factor, upper_limit, mask):
+        img_data = self.img_model._img_data
+
+        # get the pixels within delta_tth around the two theta position of the ring
+        ring_pixels = self._ring_pixel_index.get_ring_pixels(self.pattern_geometry, img_data.shape, tth_calibrant,
+                                                             delta_tth)
         if mask is not None:
-            mask = np.logical_and(ring_mask, np.logical_not(mask))
-        else:
-            mask = ring_mask
+            ring_pixels = ring_pixels[np.logical_not(np.ravel(mask)[ring_pixels])]
+        ring_data = img_data.ravel()[ring_pixels]
 
         # calculate the mean and standard deviation of this area
-        sub_data = np.array(self.img_model._img_data.ravel()[np.where(mask.ravel())], dtype=np.float64)
-        sub_data[np.where(sub_data > upper_limit)] = np.NaN
+        sub_data = np.array(ring_data, dtype=np.float64)
+        sub_data[sub_data > upper_limit] = np.nan
         mean = np.nanmean(sub_data)
         std = np.nanstd(sub_data)
 
         # set the threshold into the mask (don't detect very low intensity peaks)
         threshold = min_mean_factor * mean + std
-        mask2 = np.logical_and(self.img_model._img_data > threshold, mask)
-        mask2[np.where(self.img_model._img_data > upper_limit)] = False
-        size2 = mask2.sum(dtype=int)
+        peak_pixels = ring_pixels[np.logical_and(ring_data > threshold, np.logical_not(ring_data > upper_limit))]
+        mask2 = np.zeros(img_data.shape, dtype=bool)
+        mask2.ravel()[peak_pixels] = True
+        size2 = len(peak_pixels)
 
         keep = int(np.ceil(np.sqrt(size2)))
         try:
             sys.stdout = DummyStdOut
-            res = self.peak_search_algorithm.peaks_from_area(mask2, Imin=mean - std, keep=keep)
-            sys.stdout = sys.__stdout__
+            return self.peak_search_algorithm.peaks_from_area(mask2, Imin=mean - std, keep=keep)
         except IndexError:
-            res = []
-
-        # Store the result
-        if len(res):
-            self.points.append(np.array(res))
-            self.points_index.append(ring_index)
-
-        self.set_supersampling()
-        self.pattern_geometry.reset()
+            return []
+        finally:
+            sys.stdout = sys.__stdout__
 
     def set_calibrant(self, filename):
         self.calibrant = Calibrant()
@@ -315,16 +341,11 @@ class CalibrationModel(QtCore.QObject):
         self.pattern_geometry.reset()
 
     def integrate_1d(self, num_points=None, mask=None, polarization_factor=None, filename=None,
-                     unit='2th_deg', method='csr'):
+                     unit='2th_deg', method='csr', remove_empty_bins=True):
         if np.sum(mask) == self.img_model.img_data.shape[0] * self.img_model.img_data.shape[1]:
             # do not perform integration if the image is completely masked...
             return self.tth, self.int
 
-        if self.pattern_geometry_img_shape != self.img_model.img_data.shape:
-            # if cake geometry was used on differently shaped image before the azimuthal integrator needs to be reset
-            self.pattern_geometry.reset()
-            self.pattern_geometry_img_shape = self.img_model.img_data.shape
-
         if polarization_factor is None:
             polarization_factor = self.polarization_factor
 
@@ -332,49 +353,40 @@ class CalibrationModel(QtCore.QObject):
             num_points = self.calculate_number_of_pattern_points(2)
         self.num_points = num_points
 
+        # d-spacing is not a pyFAI unit, the pattern is integrated in two theta and converted afterwards
+        integration_unit = '2th_deg' if unit == 'd_A' else unit
+
+        integrator = self.integrator_cache.get_integrator(self.pattern_geometry, self.img_model.img_data.shape,
+                                                          mask=mask, unit=integration_unit, npt=num_points,
+                                                          method=method, polarization_factor=polarization_factor,
+                                                          correct_solid_angle=self.correct_solid_angle)
+
         t1 = time.time()
 
-        if unit is 'd_A':
-            try:
-                self.tth, self.int = self.pattern_geometry.integrate1d(self.img_model.img_data, num_points,
-                                                                       method=method,
-                                                                       unit='2th_deg',
-                                                                       mask=mask,
-                                                                       polarization_factor=polarization_factor,
-                                                                       correctSolidAngle=self.correct_solid_angle,
-                                                                       filename=filename)
-            except NameError:
-                self.tth, self.int = self.pattern_geometry.integrate1d(self.img_model.img_data, num_points,
-                                                                       method='csr',
-                                                                       unit='2th_deg',
-                                                                       mask=mask,
-                                                                       polarization_factor=polarization_factor,
-                                                                       correctSolidAngle=self.correct_solid_angle,
-                                                                       filename=filename)
+        try:
+            self.tth, self.int = integrator.integrate1d(self.img_model.img_data, num_points,
+                                                        method=method,
+                                                        unit=integration_unit,
+                                                        mask=mask,
+                                                        polarization_factor=polarization_factor,
+                                                        correctSolidAngle=self.correct_solid_angle,
+                                                        filename=filename)
+        except NameError:
+            self.tth, self.int = integrator.integrate1d(self.img_model.img_data, num_points,
+                                                        method='csr',
+                                                        unit=integration_unit,
+                                                        mask=mask,
+                                                        polarization_factor=polarization_factor,
+                                                        correctSolidAngle=self.correct_solid_angle,
+                                                        filename=filename)
+        if unit == 'd_A':
             self.tth = self.pattern_geometry.wavelength / (2 * np.sin(self.tth / 360 * np.pi)) * 1e10
-            self.int = self.int
-        else:
-            try:
-                self.tth, self.int = self.pattern_geometry.integrate1d(self.img_model.img_data, num_points,
-                                                                       method=method,
-                                                                       unit=unit,
-                                                                       mask=mask,
-                                                                       polarization_factor=polarization_factor,
-                                                                       correctSolidAngle=self.correct_solid_angle,
-                                                                       filename=filename)
-            except NameError:
-                self.tth, self.int = self.pattern_geometry.integrate1d(self.img_model.img_data, num_points,
-                                                                       method='csr',
-                                                                       unit=unit,
-                                                                       mask=mask,
-                                                                       polarization_factor=polarization_factor,
-                                                                       correctSolidAngle=self.correct_solid_angle,
-                                                                       filename=filename)
         logger.info('1d integration of {0}: {1}s.'.format(os.path.basename(self.img_model.filename), time.time() - t1))
 
-        ind = np.where((self.int > 0) & (~np.isnan(self.int)))
-        self.tth = self.tth[ind]
-        self.int = self.int[ind]
+        if remove_empty_bins:
+            ind = np.where((self.int > 0) & (~np.isnan(self.int)))
+            self.tth = self.tth[ind]
+            self.int = self.int[ind]
         return self.tth, self.int
 
     def integrate_2d(self, mask=None, polarization_factor=None, unit='2th_deg', method='csr',
@@ -383,30 +395,63 @@ class CalibrationModel(QtCore.QObject):
         if polarization_factor is None:
             polarization_factor = self.polarization_factor
 
-        if self.cake_geometry_img_shape != self.img_model.img_data.shape:
-            # if cake geometry was used on differently shaped image before the azimuthal integrator needs to be reset
-            self.cake_geometry.reset()
-            self.cake_geometry_img_shape = self.img_model.img_data.shape
-
         if rad_points is None:
             rad_points = self.calculate_number_of_pattern_points(2)
         self.num_points = rad_points
 
+        integrator = self.integrator_cache.get_integrator(self.cake_geometry, self.img_model.img_data.shape,
+                                                          mask=mask, unit=unit, npt=rad_points,
+                                                          npt_azim=azimuth_points, azimuth_range=azimuth_range,
+                                                          method=method, polarization_factor=polarization_factor,
+                                                          correct_solid_angle=self.correct_solid_angle)
+
         t1 = time.time()
 
-        res = self.cake_geometry.integrate2d(self.img_model.img_data, rad_points, azimuth_points,
-                                             azimuth_range=azimuth_range,
-                                             method=method,
-                                             mask=mask,
-                                             unit=unit,
-                                             polarization_factor=polarization_factor,
-                                             correctSolidAngle=self.correct_solid_angle)
+        res = integrator.integrate2d(self.img_model.img_data, rad_points, azimuth_points,
+                                     azimuth_range=azimuth_range,
+                                     method=method,
+                                     mask=mask,
+                                     unit=unit,
+                                     polarization_factor=polarization_factor,
+                                     correctSolidAngle=self.correct_solid_angle)
         logger.info('2d integration of {0}: {1}s.'.format(os.path.basename(self.img_model.filename), time.time() - t1))
         self.cake_img = res[0]
         self.cake_tth = res[1]
         self.cake_azi = res[2]
+        # older pyFAI versions do not give the summed signal and normalization of each bin
+        self.cake_sum_signal = getattr(res, 'sum_signal', None)
+        self.cake_sum_normalization = getattr(res, 'sum_normalization', None)
+        self.cake_count = getattr(res, 'count', None)
         return self.cake_img
 
+    def integrate_1d_from_cake(self, unit='2th_deg'):
+        """
+        Calculates the 1d pattern from the last 2d integration by reducing the cake along the azimuth. The signal and
+        normalization of all azimuthal bins are summed up before dividing, which gives the same result as a 1d
+        integration with the same radial bins. For older pyFAI versions the cake intensities are weighted by the
+        number of pixels in each bin.
+        :param unit: '2th_deg' or 'd_A', the cake needs to be integrated in two theta
+        :return: x and intensity of the pattern
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if self.cake_sum_signal is not None and self.cake_sum_normalization is not None:
+                self.int = np.sum(self.cake_sum_signal, axis=0) / np.sum(self.cake_sum_normalization, axis=0)
+            else:
+                if self.cake_count is not None:
+                    weights = self.cake_count
+                else:
+                    weights = (self.cake_img != 0).astype(np.float64)
+                self.int = np.sum(self.cake_img * weights, axis=0) / np.sum(weights, axis=0)
+
+        self.tth = self.cake_tth
+        if unit == 'd_A':
+            self.tth = self.pattern_geometry.wavelength / (2 * np.sin(self.tth / 360 * np.pi)) * 1e10
+
+        ind = np.where((self.int > 0) & (~np.isnan(self.int)))
+        self.tth = self.tth[ind]
+        self.int = self.int[ind]
+        return self.tth, self.int
+
     def create_point_array(self, points, points_ind):
         res = []
         for i, point_list in enumerate(points):
@@ -601,6 +646,18 @@ class CalibrationModel(QtCore.QObject):
         return self.pattern_geometry.twoThetaArray(self.img_model.img_data.shape)[::self.supersampling_factor,
                ::self.supersampling_factor]
 
+    def get_two_theta_ring(self, tth):
+        """
+        Calculates the line of a two theta value on the image, e.g. for showing the current pattern position.
+        :param tth:
+            two theta in radians
+        :return:
+            list of arrays with the shape (n, 2) with the pixel indices (of the original image, not supersampled) of
+            the continuous parts of the line
+        """
+        segments = self._pixel_lookup.get_ring_segments(self.pattern_geometry, self.img_model.img_data.shape, tth)
+        return [segment / self.supersampling_factor for segment in segments]
+
     def get_pixel_ind(self, tth, azi):
         """
         Calculates pixel index for a specfic two theta and azimutal value.
@@ -609,16 +666,13 @@ class CalibrationModel(QtCore.QObject):
         :param azi:
             azimuth in radians
         :return:
-            tuple of index 1 and 2
+            tuple of index 1 and 2, empty list if the position is not on the image
         """
-
-        tth_ind = find_contours(self.pattern_geometry.ttha, tth)
-        if len(tth_ind) == 0:
+        position = self._pixel_lookup.get_pixel_position(self.pattern_geometry, self.img_model.img_data.shape,
+                                                         tth, azi)
+        if position is None:
             return []
-        tth_ind = np.vstack(tth_ind)
-        azi_values = self.pattern_geometry.chi(tth_ind[:, 0], tth_ind[:, 1])
-        min_index = np.argmin(np.abs(azi_values - azi))
-        return tth_ind[min_index, 0], tth_ind[min_index, 1]
+        return position
 
     @property
     def wavelength(self):
@@ -20,6 +20,7 @@
 
 import os
 import numpy as np
+from PIL import Image
 from qtpy import QtCore
 
 from copy import deepcopy
@@ -30,6 +31,8 @@ from .util.ImgCorrection import CbnCorrection, ObliqueAngleDetectorAbsorptionCor
 
 from .util import Pattern
 from .util.calc import convert_units
+from .util.PatternFile import binary_pattern_file_endings
+from .util.PackedMask import write_mask_dataset, read_mask_dataset
 from . import ImgModel, CalibrationModel, MaskModel, PatternModel
 
 
@@ -67,6 +70,7 @@ class Configuration(QtCore.QObject):
 
         self._auto_integrate_pattern = True
         self._auto_integrate_cake = False
+        self.integrate_pattern_from_cake = False
 
         self.auto_save_integrated_pattern = False
         self.integrated_patterns_file_formats = ['.xy']
@@ -78,25 +82,36 @@ class Configuration(QtCore.QObject):
         Connects the img_changed signal to responding functions.
         """
         self.img_model.img_changed.connect(self.update_mask_dimension)
-        self.img_model.img_changed.connect(self.integrate_image_1d)
+        self.img_model.img_changed.connect(self.integrate_image)
+
+    def integrate_image(self):
+        """
+        Integrates the image in the ImageModel to a Pattern and/or Cake, depending on auto_integrate_pattern and
+        auto_integrate_cake. If the pattern can be calculated from the cake, the image is only integrated once.
+        """
+        if self.auto_integrate_pattern:
+            self.integrate_image_1d()
+            if self.auto_integrate_cake and not self._pattern_from_cake_possible():
+                self.integrate_image_2d()
+        elif self.auto_integrate_cake:
+            self.integrate_image_2d()
 
     def integrate_image_1d(self):
         """
         Integrates the image in the ImageModel to a Pattern. Will also automatically save the integrated pattern, if
         auto_save_integrated is True.
+        When integrate_pattern_from_cake is enabled and the cake is integrated automatically, the image is integrated
+        to a cake and the pattern is calculated from it.
         """
         if self.calibration_model.is_calibrated:
-            if self.use_mask:
-                if self.mask_model.supersampling_factor != self.img_model.supersampling_factor:
-                    self.mask_model.set_supersampling(self.img_model.supersampling_factor)
-                mask = self.mask_model.get_mask()
-            elif self.mask_model.roi is not None:
-                mask = self.mask_model.roi_mask
-            else:
-                mask = None
+            mask = self._get_integration_mask()
 
-            x, y = self.calibration_model.integrate_1d(mask=mask, unit=self.integration_unit,
-                                                       num_points=self.integration_rad_points)
+            if self._pattern_from_cake_possible():
+                self._integrate_cake(mask)
+                x, y = self.calibration_model.integrate_1d_from_cake(unit=self.integration_unit)
+            else:
+                x, y = self.calibration_model.integrate_1d(mask=mask, unit=self.integration_unit,
+                                                           num_points=self.integration_rad_points)
 
             self.pattern_model.set_pattern(x, y, self.img_model.filename, unit=self.integration_unit)  #
 
@@ -107,15 +122,9 @@ class Configuration(QtCore.QObject):
         """
         Integrates the image in the ImageModel to a Cake.
         """
-        if self.use_mask:
-            if self.mask_model.supersampling_factor != self.img_model.supersampling_factor:
-                self.mask_model.set_supersampling(self.img_model.supersampling_factor)
-            mask = self.mask_model.get_mask()
-        elif self.mask_model.roi is not None:
-            mask = self.mask_model.roi_mask
-        else:
-            mask = None
+        self._integrate_cake(self._get_integration_mask())
 
+    def _integrate_cake(self, mask):
         self.calibration_model.integrate_2d(mask=mask,
                                             rad_points=self._integration_rad_points,
                                             azimuth_points=self._cake_azimuth_points,
@@ -123,20 +132,40 @@ class Configuration(QtCore.QObject):
 
         self.cake_changed.emit()
 
-    def save_pattern(self, filename=None, subtract_background=False):
+    def _get_integration_mask(self):
+        if self.use_mask:
+            if self.mask_model.supersampling_factor != self.img_model.supersampling_factor:
+                self.mask_model.set_supersampling(self.img_model.supersampling_factor)
+            return self.mask_model.get_mask()
+        elif self.mask_model.roi is not None:
+            return self.mask_model.roi_mask
+        return None
+
+    def _pattern_from_cake_possible(self):
+        """
+        The pattern can only be calculated from the cake, when the cake covers the full azimuth range and the radial
+        bins of the cake (in two theta) can be used for the integration unit.
+        """
+        return self.integrate_pattern_from_cake and self.auto_integrate_cake and \
+               self._cake_azimuth_range is None and self.integration_unit in ('2th_deg', 'd_A')
+
+    def save_pattern(self, filename=None, subtract_background=False, header_filename=None):
         """
         Saves the current integrated pattern. The format depends on the file ending. Possible file formats:
-            [*.xy, *.chi, *.dat, *.fxye]
+            [*.xy, *.chi, *.dat, *.fxye, *.h5]
         :param subtract_background: flat whether the pattern should be saved with or without subtracted background
+        :param header_filename: filename written into the header of fxye files, defaults to filename
         """
         if filename is None:
             filename = self.img_model.filename
+        if header_filename is None:
+            header_filename = filename
 
-        if filename.endswith('.xy'):
+        if filename.endswith('.xy') or filename.endswith(binary_pattern_file_endings):
             self.pattern_model.save_pattern(filename, header=self._create_xy_header(),
                                             subtract_background=subtract_background)
         elif filename.endswith('.fxye'):
-            self.pattern_model.save_pattern(filename, header=self._create_fxye_header(filename),
+            self.pattern_model.save_pattern(filename, header=self._create_fxye_header(header_filename),
                                             subtract_background=subtract_background)
         else:
             self.pattern_model.save_pattern(filename, subtract_background=subtract_background)
@@ -156,6 +185,29 @@ class Configuration(QtCore.QObject):
         else:
             self.pattern_model.save_pattern(filename)
 
+    def save_cake(self, filename, cake=None):
+        """
+        Saves the current cake. The format depends on the file ending. Possible file formats:
+            [*.tif, *.tiff, *.txt, *.csv]
+        Image files contain the intensities as 32 bit integers, text files additionally contain the two theta values
+        in the first row and the azimuth values in the first column.
+        :param cake: tuple of the cake image, two theta and azimuth values to be saved instead of the cake of the
+                     calibration model (e.g. a combined cake)
+        """
+        if cake is None:
+            cake = (self.calibration_model.cake_img, self.calibration_model.cake_tth, self.calibration_model.cake_azi)
+        cake_img, cake_tth, cake_azi = cake
+        if filename.endswith('.tif') or filename.endswith('.tiff'):
+            im = Image.fromarray(np.flipud(np.int32(cake_img)))
+            im.save(filename)
+        elif filename.endswith('.txt') or filename.endswith('.csv'):
+            with open(filename, 'w') as out_file:
+                cake_tth = np.insert(cake_tth, 0, 0)
+                np.savetxt(out_file, cake_tth[None], fmt='%6.3f')
+                for azi, row in zip(cake_azi, cake_img):
+                    row_str = " ".join(["{:6.0f}".format(el) for el in row])
+                    out_file.write("{:6.2f}".format(azi) + row_str + '\n')
+
     def _create_xy_header(self):
         """
         Creates the header for the xy file format (contains information about calibration parameters).
@@ -220,7 +272,7 @@ class Configuration(QtCore.QObject):
     def integration_rad_points(self, new_value):
         self._integration_rad_points = new_value
         self.integrate_image_1d()
-        if self.auto_integrate_cake:
+        if self.auto_integrate_cake and not self._pattern_from_cake_possible():
             self.integrate_image_2d()
 
     @property
@@ -272,10 +324,7 @@ class Configuration(QtCore.QObject):
     @correct_solid_angle.setter
     def correct_solid_angle(self, new_val):
         self.calibration_model.correct_solid_angle = new_val
-        if self.auto_integrate_pattern:
-            self.integrate_image_1d()
-        if self._auto_integrate_cake:
-            self.integrate_image_2d()
+        self.integrate_image()
 
     def update_auto_background_parameters_unit(self, old_unit, new_unit):
         """
@@ -313,10 +362,6 @@ class Configuration(QtCore.QObject):
             return
 
         self._auto_integrate_cake = new_value
-        if new_value:
-            self.img_model.img_changed.connect(self.integrate_image_2d)
-        else:
-            self.img_model.img_changed.disconnect(self.integrate_image_2d)
 
     @property
     def auto_integrate_pattern(self):
@@ -328,10 +373,6 @@ class Configuration(QtCore.QObject):
             return
 
         self._auto_integrate_pattern = new_value
-        if new_value:
-            self.img_model.img_changed.connect(self.integrate_image_1d)
-        else:
-            self.img_model.img_changed.disconnect(self.integrate_image_1d)
 
     @property
     def cake_img(self):
@@ -379,6 +420,7 @@ class Configuration(QtCore.QObject):
 
         # cake parameters:
         general_information.attrs['auto_integrate_cake'] = self.auto_integrate_cake
+        general_information.attrs['integrate_pattern_from_cake'] = self.integrate_pattern_from_cake
         general_information.attrs['cake_azimuth_points'] = self.cake_azimuth_points
         if self.cake_azimuth_range is None:
             general_information.attrs['cake_azimuth_range'] = "None"
@@ -459,10 +501,10 @@ class Configuration(QtCore.QObject):
             image_group.attrs['has_roi'] = False
 
         # save mask model
+        # the masks are stored bit-packed in a group shared by all configurations, identical masks are only stored once
         mask_group = f.create_group('mask')
-        current_mask = self.mask_model.get_mask()
-        mask_data = mask_group.create_dataset('data', current_mask.shape, dtype=bool)
-        mask_data[...] = current_mask
+        write_mask_dataset(mask_group, 'packed_data', self.mask_model.get_mask(),
+                           shared_group=f.file.require_group('masks'))
 
         # save calibration model
         calibration_group = f.create_group('calibration_model')
@@ -618,7 +660,11 @@ class Configuration(QtCore.QObject):
             self.roi = tuple(f.get('image_model').get('roi')[...])
 
         # load mask model
-        self.mask_model.set_mask(np.copy(f.get('mask').get('data')[...]))
+        mask_group = f.get('mask')
+        if 'packed_data' in mask_group:
+            self.mask_model.set_mask(read_mask_dataset(mask_group.get('packed_data')))
+        else:
+            self.mask_model.set_mask(np.copy(mask_group.get('data')[...]))
 
         # load pattern model
         if f.get('pattern').get('x') and f.get('pattern').get('y'):
@@ -651,6 +697,10 @@ class Configuration(QtCore.QObject):
 
         # cake parameters:
         self.auto_integrate_cake = f.get('general_information').attrs['auto_integrate_cake']
+        try:
+            self.integrate_pattern_from_cake = bool(f.get('general_information').attrs['integrate_pattern_from_cake'])
+        except KeyError as e:
+            pass
         try:
             self.cake_azimuth_points = f.get('general_information').attrs['cake_azimuth_points']
         except KeyError as e:
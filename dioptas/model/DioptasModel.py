@@ -19,14 +19,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
-from scipy.interpolate import interp1d, interp2d
 import numpy as np
 from qtpy import QtCore
 
 import h5py
 
 from .util import jcpds
-from .util import Pattern
+from .util.CakeCombiner import CakeCombiner
+from .util.PatternCombiner import PatternCombiner
 from .Configuration import Configuration
 from . import ImgModel, CalibrationModel, MaskModel, PhaseModel, PatternModel, OverlayModel
 from .. import __version__
@@ -58,6 +58,8 @@ class DioptasModel(QtCore.QObject):
         self._combine_patterns = False
         self._combine_cakes = False
         self._cake_data = None
+        self._cake_combiner = CakeCombiner()
+        self._pattern_combiner = PatternCombiner()
 
         self.connect_models()
 
@@ -77,7 +79,7 @@ class DioptasModel(QtCore.QObject):
             self.configurations[-1].calibration_model.load(
                 os.path.join(dioptas_config_folder, 'transfer.poni'))
 
-        self.configurations[-1].img_model._img_data = self.current_configuration.img_model.img_data
+        self.configurations[-1].img_model._img_data = np.copy(self.current_configuration.img_model.img_data)
 
         self.select_configuration(len(self.configurations) - 1)
         self.configuration_added.emit()
@@ -330,17 +332,12 @@ class DioptasModel(QtCore.QObject):
         Combines cakes from all configurations into one large cake.
         """
         self._activate_cake()
-        tth = self._get_combined_cake_tth()
-        azi = self._get_combined_cake_azi()
-        combined_tth, combined_azi = np.meshgrid(tth, azi)
-        combined_intensity = np.zeros(combined_azi.shape)
+        cakes = []
         for configuration in self.configurations:
-            cake_interp2d = interp2d(configuration.calibration_model.cake_tth,
-                                     configuration.calibration_model.cake_azi,
-                                     configuration.calibration_model.cake_img,
-                                     fill_value=0)
-            combined_intensity += cake_interp2d(tth, azi)
-        self._cake_data = combined_intensity
+            calibration_model = configuration.calibration_model
+            cakes.append((calibration_model.cake_img, calibration_model.cake_tth, calibration_model.cake_azi,
+                          calibration_model.cake_count))
+        self._cake_data = self._cake_combiner.combine(cakes)
 
     def _activate_cake(self):
         """
@@ -351,100 +348,27 @@ class DioptasModel(QtCore.QObject):
                 configuration.auto_integrate_cake = True
                 configuration.integrate_image_2d()
 
-    def _get_cake_tth_range(self):
-        """
-        Gives the range of two theta values of all cakes in the different configurations.
-        :return: (minimum two theta, maximum two theta)
-        """
-        self._activate_cake()
-        min_tth = []
-        max_tth = []
-        for ind in range(len(self.configurations)):
-            min_tth.append(np.min(self.configurations[ind].calibration_model.cake_tth))
-            max_tth.append(np.max(self.configurations[ind].calibration_model.cake_tth))
-        return np.min(min_tth), np.max(max_tth)
-
-    def _get_cake_azi_range(self):
-        """
-        Gives the range of azimuth values of all cakes in the different configurations.
-        :return: (minimum azimuth, maximum azimuth)
-        """
-        self._activate_cake()
-        min_azi = []
-        max_azi = []
-        for ind in range(len(self.configurations)):
-            min_azi.append(np.min(self.configurations[ind].calibration_model.cake_azi))
-            max_azi.append(np.max(self.configurations[ind].calibration_model.cake_azi))
-        return np.min(min_azi), np.max(max_azi)
-
-    def _get_combined_cake_tth(self):
-        """
-        Gives an 1d array of two theta values which covers the two theta range of the cakes in all configurations.
-        :return: two theta array
-        """
-        min_tth, max_tth = self._get_cake_tth_range()
-        return np.linspace(min_tth, max_tth, 2048)
-
-    def _get_combined_cake_azi(self):
-        """
-        Gives an 1d array of azimuth values which covers the azimuth range of the cakes in all configurations.
-        :return: two theta array
-        """
-        min_azi, max_azi = self._get_cake_azi_range()
-        return np.linspace(min_azi, max_azi, 2048)
-
     @property
     def cake_tth(self):
         if not self.combine_cakes:
             return self.calibration_model.cake_tth
         else:
-            return self._get_combined_cake_tth()
+            return self._cake_combiner.tth
 
     @property
     def cake_azi(self):
         if not self.combine_cakes:
             return self.calibration_model.cake_azi
         else:
-            return self._get_combined_cake_azi()
+            return self._cake_combiner.azi
 
     @property
     def pattern(self):
         if not self.combine_patterns:
             return self.pattern_model.pattern
         else:
-            x_min = []
-            for ind in range(0, len(self.configurations)):
-                # determine ranges
-                x = self.configurations[ind].pattern_model.pattern.x
-                x_min.append(np.min(x))
-
-            sorted_pattern_ind = np.argsort(x_min)
-
-            pattern = self.configurations[sorted_pattern_ind[0]].pattern_model.pattern
-            for ind in sorted_pattern_ind[1:]:
-                x1, y1 = pattern.data
-                x2, y2 = self.configurations[ind].pattern_model.pattern.data
-
-                pattern2_interp1d = interp1d(x2, y2, kind='linear')
-
-                overlap_ind_pattern1 = np.where((x1 <= np.max(x2)) & (x1 >= np.min(x2)))[0]
-                left_ind_pattern1 = np.where((x1 <= np.min(x2)))[0]
-                right_ind_pattern2 = np.where((x2 >= np.max(x1)))[0]
-
-                combined_x1 = x1[left_ind_pattern1]
-                combined_y1 = y1[left_ind_pattern1]
-                combined_x2 = x1[overlap_ind_pattern1]
-                combined_y2 = (y1[overlap_ind_pattern1] + pattern2_interp1d(combined_x2)) / 2
-                combined_x3 = x2[right_ind_pattern2]
-                combined_y3 = y2[right_ind_pattern2]
-
-                combined_x = np.hstack((combined_x1, combined_x2, combined_x3))
-                combined_y = np.hstack((combined_y1, combined_y2, combined_y3))
-
-                pattern = Pattern(combined_x, combined_y)
-
-            pattern.name = "Combined Pattern"
-            return pattern
+            return self._pattern_combiner.combine(
+                [configuration.pattern_model.pattern for configuration in self.configurations])
 
     @property
     def combine_patterns(self):
@@ -483,6 +407,7 @@ class DioptasModel(QtCore.QObject):
         self.configuration_ind = 0
         self.overlay_model.reset()
         self.phase_model.reset()
+        self._pattern_combiner.reset()
         self.connect_models()
         self.working_directories = working_directories
         self.configuration_removed.emit(0)
@@ -498,6 +423,7 @@ class DioptasModel(QtCore.QObject):
             configuration.calibration_model.pattern_geometry.reset()
             if configuration.calibration_model.cake_geometry is not None:
                 configuration.calibration_model.cake_geometry.reset()
+            configuration.calibration_model.integrator_cache.clear()
             del configuration.calibration_model.cake_geometry
             del configuration.calibration_model.pattern_geometry
             del configuration.img_model
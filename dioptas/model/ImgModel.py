@@ -20,8 +20,10 @@
 
 import logging
 import os
+import threading
 from past.builtins import basestring
 import copy
+from functools import partial
 
 import numpy as np
 from PIL import Image
@@ -31,13 +33,20 @@ import fabio
 
 from .util.spe import SpeFile
 from .util.NewFileWatcher import NewFileInDirectoryWatcher
-from .util.HelperModule import rotate_matrix_p90, rotate_matrix_m90, FileNameIterator
+from .util.HelperModule import rotate_matrix_p90, rotate_matrix_m90, supersample_array, FileNameIterator
 from .util.ImgCorrection import ImgCorrectionManager, ImgCorrectionInterface, TransferFunctionCorrection
 from .util.LambdaLoader import LambdaImage
 from .util.KaraboLoader import KaraboFile
+from .util.ImgLoaderUtil import get_file_signature, get_tiff_memmap, load_edf_memmap
+from .util.ImagePrefetcher import ImagePrefetcher
 
 logger = logging.getLogger(__name__)
 
+# file endings of image files which are picked up when watching or processing whole directories
+image_file_types = ['.img', '.sfrm', '.dm3', '.edf', '.xml',
+                    '.cbf', '.kccd', '.msk', '.spr', '.tif',
+                    '.mccd', '.mar3450', '.pnm', 'spe']
+
 
 class ImgModel(QtCore.QObject):
     """
@@ -63,21 +72,27 @@ class ImgModel(QtCore.QObject):
         self.img_transformations = []
         self.supersampling_factor = 1
 
+        # setting up autoprocess, the directory watcher also keeps the file index of the file name iterator up to date
+        self._autoprocess = False
+        self._directory_watcher = NewFileInDirectoryWatcher(file_types=image_file_types)
+        self._directory_watcher.file_added.connect(self.load)
+
         self.file_iteration_mode = 'number'
-        self.file_name_iterator = FileNameIterator()
+        self.file_name_iterator = FileNameIterator(directory_watcher=self._directory_watcher)
 
         self.series_pos = 1
         self.series_max = 1
 
-        self._img_data = None
-        self._img_data_background_subtracted = None
-        self._img_data_absorption_corrected = None
-        self._img_data_background_subtracted_absorption_corrected = None
+        # cached stages of the img_data pipeline (transformed raw data -> background subtraction -> corrections ->
+        # factor -> supersampling), they are calculated when img_data is requested and reset when an input changes
+        self._img_data_corrected = None
+        self._img_data_output = None
+        self._img_data_output_key = None
+
+        self._img_data_raw = None
+        self._background_data_raw = None
 
-        self._img_data_supersampled = None
-        self._img_data_supersampled_background_subtracted = None
-        self._img_data_supersampled_absorption_corrected = None
-        self._img_data_supersampled_background_subtracted_absorption_corrected = None
+        self._img_data = None
 
         self.background_filename = ''
         self._background_data = None
@@ -104,7 +119,12 @@ class ImgModel(QtCore.QObject):
 
             # function to get an image in the current series. A function assigned to this attribute should take
             # a single parameter pos (position in the series starting at 0) and return a 2d array with the image data
-            {"name": "series_get_image", "default": None, "attribute": "series_get_image"}
+            {"name": "series_get_image", "default": None, "attribute": "series_get_image"},
+
+            # optional function to get several images of the current series at once. A function assigned to this
+            # attribute should take the parameters start and stop (positions starting at 0, stop is exclusive) and
+            # return a 3d array with the image data
+            {"name": "series_get_images", "default": None, "attribute": "series_get_images"}
         ]
 
         # set the loadable attributes to their defaults
@@ -112,14 +132,21 @@ class ImgModel(QtCore.QObject):
 
         self._img_corrections = ImgCorrectionManager()
 
-        # setting up autoprocess
-        self._autoprocess = False
-        self._directory_watcher = NewFileInDirectoryWatcher(
-            file_types=['.img', '.sfrm', '.dm3', '.edf', '.xml',
-                        '.cbf', '.kccd', '.msk', '.spr', '.tif',
-                        '.mccd', '.mar3450', '.pnm', 'spe']
-        )
-        self._directory_watcher.file_added.connect(self.load)
+        # image loaders in the order they are tried, loaders matching the file signature or ending are tried first
+        self._img_loaders = [self.load_PIL, self.load_spe, self.load_fabio, self.load_lambda, self.load_karabo]
+        self._signature_img_loaders = {
+            'tiff': [self.load_PIL],
+            'edf': [self.load_fabio],
+            'hdf5': [self.load_lambda, self.load_karabo],
+        }
+        self._file_ending_img_loaders = {'.spe': [self.load_spe]}
+        # loader which was successful for a (directory, file ending), used first for the next file
+        self._successful_img_loaders = {}
+        self._successful_img_loaders_lock = threading.Lock()  # images are also loaded by the prefetcher thread
+
+        # images following in the current iteration direction are loaded in the background, 0 disables prefetching
+        self.prefetch_num_images = 3
+        self._img_prefetcher = ImagePrefetcher(self.get_image_data)
 
     def load(self, filename):
         """
@@ -132,7 +159,9 @@ class ImgModel(QtCore.QObject):
         logger.info("Loading {0}.".format(filename))
         self.filename = filename
 
-        image_file_data = self.get_image_data(filename)
+        image_file_data = self._img_prefetcher.get(filename)
+        if image_file_data is None:
+            image_file_data = self.get_image_data(filename)
         self.set_loadable_attributes(image_file_data)
 
         self.file_name_iterator.update_filename(filename)
@@ -151,15 +180,37 @@ class ImgModel(QtCore.QObject):
         :return: dictionary containing all retrieved file information. Look at "loadable data" for possible key names.
                  Present key names depend on applied image loader
         """
-        img_loaders = [self.load_PIL, self.load_spe, self.load_fabio, self.load_lambda, self.load_karabo]
+        loader_key = (os.path.dirname(filename), os.path.splitext(filename)[1].lower())
 
-        for loader in img_loaders:
+        for loader in self._get_img_loaders(filename, loader_key):
             data = loader(filename)
             if data:
+                with self._successful_img_loaders_lock:
+                    self._successful_img_loaders[loader_key] = loader
                 return data
         else:
             raise IOError("No handler found for given image")
 
+    def _get_img_loaders(self, filename, loader_key):
+        """
+        Returns the image loaders in the order they should be tried for a file. The loader which was successful for
+        the last file with the same ending in the same directory comes first, followed by the loaders for the file
+        signature or file ending and all remaining loaders.
+        """
+        img_loaders = []
+        with self._successful_img_loaders_lock:
+            if loader_key in self._successful_img_loaders:
+                img_loaders.append(self._successful_img_loaders[loader_key])
+        img_loaders.extend(self._signature_img_loaders.get(get_file_signature(filename), []))
+        img_loaders.extend(self._file_ending_img_loaders.get(loader_key[1], []))
+        img_loaders.extend(self._img_loaders)
+
+        unique_img_loaders = []
+        for loader in img_loaders:
+            if loader not in unique_img_loaders:
+                unique_img_loaders.append(loader)
+        return unique_img_loaders
+
     def set_loadable_attributes(self, loaded_data):
         """
         Sets all attributes that change with the loading of an image to either their defaults or a given value.
@@ -176,7 +227,8 @@ class ImgModel(QtCore.QObject):
 
     def load_PIL(self, filename):
         """
-        Loads an image using the PIL library. Also returns file and motor info if present
+        Loads an image using the PIL library. Also returns file and motor info if present. Uncompressed tiff files are
+        memory mapped instead of being read completely.
         :param filename: path to the image file to be loaded
         :return: dictionary with image_data and file_info and motors_info if present. None if unsuccessful
         """
@@ -186,7 +238,10 @@ class ImgModel(QtCore.QObject):
             if np.prod(im.size) <= 1:
                 im.close()
                 return False
-            data["img_data"] = np.array(im)[::-1]
+            img_data = get_tiff_memmap(im, filename)
+            if img_data is None:
+                img_data = np.array(im)
+            data["img_data"] = img_data[::-1]
             try:
                 data["file_info"] = self._get_file_info(im)
                 data["motors_info"] = self._get_motors_info(im)
@@ -202,21 +257,34 @@ class ImgModel(QtCore.QObject):
         """
         Loads an image using the builtin spe library.
         :param filename: path to the image file to be loaded
-        :return: dictionary with image_data, None if unsuccessful
+        :return: dictionary with image_data (and series_max, series_get_image and series_get_images for files with
+                 multiple frames), None if unsuccessful
         """
         if os.path.splitext(filename)[1].lower() == '.spe':
             spe = SpeFile(filename)
-            return {"img_data": spe.img}
+            data = {"img_data": spe.img}
+            if spe.num_frames > 1:
+                data["series_max"] = spe.num_frames
+                data["series_get_image"] = spe.get_image
+                data["series_get_images"] = spe.get_images
+            return data
         else:
             return None
 
     def load_fabio(self, filename):
         """
-        Loads an image using the fabio library.
+        Loads an image using the fabio library. Uncompressed single frame EDF files are memory mapped instead of being
+        read completely.
         :param filename: path to the image file to be loaded
         :return: dictionary with image_data and image_data_fabio, None if unsuccessful
         """
         try:
+            if get_file_signature(filename) == 'edf':
+                edf_data = load_edf_memmap(filename)
+                if edf_data is not None:
+                    header, img_data = edf_data
+                    img_data_fabio = fabio.edfimage.EdfImage(data=img_data, header=header)
+                    return {"img_data_fabio": img_data_fabio, "img_data": img_data[::-1]}
             img_data_fabio = fabio.open(filename)
             img_data = img_data_fabio.data[::-1]
             return {"img_data_fabio": img_data_fabio, "img_data": img_data}
@@ -227,7 +295,7 @@ class ImgModel(QtCore.QObject):
         """
         loads an image made by a lambda detector using the builtin lambda library.
         :param filename: path to the image file to be loaded
-        :return: dictionary with img_data, series_max and series_get_image, None if unsuccessful
+        :return: dictionary with img_data, series_max, series_get_image and series_get_images, None if unsuccessful
         """
         try:
             lambda_im = LambdaImage(filename)
@@ -236,7 +304,8 @@ class ImgModel(QtCore.QObject):
 
         return {"img_data": lambda_im.get_image(0),
                 "series_max": lambda_im.series_max,
-                "series_get_image": lambda_im.get_image}
+                "series_get_image": lambda_im.get_image,
+                "series_get_images": lambda_im.get_images}
 
     def load_karabo(self, filename):
         """
@@ -408,6 +477,7 @@ class ImgModel(QtCore.QObject):
         next_file_name = self.file_name_iterator.get_next_filename(mode=self.file_iteration_mode, step=step, pos=pos)
         if next_file_name is not None:
             self.load(next_file_name)
+            self._prefetch_files(step=step, pos=pos)
 
     def load_previous_file(self, step=1, pos=None):
         """
@@ -419,6 +489,7 @@ class ImgModel(QtCore.QObject):
                                                                            step=step, pos=pos)
         if previous_file_name is not None:
             self.load(previous_file_name)
+            self._prefetch_files(step=-step, pos=pos)
 
     def load_next_folder(self, mec_mode=False):
         """
@@ -430,6 +501,7 @@ class ImgModel(QtCore.QObject):
         next_file_name = self.file_name_iterator.get_next_folder(mec_mode=mec_mode)
         if next_file_name is not None:
             self.load(next_file_name)
+            self._prefetch_folders(step=1, mec_mode=mec_mode)
 
     def load_previous_folder(self, mec_mode=False):
         """
@@ -442,6 +514,30 @@ class ImgModel(QtCore.QObject):
         next_previous_name = self.file_name_iterator.get_previous_folder(mec_mode=mec_mode)
         if next_previous_name is not None:
             self.load(next_previous_name)
+            self._prefetch_folders(step=-1, mec_mode=mec_mode)
+
+    def _prefetch_files(self, step, pos=None):
+        """
+        Starts loading the files following the current file with the given step in the background.
+        :param step: file number step, negative for previous files
+        """
+        self._prefetch(partial(self.file_name_iterator.get_following_filenames, self.file_name_iterator.complete_path,
+                               self.prefetch_num_images, step=step, mode=self.file_iteration_mode, pos=pos))
+
+    def _prefetch_folders(self, step, mec_mode=False):
+        """
+        Starts loading the files in the folders following the current one in the background.
+        :param step: 1 for the next folders, -1 for the previous folders
+        """
+        self._prefetch(partial(self.file_name_iterator.get_following_folders, self.file_name_iterator.complete_path,
+                               self.prefetch_num_images, step=step, mec_mode=mec_mode))
+
+    def _prefetch(self, get_filenames):
+        """
+        Hands get_filenames to the prefetcher, the filenames are determined and loaded in its worker thread, so that
+        the GUI thread is not blocked by looking up the following files.
+        """
+        self._img_prefetcher.prefetch_following(get_filenames)
 
     def set_file_iteration_mode(self, mode):
         """
@@ -457,10 +553,32 @@ class ImgModel(QtCore.QObject):
             self.file_name_iterator.create_timed_file_list = True
             self.file_name_iterator.update_filename(self.filename)
 
+    @property
+    def _img_data(self):
+        return self._img_data_raw
+
+    @_img_data.setter
+    def _img_data(self, new_data):
+        self._img_data_raw = new_data
+        self._invalidate_img_data()
+
+    @property
+    def _background_data(self):
+        return self._background_data_raw
+
+    @_background_data.setter
+    def _background_data(self, new_data):
+        self._background_data_raw = new_data
+        self._invalidate_img_data()
+
+    def _invalidate_img_data(self):
+        self._img_data_corrected = None
+        self._img_data_output = None
+
     def _calculate_img_data(self):
         """
-        Calculates compound img_data based on the state of the object. This function is used internally to not compute
-        those img arrays every time somebody requests the image data by get_img_data() and img_data.
+        Checks that background and corrections still fit to the current image and resets the cached img_data. The
+        img_data itself is only calculated when it is requested.
         """
 
         # check that all data has the same dimensions
@@ -473,36 +591,20 @@ class ImgModel(QtCore.QObject):
                 self.transfer_correction.reset()
                 self.corrections_removed.emit()
 
-        # calculate the current _img_data
-        if self._background_data is not None and not self._img_corrections.has_items():
-            self._img_data_background_subtracted = self._img_data - (self._background_scaling *
-                                                                     self._background_data +
-                                                                     self._background_offset)
-        elif self._background_data is None and self._img_corrections.has_items():
-            self._img_data_absorption_corrected = self._img_data / self._img_corrections.get_data()
-
-        elif self._background_data is not None and self._img_corrections.has_items():
-            self._img_data_background_subtracted_absorption_corrected = (self._img_data - (
-                    self._background_scaling * self._background_data + self._background_offset)) / \
-                                                                        self._img_corrections.get_data()
-
-        # supersample the current image data
-        if self.supersampling_factor > 1:
-            if self._background_data is None and not self._img_corrections.has_items():
-                self._img_data_supersampled = self.supersample_data(self._img_data, self.supersampling_factor)
-
-            if self._background_data is not None and not self._img_corrections.has_items():
-                self._img_data_supersampled_background_subtracted = \
-                    self.supersample_data(self._img_data_background_subtracted, self.supersampling_factor)
-
-            elif self._background_data is None and self._img_corrections.has_items():
-                self._img_data_supersampled_absorption_corrected = \
-                    self.supersample_data(self._img_data_absorption_corrected, self.supersampling_factor)
-
-            elif self._background_data is not None and self._img_corrections.has_items():
-                self._img_data_supersampled_background_subtracted_absorption_corrected = \
-                    self.supersample_data(self._img_data_background_subtracted_absorption_corrected,
-                                          self.supersampling_factor)
+        self._invalidate_img_data()
+
+    def _get_corrected_img_data(self):
+        """
+        :return: the transformed image data with subtracted background and applied corrections (cached)
+        """
+        if self._img_data_corrected is None:
+            img_data = self._img_data
+            if self._background_data is not None:
+                img_data = img_data - (self._background_scaling * self._background_data + self._background_offset)
+            if self._img_corrections.has_items():
+                img_data = img_data / self._img_corrections.get_data()
+            self._img_data_corrected = img_data
+        return self._img_data_corrected
 
     @property
     def img_data(self):
@@ -511,33 +613,16 @@ class ImgModel(QtCore.QObject):
             The image based on the current state of the ImgData object. If supersampling is set it will return a
             supersampled image array if background_data is set it will return a background_subtracted array and so on.
             It also works for combinations of all these options.
+            The array is cached until any of its inputs changes and should not be modified in place.
         """
-        if self.supersampling_factor == 1:
-            if self._background_data is None and not self._img_corrections.has_items():
-                return self._img_data * self.factor
-
-            elif self._background_data is not None and not self._img_corrections.has_items():
-                return self._img_data_background_subtracted * self.factor
-
-            elif self._background_data is None and self._img_corrections.has_items():
-                return self._img_data_absorption_corrected * self.factor
-
-            elif self._background_data is not None and self._img_corrections.has_items():
-                return self._img_data_background_subtracted_absorption_corrected * self.factor
-
-        else:
-            if self._background_data is None and not self._img_corrections.has_items():
-                return self._img_data_supersampled * self.factor
-
-            elif self._background_data is not None and not self._img_corrections.has_items():
-                return self._img_data_supersampled_background_subtracted * self.factor
-
-            elif self._background_data is None and self._img_corrections.has_items():
-                return self._img_data_supersampled_absorption_corrected * self.factor
-
-            elif self._background_data is not None and self._img_corrections.has_items():
-                return self._img_data_supersampled_background_subtracted_absorption_corrected * self.factor
-        return self._img_data * self.factor
+        key = (self.factor, self.supersampling_factor)
+        if self._img_data_output is None or self._img_data_output_key != key:
+            img_data = self._get_corrected_img_data()
+            if self.factor != 1:
+                img_data = img_data * self.factor
+            self._img_data_output = self.supersample_data(img_data, self.supersampling_factor)
+            self._img_data_output_key = key
+        return self._img_data_output
 
     @property
     def raw_img_data(self):
@@ -687,13 +772,11 @@ class ImgModel(QtCore.QObject):
 
     def set_supersampling(self, factor=None):
         """
-        Stores the supersampling factor and calculates supersampled original and background image arrays.
-        Updates all data calculations according to current ImgData object state.
+        Stores the supersampling factor, the supersampled image is calculated when img_data is requested.
         The img_changed signal will be emitted after the process.
         :param factor: int - supersampling factor
         """
         self.supersampling_factor = factor
-        self._calculate_img_data()
         self.img_changed.emit()
 
     def supersample_data(self, img_data, factor):
@@ -703,16 +786,7 @@ class ImgModel(QtCore.QObject):
         :param factor: int - supersampling factor
         :return: supersampled image
         """
-        if factor > 1:
-            img_data_supersampled = np.zeros((img_data.shape[0] * factor,
-                                              img_data.shape[1] * factor))
-            for row in range(factor):
-                for col in range(factor):
-                    img_data_supersampled[row::factor, col::factor] = img_data
-
-            return img_data_supersampled
-        else:
-            return img_data
+        return supersample_array(img_data, factor)
 
     def add_img_correction(self, correction, name=None):
         """
@@ -18,29 +18,36 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from collections import deque
-
 import numpy as np
 import skimage.draw
 from PIL import Image
 from qtpy import QtGui, QtCore
 from math import sqrt, atan2, cos, sin
 
-from .util.cosmics import cosmicsimage
+from .util.CosmicRemoval import find_cosmics, get_thread_safe_start_method
+from .util.HelperModule import supersample_array
+from .util.MaskHistory import MaskHistory
+from .util.PackedMask import packed_mask_file_endings, save_mask_file, load_mask_file
 
 
 class MaskModel(object):
     def __init__(self, mask_dimension=(2048, 2048)):
         self.mask_dimension = mask_dimension
         self.supersampling_factor = 1
+        self._history = MaskHistory()
         self.reset_dimension()
         self.filename = ''
         self.mode = True
         self.roi = None
 
         self._mask_data = np.zeros(self.mask_dimension, dtype=bool)
-        self._undo_deque = deque(maxlen=50)
-        self._redo_deque = deque(maxlen=50)
+
+        # supersampled roi and integration masks are cached until the mask, roi or supersampling changes, every
+        # method changing the mask data resets the cache with _mask_changed
+        self._roi_mask_key = None
+        self._roi_mask = None
+        self._mask_key = None
+        self._mask = None
 
     def set_dimension(self, mask_dimension):
         if not np.array_equal(mask_dimension, self.mask_dimension):
@@ -50,85 +57,88 @@ class MaskModel(object):
     def reset_dimension(self):
         if self.mask_dimension is not None:
             self._mask_data = np.zeros(self.mask_dimension, dtype=bool)
-            self._undo_deque = deque(maxlen=50)
-            self._redo_deque = deque(maxlen=50)
+            self._history.clear()
+            self._mask_changed()
 
     def set_supersampling(self, factor=None):
+        """
+        Sets the supersampling factor of the masks returned by get_mask and roi_mask. The supersampled masks are
+        calculated when they are needed.
+        """
         if factor is None:
             self.supersampling_factor = 1
         else:
             self.supersampling_factor = factor
 
-        if self.supersampling_factor != 1:
-            self._mask_data_supersampled = np.zeros((self._mask_data.shape[0] * factor,
-                                                     self._mask_data.shape[1] * factor))
-            for row in range(factor):
-                for col in range(factor):
-                    self._mask_data_supersampled[row::factor, col::factor] = self._mask_data
-
     @property
     def roi_mask(self):
-        if self.roi is not None:
-            roi_mask = np.ones(self.mask_dimension)
+        """
+        :return: boolean mask (supersampled if set) where everything outside of the roi is masked, None if no roi is
+                 set. The returned array is cached and should not be modified.
+        """
+        if self.roi is None:
+            return None
+
+        key = (tuple(self.roi), tuple(self.mask_dimension), self.supersampling_factor)
+        if key != self._roi_mask_key:
+            roi_mask = np.ones(self.mask_dimension, dtype=bool)
             x1, x2, y1, y2 = self.roi
             if x1 < 0:
                 x1 = 0
             if y1 < 0:
                 y1 = 0
-            roi_mask[int(x1):int(x2), int(y1):int(y2)] = 0
-
-            if self.supersampling_factor == None or self.supersampling_factor == 1:
-                return roi_mask
-            else:
-                factor = self.supersampling_factor
-                roi_mask_supersampled = np.zeros((self._mask_data.shape[0] * factor,
-                                                  self._mask_data.shape[1] * factor))
-                for row in range(factor):
-                    for col in range(factor):
-                        roi_mask_supersampled[row::factor, col::factor] = roi_mask
-                return roi_mask_supersampled
-        else:
-            return None
+            roi_mask[int(x1):int(x2), int(y1):int(y2)] = False
+
+            self._roi_mask = supersample_array(roi_mask, self.supersampling_factor)
+            self._roi_mask_key = key
+        return self._roi_mask
 
     def get_mask(self):
-        if self.supersampling_factor == 1:
-            if self.roi is None:
-                return self._mask_data
-            elif self.roi is not None:
-                return np.logical_or(self._mask_data, self.roi_mask)
-        else:
-            if self.roi is None:
-                return self._mask_data_supersampled
-            else:
-                return np.logical_or(self._mask_data_supersampled, self.roi_mask)
+        """
+        :return: the mask combined with the roi mask, supersampled if a supersampling factor is set. Supersampled or
+                 combined masks are cached and should not be modified.
+        """
+        if (self.supersampling_factor is None or self.supersampling_factor == 1) and self.roi is None:
+            return self._mask_data
+
+        key = (self.supersampling_factor, None if self.roi is None else tuple(self.roi))
+        if key != self._mask_key:
+            mask = supersample_array(self._mask_data, self.supersampling_factor)
+            if self.roi is not None:
+                mask = np.logical_or(mask, self.roi_mask)
+            self._mask = mask
+            self._mask_key = key
+        return self._mask
 
     def get_img(self):
         return self._mask_data
 
-    def update_deque(self):
+    def _mask_changed(self):
+        self._mask_key = None
+        self._mask = None
+
+    def update_deque(self, region=None):
         """
-        Saves the current mask data into a deque, which can be popped later
-        to provide an undo/redo feature.
-        When performing a new action the old redo steps will be cleared..._
+        Saves the current mask data into the undo history, which can be restored later
+        to provide an undo/redo feature. Only the region which is going to be changed is stored.
+        When performing a new action the old redo steps will be cleared.
+        Every action changing the mask calls this first, therefore the cached mask is reset here as well.
+        :param region: tuple of (row_slice, column_slice) changed by the following action, None for the whole mask
         """
-        self._undo_deque.append(np.copy(self._mask_data))
-        self._redo_deque.clear()
+        self._history.save(self._mask_data, region)
+        self._mask_changed()
 
     def undo(self):
-        try:
-            old_data = self._undo_deque.pop()
-            self._redo_deque.append(np.copy(self._mask_data))
+        old_data = self._history.undo(self._mask_data)
+        if old_data is not None:
             self._mask_data = old_data
-        except IndexError:
-            pass
+            self._mask_changed()
 
     def redo(self):
-        try:
-            new_data = self._redo_deque.pop()
-            self._undo_deque.append(np.copy(self._mask_data))
+        new_data = self._history.redo(self._mask_data)
+        if new_data is not None:
             self._mask_data = new_data
-        except IndexError:
-            pass
+            self._mask_changed()
 
     def mask_below_threshold(self, img_data, threshold):
         self.update_deque()
@@ -175,7 +185,6 @@ class MaskModel(object):
         Masks a rectangle. x and y parameters are the upper left corner
         of the rectangle.
         """
-        self.update_deque()
         if width > 0:
             x_ind1 = np.round(x)
             x_ind2 = np.round(x + width)
@@ -194,8 +203,9 @@ class MaskModel(object):
         if y_ind1 < 0:
             y_ind1 = 0
 
-        x_ind1, x_ind2, y_ind1, y_ind2 = int(x_ind1), int(x_ind2), int(y_ind1), int(y_ind2)
-        self._mask_data[x_ind1:x_ind2, y_ind1:y_ind2] = self.mode
+        region = (slice(int(x_ind1), int(x_ind2)), slice(int(y_ind1), int(y_ind2)))
+        self.update_deque(region)
+        self._mask_data[region] = self.mode
 
     def mask_polygon(self, x, y):
         """
@@ -203,8 +213,8 @@ class MaskModel(object):
         the polygon vertices. Uses the draw.polygon implementation of
         the skimage library.
         """
-        self.update_deque()
         rr, cc = skimage.draw.polygon(y, x, self._mask_data.shape)
+        self.update_deque(get_bounding_region(rr, cc))
         self._mask_data[rr, cc] = self.mode
 
     def mask_ellipse(self, cx, cy, x_radius, y_radius):
@@ -213,9 +223,9 @@ class MaskModel(object):
         given. Uses the draw.ellipse implementation of
         the skimage library.
         """
-        self.update_deque()
         rr, cc = skimage.draw.ellipse(
             cy, cx, y_radius, x_radius, shape=self._mask_data.shape)
+        self.update_deque(get_bounding_region(rr, cc))
         self._mask_data[rr, cc] = self.mode
 
     def grow(self):
@@ -240,14 +250,16 @@ class MaskModel(object):
         self.update_deque()
         self._mask_data[:, :] = False
 
-    def remove_cosmic(self, img):
+    def remove_cosmic(self, img, dtype=np.float64, num_workers=None):
+        """
+        Masks cosmic rays detected with two iterations of the L.A.Cosmic algorithm. The image is processed in tiles
+        by several processes, see CosmicRemoval.find_cosmics. The processes are not forked, since this is called from
+        the multithreaded GUI process.
+        """
         self.update_deque()
-        test = cosmicsimage(img, sigclip=3.0, objlim=3.0)
-        num = 2
-        for i in range(num):
-            test.lacosmiciteration(True)
-            test.clean()
-            self._mask_data = np.logical_or(self._mask_data, np.array(test.mask, dtype='bool'))
+        cosmics_mask = find_cosmics(img, sigclip=3.0, objlim=3.0, iterations=2, dtype=dtype, num_workers=num_workers,
+                                    start_method=get_thread_safe_start_method())
+        self._mask_data = np.logical_or(self._mask_data, cosmics_mask)
 
     def set_mode(self, mode):
         """
@@ -260,6 +272,11 @@ class MaskModel(object):
         self._mask_data = mask_data
 
     def save_mask(self, filename):
+        if filename.lower().endswith(packed_mask_file_endings):
+            save_mask_file(filename, self.get_img())
+            self.filename = filename
+            return
+
         im_array = np.int8(self.get_img())
         im = Image.fromarray(im_array)
         try:
@@ -273,10 +290,7 @@ class MaskModel(object):
         self.filename = filename
 
     def load_mask(self, filename):
-        try:
-            data = np.array(Image.open(filename))
-        except IOError:
-            data = np.loadtxt(filename)
+        data = read_mask_data(filename)
 
         if self.mask_dimension == data.shape:
             self.filename = filename
@@ -287,10 +301,7 @@ class MaskModel(object):
         return False
 
     def add_mask(self, filename):
-        try:
-            data = np.array(Image.open(filename))
-        except IOError:
-            data = np.loadtxt(filename)
+        data = read_mask_data(filename)
 
         if self.get_mask().shape == data.shape:
             self._add_mask(data)
@@ -355,3 +366,24 @@ class MaskModel(object):
             yn = p0.y() + (r - width) * sin(phi)
             p.append(QtCore.QPointF(xn, yn))
         return p
+
+
+def read_mask_data(filename):
+    """
+    Reads a mask from a packed mask file (see PackedMask), an image file or a text file.
+    """
+    if filename.lower().endswith(packed_mask_file_endings):
+        return load_mask_file(filename)
+    try:
+        return np.array(Image.open(filename))
+    except IOError:
+        return np.loadtxt(filename)
+
+
+def get_bounding_region(rows, cols):
+    """
+    :return: tuple of (row_slice, column_slice) of the bounding box of the given pixel indices
+    """
+    if len(rows) == 0:
+        return slice(0, 0), slice(0, 0)
+    return slice(int(np.min(rows)), int(np.max(rows)) + 1), slice(int(np.min(cols)), int(np.max(cols)) + 1)
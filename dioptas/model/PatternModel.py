@@ -22,9 +22,9 @@ import logging
 
 from qtpy import QtCore
 
-from math import sqrt
 from .util.HelperModule import FileNameIterator, get_base_name
 from .util import Pattern
+from .util.PatternFile import write_pattern
 
 logger = logging.getLogger(__name__)
 
@@ -67,7 +67,7 @@ class PatternModel(QtCore.QObject):
 
     def load_pattern(self, filename):
         """
-        Loads a pattern from a tabular pattern file (2 column txt file)
+        Loads a pattern from a tabular pattern file (2 column txt file) or a binary pattern file (*.h5)
         :param filename: filename of the data file
         """
         logger.info("Load pattern: {0}".format(filename))
@@ -92,37 +92,7 @@ class PatternModel(QtCore.QObject):
         else:
             x, y = self.pattern._original_x, self.pattern._original_y
 
-        file_handle = open(filename, 'w')
-        num_points = len(x)
-
-        if filename.endswith('.chi'):
-            if header is None or header == '':
-                file_handle.write(filename + '\n')
-                file_handle.write(self.unit + '\n\n')
-                file_handle.write("       {0}\n".format(num_points))
-            else:
-                file_handle.write(header)
-            for ind in range(num_points):
-                file_handle.write(' {0:.7E}  {1:.7E}\n'.format(x[ind], y[ind]))
-        elif filename.endswith('.fxye'):
-            factor = 100
-            if 'CONQ' in header:
-                factor = 1
-            header = header.replace('NUM_POINTS', '{0:.6g}'.format(num_points))
-            header = header.replace('MIN_X_VAL', '{0:.6g}'.format(factor*x[0]))
-            header = header.replace('STEP_X_VAL', '{0:.6g}'.format(factor*(x[1]-x[0])))
-
-            file_handle.write(header)
-            file_handle.write('\n')
-            for ind in range(num_points):
-                file_handle.write('\t{0:.6g}\t{1:.6g}\t{2:.6g}\n'.format(factor*x[ind], y[ind], sqrt(abs(y[ind]))))
-        else:
-            if header is not None:
-                file_handle.write(header)
-                file_handle.write('\n')
-            for ind in range(num_points):
-                file_handle.write('{0:.9E}  {1:.9E}\n'.format(x[ind], y[ind]))
-        file_handle.close()
+        write_pattern(filename, x, y, header, self.unit)
 
     def save_background_as_pattern(self, filename, header=None):
         """
@@ -132,37 +102,7 @@ class PatternModel(QtCore.QObject):
         """
         x, y = self.pattern.auto_background_pattern.data
 
-        file_handle = open(filename, 'w')
-        num_points = len(x)
-
-        if filename.endswith('.chi'):
-            if header is None or header == '':
-                file_handle.write(filename + '\n')
-                file_handle.write(self.unit + '\n\n')
-                file_handle.write("       {0}\n".format(num_points))
-            else:
-                file_handle.write(header)
-            for ind in range(num_points):
-                file_handle.write(' {0:.7E}  {1:.7E}\n'.format(x[ind], y[ind]))
-        elif filename.endswith('.fxye'):
-            factor = 100
-            if 'CONQ' in header:
-                factor = 1
-            header = header.replace('NUM_POINTS', '{0:.6g}'.format(num_points))
-            header = header.replace('MIN_X_VAL', '{0:.6g}'.format(factor * x[0]))
-            header = header.replace('STEP_X_VAL', '{0:.6g}'.format(factor * (x[1] - x[0])))
-
-            file_handle.write(header)
-            file_handle.write('\n')
-            for ind in range(num_points):
-                file_handle.write('\t{0:.6g}\t{1:.6g}\t{2:.6g}\n'.format(factor * x[ind], y[ind], sqrt(abs(y[ind]))))
-        else:
-            if header is not None:
-                file_handle.write(header)
-                file_handle.write('\n')
-            for ind in range(num_points):
-                file_handle.write('{0:.9E}  {1:.9E}\n'.format(x[ind], y[ind]))
-        file_handle.close()
+        write_pattern(filename, x, y, header, self.unit)
 
     def get_pattern(self):
         return self.pattern
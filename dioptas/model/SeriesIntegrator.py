@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+import threading
+
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+import numpy as np
+import h5py
+
+from .BatchIntegrator import get_configuration_settings, create_configuration
+from .. import __version__
+
+logger = logging.getLogger(__name__)
+
+
+class SeriesIntegrator(object):
+    """
+    Integrates all frames of a multi-frame image file (e.g. Lambda, Karabo or SPE series) with the settings of a
+    Configuration and writes all patterns into a single HDF5 file. The frames are read in chunks on a background
+    thread, so that reading the next chunk overlaps with the integration of the current one.
+
+    The output file contains the datasets:
+        - 'x': radial positions of the patterns (attribute 'unit')
+        - 'intensity': 2d array with one pattern per frame (frames x points)
+
+    Typical usage::
+
+        series_integrator = SeriesIntegrator(configuration)
+        series_integrator.integrate('run_m1.nxs', 'run.h5')
+    """
+
+    def __init__(self, configuration, chunk_size=16, num_prefetched_chunks=2):
+        """
+        :param configuration: configuration whose calibration, mask, corrections and integration settings are used,
+                              it is not changed by the series integration
+        :type configuration: Configuration
+        :param chunk_size: number of frames read at once
+        :param num_prefetched_chunks: maximum number of chunks read in advance by the background thread
+        """
+        self.chunk_size = max(int(chunk_size), 1)
+        self.num_prefetched_chunks = max(int(num_prefetched_chunks), 1)
+        self.configuration = create_configuration(get_configuration_settings(configuration))
+
+    def integrate(self, filename, output_filename, start=0, stop=None, callback=None):
+        """
+        Integrates the frames of an image series and saves the patterns into an HDF5 file.
+        :param filename: filename of the image series, single images are treated as a series with one frame
+        :param output_filename: filename of the HDF5 output file, an existing file will be overwritten
+        :param start: index of the first frame, starting at 0
+        :param stop: index after the last frame, defaults to the number of frames in the series
+        :param callback: function called after each integrated frame with the arguments (index, number of frames).
+                         If it returns False, the integration is stopped and the output only contains the integrated
+                         frames.
+        :return: number of integrated frames
+        """
+        configuration = self.configuration
+        img_model = configuration.img_model
+        calibration_model = configuration.calibration_model
+
+        num_frames, get_frames = open_series(img_model, filename)
+        if stop is None or stop > num_frames:
+            stop = num_frames
+        start = max(start, 0)
+        if stop <= start:
+            return 0
+
+        img_model.filename = filename
+        integration_unit = configuration.integration_unit
+
+        frame_queue = queue.Queue(maxsize=self.num_prefetched_chunks)
+        stop_event = threading.Event()
+        reader = threading.Thread(target=_read_frames,
+                                  args=(get_frames, start, stop, self.chunk_size, frame_queue, stop_event))
+        reader.daemon = True
+        reader.start()
+
+        num_integrated = 0
+        try:
+            with h5py.File(output_filename, 'w') as f:
+                f.attrs['source_filename'] = filename
+                f.attrs['first_frame'] = start
+                f.attrs['dioptas_version'] = __version__
+                intensity_dataset = None
+
+                while not stop_event.is_set():
+                    item = frame_queue.get()
+                    if item is None:
+                        break
+                    elif isinstance(item, Exception):
+                        raise item
+                    chunk_start, frames = item
+
+                    for ind, frame in enumerate(frames):
+                        frame_ind = chunk_start - start + ind
+                        self._set_frame(frame)
+                        if intensity_dataset is None:
+                            num_points = configuration.integration_rad_points
+                            if num_points is None:
+                                num_points = calibration_model.calculate_number_of_pattern_points(2)
+
+                        x, y = calibration_model.integrate_1d(mask=configuration._get_integration_mask(),
+                                                              unit=integration_unit, num_points=num_points,
+                                                              remove_empty_bins=False)
+
+                        if intensity_dataset is None:
+                            x_dataset = f.create_dataset('x', data=x)
+                            x_dataset.attrs['unit'] = integration_unit
+                            intensity_dataset = f.create_dataset('intensity', shape=(stop - start, len(y)),
+                                                                 maxshape=(None, len(y)), dtype=np.float64,
+                                                                 chunks=(min(self.chunk_size, stop - start), len(y)))
+                        intensity_dataset[frame_ind] = y
+                        num_integrated += 1
+
+                        if callback is not None and callback(frame_ind, stop - start) is False:
+                            stop_event.set()
+                            break
+
+                if intensity_dataset is not None and num_integrated < intensity_dataset.shape[0]:
+                    intensity_dataset.resize(num_integrated, axis=0)
+        finally:
+            stop_event.set()
+            reader.join()
+
+        logger.info("Integrated {0} frames of {1}.".format(num_integrated, filename))
+        return num_integrated
+
+    def _set_frame(self, frame):
+        """
+        Puts a frame into the image model of the series configuration and applies the transformations, background
+        subtraction, corrections and supersampling, without emitting any signal.
+        """
+        img_model = self.configuration.img_model
+        img_model._img_data = frame
+        img_model._perform_img_transformations()
+        img_model._calculate_img_data()
+        self.configuration.update_mask_dimension()
+
+
+def open_series(img_model, filename):
+    """
+    Opens an image file and returns the number of frames and a function to read a range of frames.
+    :type img_model: ImgModel
+    :return: tuple of the number of frames and a function (start, stop) -> sequence of 2d frames
+    """
+    image_data = img_model.get_image_data(filename)
+    series_get_images = image_data.get('series_get_images')
+    series_get_image = image_data.get('series_get_image')
+    num_frames = image_data.get('series_max', 1)
+
+    if series_get_images is not None:
+        get_frames = series_get_images
+    elif series_get_image is not None:
+        def get_frames(start, stop):
+            return [series_get_image(ind) for ind in range(start, stop)]
+    else:
+        def get_frames(start, stop):
+            return [image_data['img_data']][start:stop]
+    return num_frames, get_frames
+
+
+def _read_frames(get_frames, start, stop, chunk_size, frame_queue, stop_event):
+    """
+    Reads the frames in chunks and puts them together with the index of the first frame into the queue. The end of the
+    series is marked by None. Errors are put into the queue, so that they can be raised in the integrating thread.
+    """
+    try:
+        for chunk_start in range(start, stop, chunk_size):
+            frames = get_frames(chunk_start, min(chunk_start + chunk_size, stop))
+            if not _put(frame_queue, (chunk_start, frames), stop_event):
+                return
+        _put(frame_queue, None, stop_event)
+    except Exception as e:
+        _put(frame_queue, e, stop_event)
+
+
+def _put(frame_queue, item, stop_event):
+    # the queue might be full when the integration is stopped, therefore the stop event is checked regularly
+    while not stop_event.is_set():
+        try:
+            frame_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
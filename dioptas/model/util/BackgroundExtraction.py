@@ -64,3 +64,70 @@ def extract_background(x, y, smooth_width=0.1, iterations=50, cheb_order=50):
                                                       cheb_order)
 
     return np.polynomial.chebyshev.chebval(x_cheb, cheb_parameters)
+
+
+class BackgroundCache(object):
+    """
+    Remembers the last extracted background, so that recalculations of a pattern (e.g. for a new scaling, offset or
+    smoothing) do not repeat the fit when the input is unchanged.
+
+    The clipping and averaging of the bruckner smoothing and the chebyshev fit are invariant to scaling with a
+    positive factor and adding an offset. Therefore a y input which is only a scaled and shifted version of the
+    cached input reuses the cached background with the same scaling and offset.
+    """
+
+    def __init__(self):
+        self._x = None
+        self._y = None
+        self._parameters = None
+        self._background = None
+
+    def extract_background(self, x, y, smooth_width=0.1, iterations=50, cheb_order=50):
+        """
+        Same as extract_background, but the result is reused if the input did not change.
+        """
+        parameters = (smooth_width, iterations, cheb_order)
+        if self._background is not None and parameters == self._parameters and np.array_equal(x, self._x):
+            transformation = get_linear_transformation(self._y, y)
+            if transformation is not None:
+                scaling, offset = transformation
+                return self._background * scaling + offset
+
+        background = extract_background(x, y, smooth_width, iterations, cheb_order)
+        self._x = np.array(x)
+        self._y = np.array(y)
+        self._parameters = parameters
+        self._background = background
+        return np.copy(background)
+
+    def clear(self):
+        self._x = None
+        self._y = None
+        self._parameters = None
+        self._background = None
+
+
+def get_linear_transformation(y_reference, y):
+    """
+    Checks whether y is equal to y_reference * scaling + offset with a positive scaling.
+    :return: (scaling, offset) or None if y can not be described by such a transformation of y_reference
+    """
+    if np.array_equal(y_reference, y):
+        return 1., 0.
+    if len(y) != len(y_reference) or len(y) == 0:
+        return None
+
+    min_ind = np.argmin(y_reference)
+    max_ind = np.argmax(y_reference)
+    reference_range = y_reference[max_ind] - y_reference[min_ind]
+    if reference_range <= 0:
+        return None
+    scaling = (y[max_ind] - y[min_ind]) / reference_range
+    if not scaling > 0:
+        return None
+    offset = y[min_ind] - y_reference[min_ind] * scaling
+
+    tolerance = 1e-12 * (np.max(np.abs(y)) + np.max(np.abs(y_reference)) * scaling)
+    if np.max(np.abs(y_reference * scaling + offset - y)) > tolerance:
+        return None
+    return scaling, offset
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+
+import h5py
+import numpy as np
+
+from ... import __version__
+
+logger = logging.getLogger(__name__)
+
+string_dtype = h5py.special_dtype(vlen=str)
+
+
+class BatchContainerFile(object):
+    """
+    HDF5 file collecting the patterns (and optionally cakes) of a batch integration. Instead of writing one file per
+    image and format, every integrated image is appended as a row to chunked and compressed datasets:
+        - 'x': radial positions of the patterns (attribute 'unit')
+        - 'intensity': patterns (rows x points)
+        - 'intensity_bkg_subtracted': background subtracted patterns, only if a background was given
+        - 'source_filename': filename of the integrated image of each row
+        - 'calibration_index': index into 'calibrations', which holds the distinct calibration headers
+        - 'motors/<name>': motor positions of each row, NaN if the image had no information about the motor
+        - 'cake', 'cake_tth', 'cake_azi': cakes (rows x azimuth x two theta) and their axes, only if cakes are added
+
+    The 'source_filename' dataset is written last and the file is flushed after every row. When an existing file is
+    opened, rows without a source filename (e.g. from an interrupted batch) are discarded, and the
+    integrated_filenames can be used to continue the batch with the remaining images.
+
+    Typical usage::
+
+        with BatchContainerFile('batch.h5') as container:
+            if filename not in container.integrated_filenames:
+                container.add_pattern(filename, x, y, unit='2th_deg')
+    """
+
+    def __init__(self, filename, compression='gzip', chunk_rows=16):
+        """
+        :param filename: path of the HDF5 file, it is created if it does not exist and continued otherwise
+        :param compression: compression filter used for the intensity and cake datasets
+        :param chunk_rows: number of pattern rows in one chunk
+        """
+        self.filename = filename
+        self.compression = compression
+        self.chunk_rows = chunk_rows
+        self.integrated_filenames = set()
+        self._file = None
+        self._calibrations = []
+
+    def open(self):
+        self._file = h5py.File(self.filename, 'a')
+        f = self._file
+        if 'source_filename' not in f:
+            f.attrs['dioptas_version'] = __version__
+            f.create_dataset('source_filename', shape=(0,), maxshape=(None,), dtype=string_dtype,
+                             chunks=(self.chunk_rows,))
+            f.create_dataset('calibration_index', shape=(0,), maxshape=(None,), dtype=np.int32,
+                             chunks=(self.chunk_rows,), fillvalue=-1)
+            f.create_dataset('calibrations', shape=(0,), maxshape=(None,), dtype=string_dtype, chunks=(16,))
+            f.create_group('motors')
+
+        num_rows = len(self)
+        for dataset in self._row_datasets():
+            if dataset.shape[0] != num_rows:
+                dataset.resize(num_rows, axis=0)
+        self.integrated_filenames = set(_to_str(filename) for filename in f['source_filename'][()])
+        self._calibrations = [_to_str(calibration) for calibration in f['calibrations'][()]]
+        if num_rows > 0:
+            logger.info("Continuing {0} with {1} integrated images.".format(self.filename, num_rows))
+        return self
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self._file['source_filename'].shape[0]
+
+    def add_pattern(self, source_filename, x, y, unit='', y_bkg_subtracted=None, x_bkg_subtracted=None,
+                    motors_info=None, calibration_header='', cake=None):
+        """
+        Appends the integration result of one image.
+        :param source_filename: filename of the integrated image
+        :param x: radial positions, all rows share the radial positions of the first row, patterns with different
+                  positions are linearly interpolated (NaN outside of their range)
+        :param y: intensities
+        :param unit: unit of x, has to be the same for all rows
+        :param y_bkg_subtracted: optional background subtracted intensities
+        :param x_bkg_subtracted: radial positions of y_bkg_subtracted, defaults to x
+        :param motors_info: optional dictionary of motor names and positions
+        :param calibration_header: calibration information, e.g. CalibrationModel.create_file_header()
+        :param cake: optional tuple of (cake_img, cake_tth, cake_azi)
+        """
+        f = self._file
+        ind = len(self)
+
+        if 'x' not in f:
+            x_dataset = f.create_dataset('x', data=np.asarray(x, dtype=np.float64))
+            x_dataset.attrs['unit'] = unit
+        elif _to_str(f['x'].attrs.get('unit', '')) != unit:
+            raise ValueError("{0} contains patterns in {1}, can not add a pattern in {2}.".format(
+                self.filename, _to_str(f['x'].attrs.get('unit', '')), unit))
+        container_x = f['x'][()]
+
+        self._set_row('intensity', ind, _interpolate(container_x, x, y))
+        if y_bkg_subtracted is not None:
+            if x_bkg_subtracted is None:
+                x_bkg_subtracted = x
+            self._set_row('intensity_bkg_subtracted', ind, _interpolate(container_x, x_bkg_subtracted,
+                                                                        y_bkg_subtracted))
+
+        for name, position in (motors_info or {}).items():
+            self._set_row('motors/' + str(name), ind, np.float64(position))
+
+        if cake is not None:
+            cake_img, cake_tth, cake_azi = cake
+            if 'cake_tth' not in f:
+                f.create_dataset('cake_tth', data=np.asarray(cake_tth, dtype=np.float64))
+                f.create_dataset('cake_azi', data=np.asarray(cake_azi, dtype=np.float64))
+            self._set_row('cake', ind, np.asarray(cake_img, dtype=np.float32), chunk_rows=1)
+
+        if calibration_header not in self._calibrations:
+            calibrations = f['calibrations']
+            calibrations.resize(len(self._calibrations) + 1, axis=0)
+            calibrations[-1] = calibration_header
+            self._calibrations.append(calibration_header)
+        self._set_row('calibration_index', ind, self._calibrations.index(calibration_header), fill_value=-1)
+
+        # datasets without a value for this row (e.g. motors missing in this image) are filled with the fill value
+        for dataset in self._row_datasets():
+            if dataset.shape[0] <= ind:
+                dataset.resize(ind + 1, axis=0)
+
+        # the row is only complete after the source filename is written
+        source_filename = source_filename_key(source_filename)
+        source_filename_dataset = f['source_filename']
+        source_filename_dataset.resize(ind + 1, axis=0)
+        source_filename_dataset[ind] = source_filename
+        f.flush()
+        self.integrated_filenames.add(source_filename)
+
+    def _set_row(self, name, ind, data, fill_value=np.nan, chunk_rows=None):
+        f = self._file
+        data = np.asarray(data)
+        if name not in f:
+            if chunk_rows is None:
+                chunk_rows = self.chunk_rows
+            compression = self.compression if data.ndim > 0 else None
+            f.create_dataset(name, shape=(ind,) + data.shape, maxshape=(None,) + data.shape, dtype=data.dtype,
+                             chunks=(chunk_rows,) + data.shape, compression=compression, fillvalue=fill_value)
+        dataset = f[name]
+        if dataset.shape[0] <= ind:
+            dataset.resize(ind + 1, axis=0)
+        dataset[ind] = data
+
+    def _row_datasets(self):
+        f = self._file
+        datasets = [f[name] for name in ('intensity', 'intensity_bkg_subtracted', 'calibration_index', 'cake')
+                    if name in f]
+        datasets.extend(f['motors'].values())
+        return datasets
+
+
+def source_filename_key(filename):
+    """
+    :return: the normalized filename stored in a BatchContainerFile
+    """
+    return os.path.abspath(str(filename))
+
+
+def _interpolate(container_x, x, y):
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) == len(container_x) and np.array_equal(x, container_x):
+        return y
+    return np.interp(container_x, x, y, left=np.nan, right=np.nan)
+
+
+def _to_str(value):
+    if isinstance(value, bytes):
+        return value.decode()
+    return str(value)
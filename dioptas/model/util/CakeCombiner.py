@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import zlib
+
+import numpy as np
+from scipy import sparse
+
+
+class CakeCombiner(object):
+    """
+    Combines cakes with different two theta and azimuth axes (e.g. from several detector positions) into one cake on
+    a common grid covering all of them.
+
+    Every cake is bilinearly interpolated onto the grid. The interpolation weights along both axes only depend on the
+    cake axes and the grid, they are stored as sparse matrices which are calculated once and reused until the axes
+    change (e.g. by a new calibration or different binning). Where cakes overlap, the result is the average weighted
+    by the number of pixels in each cake bin, bins without any pixels do not contribute.
+    """
+
+    def __init__(self, num_tth=2048, num_azi=2048):
+        """
+        :param num_tth: number of two theta points of the combined cake
+        :param num_azi: number of azimuth points of the combined cake
+        """
+        self.num_tth = num_tth
+        self.num_azi = num_azi
+
+        self.tth = None
+        self.azi = None
+        self._interpolation_maps = {}
+
+    def combine(self, cakes):
+        """
+        Combines the given cakes. The grid of the result is available afterwards in the tth and azi attributes.
+        :param cakes: list of (cake_img, cake_tth, cake_azi, weights) tuples. weights has the shape of cake_img and
+                      gives the number of pixels in each bin, if None all bins with non-zero intensity get a weight of
+                      one.
+        :return: combined cake with the shape (num_azi, num_tth)
+        """
+        self.tth = np.linspace(np.min([np.min(cake[1]) for cake in cakes]),
+                               np.max([np.max(cake[1]) for cake in cakes]), self.num_tth)
+        self.azi = np.linspace(np.min([np.min(cake[2]) for cake in cakes]),
+                               np.max([np.max(cake[2]) for cake in cakes]), self.num_azi)
+
+        summed_intensity = np.zeros((self.num_azi, self.num_tth))
+        summed_weights = np.zeros((self.num_azi, self.num_tth))
+        used_keys = set()
+        for cake_img, cake_tth, cake_azi, weights in cakes:
+            if weights is None:
+                weights = (cake_img != 0).astype(np.float64)
+            weights = np.where(np.isnan(cake_img), 0, weights)
+
+            tth_key = self._get_map_key(cake_tth, self.tth)
+            azi_key = self._get_map_key(cake_azi, self.azi)
+            used_keys.update((tth_key, azi_key))
+            tth_map = self._get_interpolation_map(tth_key, cake_tth, self.tth)
+            azi_map = self._get_interpolation_map(azi_key, cake_azi, self.azi)
+
+            summed_intensity += interpolate(np.nan_to_num(cake_img) * weights, tth_map, azi_map)
+            summed_weights += interpolate(weights, tth_map, azi_map)
+
+        # maps of axes which are not used anymore are discarded
+        for key in list(self._interpolation_maps.keys()):
+            if key not in used_keys:
+                del self._interpolation_maps[key]
+
+        combined_intensity = np.zeros_like(summed_intensity)
+        np.divide(summed_intensity, summed_weights, out=combined_intensity, where=summed_weights > 0)
+        return combined_intensity
+
+    @staticmethod
+    def _get_map_key(axis, grid):
+        axis = np.ascontiguousarray(axis, dtype=np.float64)
+        return len(axis), zlib.crc32(axis.tobytes()), len(grid), grid[0], grid[-1]
+
+    def _get_interpolation_map(self, key, axis, grid):
+        if key not in self._interpolation_maps:
+            self._interpolation_maps[key] = calculate_interpolation_map(axis, grid)
+        return self._interpolation_maps[key]
+
+
+def calculate_interpolation_map(axis, grid):
+    """
+    Calculates the sparse matrix for a linear interpolation from values given at the (ascending) axis positions onto
+    the grid positions. Grid positions outside of the axis get zero weights.
+    :return: sparse matrix with the shape (len(grid), len(axis)), each row has at most two non-zero weights
+    """
+    axis = np.asarray(axis, dtype=np.float64)
+    grid = np.asarray(grid, dtype=np.float64)
+    if len(axis) < 2:
+        weights = np.isclose(grid, axis[0]).astype(np.float64)
+        return sparse.csr_matrix(weights[:, None])
+
+    lower_ind = np.clip(np.searchsorted(axis, grid, side='right') - 1, 0, len(axis) - 2)
+    upper_ind = lower_ind + 1
+    upper_weights = np.clip((grid - axis[lower_ind]) / (axis[upper_ind] - axis[lower_ind]), 0, 1)
+    inside = ((grid >= axis[0]) & (grid <= axis[-1])).astype(np.float64)
+
+    rows = np.arange(len(grid))
+    return sparse.csr_matrix((np.concatenate(((1 - upper_weights) * inside, upper_weights * inside)),
+                              (np.concatenate((rows, rows)), np.concatenate((lower_ind, upper_ind)))),
+                             shape=(len(grid), len(axis)))
+
+
+def interpolate(data, tth_map, azi_map):
+    """
+    Bilinearly interpolates 2d data (azimuth, two theta) with precalculated interpolation maps, see
+    calculate_interpolation_map.
+    :return: interpolated data with the shape (len(azimuth grid), len(two theta grid))
+    """
+    return azi_map.dot(tth_map.dot(data.T).T)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tiled L.A.Cosmic cosmic ray detection. The image is split into tiles which are processed independently (optionally
+in several processes). Every tile is extended by an overlap on all sides, so that the filters of all iterations see
+the same neighbourhood as for the full image and the resulting mask is identical to processing the image at once.
+"""
+
+import multiprocessing
+
+import numpy as np
+
+from .cosmics import cosmicsimage
+
+# number of pixels the result of one L.A.Cosmic iteration depends on in every direction: the detection reaches 6
+# pixels (5x5 median of the signal to noise map of the laplacian and two 3x3 growing steps) and the cleaning with
+# the 5x5 median another 2 pixels
+iteration_range = 8
+
+
+def find_cosmics(img_data, sigclip=3.0, objlim=3.0, iterations=2, dtype=np.float64, tile_size=512,
+                 num_workers=None, start_method=None):
+    """
+    Detects cosmic rays in an image with the L.A.Cosmic algorithm, the detected pixels are cleaned after every
+    iteration.
+    :param img_data: 2d image
+    :param sigclip: laplacian-to-noise limit for cosmic ray detection
+    :param objlim: minimum contrast between laplacian image and fine structure image
+    :param iterations: number of L.A.Cosmic iterations
+    :param dtype: dtype used for the calculation, np.float32 needs less memory but can give slightly different masks
+    :param tile_size: size of the tiles the image is split into
+    :param num_workers: number of worker processes, defaults to the number of CPUs. With 1 worker all tiles are
+                        processed in the current process.
+    :param start_method: multiprocessing start method of the worker processes, None for the default of the
+                         platform. Processes with several threads (e.g. the GUI) should not be forked, see
+                         get_thread_safe_start_method.
+    :return: boolean mask of the detected cosmic ray pixels
+    """
+    return next(iterate_cosmic_masks([img_data], sigclip, objlim, iterations, dtype, tile_size, num_workers,
+                                     start_method))
+
+
+def iterate_cosmic_masks(frames, sigclip=3.0, objlim=3.0, iterations=2, dtype=np.float64, tile_size=512,
+                         num_workers=None, start_method=None):
+    """
+    Detects cosmic rays in a series of frames, the worker processes are reused for all frames. See find_cosmics for
+    the parameters.
+    :param frames: iterable of 2d images, e.g. a generator loading the frames of a series one after another
+    :return: generator yielding the boolean cosmic ray mask of every frame
+    """
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    parameters = {'sigclip': sigclip, 'objlim': objlim, 'iterations': iterations}
+
+    pool = None
+    try:
+        for img_data in frames:
+            img_data = np.asarray(img_data, dtype=dtype)
+            tiles = get_tiles(img_data.shape, tile_size, iterations * iteration_range)
+            # the background level is only used for cleaning huge cosmics, it has to be the one of the whole image
+            background_level = np.median(img_data) if len(tiles) > 1 else None
+            tasks = [(img_data[padded_region], crop, parameters, background_level)
+                     for _, padded_region, crop in tiles]
+
+            if num_workers > 1 and len(tasks) > 1:
+                if pool is None:
+                    pool = multiprocessing.get_context(start_method).Pool(min(num_workers, len(tasks)))
+                tile_masks = pool.imap(_find_cosmics_in_tile, tasks)
+            else:
+                tile_masks = map(_find_cosmics_in_tile, tasks)
+
+            mask = np.zeros(img_data.shape, dtype=bool)
+            for (region, _, _), tile_mask in zip(tiles, tile_masks):
+                mask[region] = tile_mask
+            yield mask
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def get_thread_safe_start_method():
+    """
+    Forking a process with several threads can deadlock the child processes (e.g. when another thread holds a lock
+    while forking), therefore worker processes started from the GUI are started by a fork server or spawned.
+    :return: name of the multiprocessing start method
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return 'forkserver'
+    return 'spawn'
+
+
+def get_tiles(shape, tile_size, overlap):
+    """
+    Splits an image into tiles.
+    :param shape: shape of the image
+    :param tile_size: maximum size of the tiles
+    :param overlap: number of pixels the tiles are extended by on every side (limited by the image borders)
+    :return: list of (region, padded_region, crop) tuples of slices, region is the part of the image covered by the
+             tile, padded_region the part including the overlap and crop the region relative to the padded region
+    """
+    tiles = []
+    for row_start in range(0, shape[0], tile_size):
+        for col_start in range(0, shape[1], tile_size):
+            region = (slice(row_start, min(row_start + tile_size, shape[0])),
+                      slice(col_start, min(col_start + tile_size, shape[1])))
+            padded_region = tuple(slice(max(s.start - overlap, 0), min(s.stop + overlap, size))
+                                  for s, size in zip(region, shape))
+            crop = tuple(slice(s.start - p.start, s.stop - p.start) for s, p in zip(region, padded_region))
+            tiles.append((region, padded_region, crop))
+    return tiles
+
+
+def _find_cosmics_in_tile(task):
+    tile_data, crop, parameters, background_level = task
+    image = cosmicsimage(tile_data, sigclip=parameters['sigclip'], objlim=parameters['objlim'], verbose=False)
+    image.backgroundlevel = background_level
+    for _ in range(parameters['iterations']):
+        image.lacosmiciteration()
+        image.clean()
+    return image.mask[crop]
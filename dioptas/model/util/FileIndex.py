@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+number_pattern = re.compile(r'\d+')
+
+
+class DirectoryFileIndex(object):
+    """
+    Index of the files in a directory. The directory is listed once, later changes are applied incrementally with
+    add and remove (e.g. with the changes reported by a NewFileInDirectoryWatcher). The index itself does not check
+    the file system again, files which have not been reported yet have to be looked up and added by the caller.
+
+    For iterating by number, the files are kept in sorted lists of (number, number of digits, filename) for every
+    combination of the text before and after a number in the filename. These lists are only created when they are
+    requested for the first time.
+
+    The creation times of the files, which are needed for iterating by time, are only read when they are requested
+    for the first time and are kept in a list sorted by creation time. Optionally they are stored in a cache file,
+    so that the creation times of known files do not have to be read again when the directory is opened later. After
+    incremental changes the cache file is only marked as outdated, it is written by calling save_cache.
+
+    All public methods can be called from different threads.
+    """
+
+    def __init__(self, directory, cache_filename=None):
+        """
+        :param directory: path of the indexed directory
+        :param cache_filename: optional path of a json file used to store the creation times of the files
+        """
+        self.directory = directory
+        self.cache_filename = cache_filename
+
+        self._lock = threading.RLock()
+        self._filenames = set()
+        self._number_index = None  # dict of (text before, text after) -> sorted list of (number, digits, filename)
+        self._ctimes = {}
+        self._time_ordered = []  # sorted list of (ctime, filename)
+        self._time_ordered_valid = False
+        self._cache_outdated = False
+
+        self._load_cache()
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError:
+            filenames = []
+        for filename in filenames:
+            self._add(filename)
+        # forget cached creation times of files which do not exist anymore
+        self._ctimes = {filename: ctime for filename, ctime in self._ctimes.items() if filename in self._filenames}
+
+    def add(self, filenames):
+        """
+        Adds files to the index, files which are already in the index are ignored.
+        :param filenames: list of filenames without directory
+        :return: list of the filenames which were added
+        """
+        with self._lock:
+            added = [filename for filename in filenames if filename not in self._filenames]
+            for filename in added:
+                self._add(filename)
+            self._cache_outdated = self._cache_outdated or (self._time_ordered_valid and len(added) > 0)
+            return added
+
+    def remove(self, filenames):
+        """
+        Removes files from the index, files which are not in the index are ignored.
+        :param filenames: list of filenames without directory
+        :return: list of the filenames which were removed
+        """
+        with self._lock:
+            removed = [filename for filename in filenames if filename in self._filenames]
+            for filename in removed:
+                self._remove(filename)
+            self._cache_outdated = self._cache_outdated or (self._time_ordered_valid and len(removed) > 0)
+            return removed
+
+    def update(self):
+        """
+        Lists the whole directory and applies the differences to the index. Only needed if the changes of the
+        directory are not reported by other means.
+        :return: tuple with the sorted lists of added and removed filenames
+        """
+        try:
+            current_filenames = set(os.listdir(self.directory))
+        except OSError:
+            current_filenames = set()
+        with self._lock:
+            removed = self.remove(sorted(self._filenames - current_filenames))
+            added = self.add(sorted(current_filenames - self._filenames))
+        return added, removed
+
+    def exists(self, filename):
+        """
+        Checks whether a file is in the index.
+        :param filename: name of the file without directory
+        """
+        with self._lock:
+            return filename in self._filenames
+
+    def get_numbered_filename(self, prefix, suffix, number, num_digits):
+        """
+        Gets the file named prefix + number + suffix. A file with the number zero padded to num_digits is preferred
+        over a file with the number without leading zeros.
+        :param prefix: text before the number
+        :param suffix: text after the number
+        :param number: number in the filename
+        :param num_digits: number of digits of the zero padded number
+        :return: filename without directory or None if there is no such file
+        """
+        if number < 0:
+            return None
+        with self._lock:
+            self._update_number_index()
+            entries = self._number_index.get((prefix, suffix))
+            if entries is None:
+                return None
+            for digits in (max(num_digits, len(str(number))), len(str(number))):
+                ind = bisect.bisect_left(entries, (number, digits))
+                if ind < len(entries) and entries[ind][:2] == (number, digits):
+                    return entries[ind][2]
+            return None
+
+    def get_time_ordered_filename(self, filename, step, file_filter=None):
+        """
+        Gets the filename which is step files after (or before for negative steps) the given file, when ordered by
+        creation time.
+        :param filename: name of the current file without directory
+        :param step: number of files to go forward (positive) or backward (negative)
+        :param file_filter: optional function returning whether a filename should be counted
+        :return: filename without directory or None if there is no such file
+        """
+        with self._lock:
+            self._update_time_order()
+            ctime = self._ctimes.get(filename)
+            if ctime is None:
+                return None
+            ind = bisect.bisect_left(self._time_ordered, (ctime, filename))
+            if ind >= len(self._time_ordered) or self._time_ordered[ind] != (ctime, filename):
+                return None
+
+            direction = 1 if step > 0 else -1
+            remaining = abs(step)
+            while remaining > 0:
+                ind += direction
+                if ind < 0 or ind >= len(self._time_ordered):
+                    return None
+                if file_filter is None or file_filter(self._time_ordered[ind][1]):
+                    remaining -= 1
+            return self._time_ordered[ind][1]
+
+    def get_time_ordered_filenames(self, file_filter=None):
+        """
+        :return: list of all filenames (without directory) ordered by creation time
+        """
+        with self._lock:
+            self._update_time_order()
+            return [filename for _, filename in self._time_ordered if file_filter is None or file_filter(filename)]
+
+    def save_cache(self):
+        """
+        Writes the creation times to the cache file, if they changed since the cache file was written last.
+        """
+        with self._lock:
+            if self._cache_outdated:
+                self._save_cache()
+
+    @property
+    def cache_outdated(self):
+        return self._cache_outdated
+
+    def __len__(self):
+        return len(self._filenames)
+
+    def _add(self, filename):
+        self._filenames.add(filename)
+        if self._number_index is not None:
+            for key, entry in get_number_entries(filename):
+                bisect.insort(self._number_index.setdefault(key, []), entry)
+        if self._time_ordered_valid:
+            ctime = self._get_ctime(filename)
+            if ctime is not None:
+                bisect.insort(self._time_ordered, (ctime, filename))
+
+    def _remove(self, filename):
+        self._filenames.discard(filename)
+        if self._number_index is not None:
+            for key, entry in get_number_entries(filename):
+                entries = self._number_index[key]
+                del entries[bisect.bisect_left(entries, entry)]
+                if not entries:
+                    del self._number_index[key]
+        ctime = self._ctimes.pop(filename, None)
+        if self._time_ordered_valid and ctime is not None:
+            ind = bisect.bisect_left(self._time_ordered, (ctime, filename))
+            if ind < len(self._time_ordered) and self._time_ordered[ind] == (ctime, filename):
+                del self._time_ordered[ind]
+
+    def _update_number_index(self):
+        if self._number_index is not None:
+            return
+        number_index = {}
+        for filename in self._filenames:
+            for key, entry in get_number_entries(filename):
+                number_index.setdefault(key, []).append(entry)
+        for entries in number_index.values():
+            entries.sort()
+        self._number_index = number_index
+
+    def _get_ctime(self, filename):
+        if filename not in self._ctimes:
+            try:
+                self._ctimes[filename] = os.path.getctime(os.path.join(self.directory, filename))
+            except OSError:
+                return None
+        return self._ctimes[filename]
+
+    def _update_time_order(self):
+        if self._time_ordered_valid:
+            return
+        time_ordered = []
+        for filename in self._filenames:
+            ctime = self._get_ctime(filename)
+            if ctime is not None:
+                time_ordered.append((ctime, filename))
+        time_ordered.sort()
+        self._time_ordered = time_ordered
+        self._time_ordered_valid = True
+        self._save_cache()
+
+    def _load_cache(self):
+        if self.cache_filename is None or not os.path.exists(self.cache_filename):
+            return
+        try:
+            with open(self.cache_filename) as f:
+                cache = json.load(f)
+            if cache['directory'] == self.directory:
+                self._ctimes = {str(filename): float(ctime) for filename, ctime in cache['ctimes'].items()}
+        except (IOError, OSError, ValueError, KeyError, AttributeError) as e:
+            logger.warning("Could not read the file index cache {0}: {1}".format(self.cache_filename, e))
+
+    def _save_cache(self):
+        self._cache_outdated = False
+        if self.cache_filename is None:
+            return
+        try:
+            cache_directory = os.path.dirname(self.cache_filename)
+            if cache_directory and not os.path.isdir(cache_directory):
+                os.makedirs(cache_directory)
+            with open(self.cache_filename, 'w') as f:
+                json.dump({'directory': self.directory, 'ctimes': self._ctimes}, f)
+        except (IOError, OSError) as e:
+            logger.warning("Could not write the file index cache {0}: {1}".format(self.cache_filename, e))
+
+
+def get_number_entries(filename):
+    """
+    Gets the entries of a filename for the number index of a DirectoryFileIndex, one for every number in the filename.
+    :param filename: filename without directory
+    :return: list of ((text before, text after), (number, number of digits, filename)) tuples
+    """
+    entries = []
+    for match in number_pattern.finditer(filename):
+        left_ind, right_ind = match.span()
+        entries.append(((filename[:left_ind], filename[right_ind:]),
+                        (int(filename[left_ind:right_ind]), right_ind - left_ind, filename)))
+    return entries
@@ -19,69 +19,103 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import hashlib
+import logging
 import os
 import re
+import threading
 import time
 
 import numpy as np
 from qtpy import QtCore
 from colorsys import hsv_to_rgb
 
+from .FileIndex import DirectoryFileIndex
+from .NewFileWatcher import NewFileInDirectoryWatcher
+
+logger = logging.getLogger(__name__)
+
 
 class FileNameIterator(QtCore.QObject):
-    # TODO create an File Index and then just get the next files according to this.
-    # Otherwise searching a network is always to slow...
+    """
+    Iterates through files either by the numbers in the filename or by the creation time of the files. The files of
+    the current directory are kept in a DirectoryFileIndex, which is updated with the changes reported by a
+    NewFileInDirectoryWatcher, therefore no directory listing or file system lookup is needed for most iteration
+    steps. Files which are not in the index (e.g. written by another computer to a network file system, where the
+    watcher does not get notified) are looked up in the file system and added to the index.
+    """
+    cache_save_delay = 5000  # ms after the last change of the directory until the file index cache is written
+    # if set, the creation times of the files in the file indices are stored in this directory (e.g. set to a folder
+    # in the settings directory by the MainController)
+    index_cache_directory = None
 
-    def __init__(self, filename=None):
+    def __init__(self, filename=None, directory_watcher=None):
+        """
+        :param filename: path of the current file
+        :param directory_watcher: NewFileInDirectoryWatcher reporting the changes of the directory, if None a watcher
+                                  is created once a filename is set
+        """
         super(FileNameIterator, self).__init__()
         self.acceptable_file_endings = []
-        self.directory_watcher = QtCore.QFileSystemWatcher()
-        self.directory_watcher.directoryChanged.connect(self.add_new_files_to_list)
+        self.directory_watcher = None
+        if directory_watcher is not None:
+            self._set_directory_watcher(directory_watcher)
         self.create_timed_file_list = False
 
+        self._file_index = None
+        self._file_index_lock = threading.Lock()
+        self._cache_timer = QtCore.QTimer()
+        self._cache_timer.setSingleShot(True)
+        self._cache_timer.setInterval(self.cache_save_delay)
+        self._cache_timer.timeout.connect(self.save_index_cache)
+
         if filename is None:
             self.complete_path = None
             self.directory = None
             self.filename = None
-            self.file_list = []
-            self.ordered_file_list = []
-            self.filename_list = []
         else:
             self.complete_path = os.path.abspath(filename)
             self.directory, self.filename = os.path.split(self.complete_path)
             self.acceptable_file_endings.append(self.filename.split('.')[-1])
 
-    def _get_files_list(self):
-        t1 = time.time()
-        filename_list = os.listdir(self.directory)
-        files = []
-        for file in filename_list:
-            if self.is_correct_file_type(file):
-                files.append(file)
-        paths = [os.path.join(self.directory, file) for file in files]
-        file_list = [(os.path.getctime(path), path) for path in paths]
-        self.filename_list = paths
-        print('Time needed  for getting files: {0}s.'.format(time.time() - t1))
-        return file_list
-
     def is_correct_file_type(self, filename):
         for ending in self.acceptable_file_endings:
             if filename.endswith(ending):
                 return True
         return False
 
-    def _order_file_list(self):
-        t1 = time.time()
-        self.ordered_file_list = self.file_list
-        self.ordered_file_list.sort(key=lambda x: x[0])
+    def _set_directory_watcher(self, directory_watcher):
+        self.directory_watcher = directory_watcher
+        self.directory_watcher.files_changed.connect(self._directory_files_changed)
+        self.directory_watcher.track_changes = True
 
-        print('Time needed  for ordering files: {0}s.'.format(time.time() - t1))
+    def _get_file_index(self):
+        """
+        :return: file index of the current directory, which is created if necessary
+        :rtype: DirectoryFileIndex
+        """
+        with self._file_index_lock:
+            if self._file_index is None or self._file_index.directory != self.directory:
+                if self._file_index is not None:
+                    self._file_index.save_cache()
+                cache_filename = None
+                if self.index_cache_directory is not None:
+                    cache_filename = os.path.join(self.index_cache_directory,
+                                                  hashlib.md5(self.directory.encode('utf-8')).hexdigest() + '.json')
+                self._file_index = DirectoryFileIndex(self.directory, cache_filename)
+            return self._file_index
 
     def update_file_list(self):
-        self.file_list = self._get_files_list()
-        self._order_file_list()
+        """
+        Creates the file index of the current directory with the creation times of all files.
+        """
+        t1 = time.time()
+        self.save_index_cache()
+        self._file_index = None
+        self._get_file_index().get_time_ordered_filenames()
+        logger.info('Time needed for indexing files: {0}s.'.format(time.time() - t1))
 
-    def _iterate_file_number(self, path, step, pos=None):
+    def _find_file_number(self, path, step, pos=None):
         directory, file_str = os.path.split(path)
         pattern = re.compile(r'\d+')
 
@@ -93,6 +127,14 @@ class FileNameIterator(QtCore.QObject):
                 left_ind = number_span[0]
                 right_ind = number_span[1]
                 number = int(file_str[left_ind:right_ind]) + step
+                file_index = None
+                if self.directory is not None and directory == self.directory:
+                    file_index = self._get_file_index()
+                    new_file_str = file_index.get_numbered_filename(
+                        file_str[:left_ind], file_str[right_ind:], number, right_ind - left_ind)
+                    if new_file_str is not None:
+                        return os.path.join(directory, new_file_str)
+
                 new_file_str = "{left_str}{number:0{len}}{right_str}".format(
                     left_str=file_str[:left_ind],
                     number=number,
@@ -104,17 +146,26 @@ class FileNameIterator(QtCore.QObject):
                     number=number,
                     right_str=file_str[right_ind:]
                 )
-                new_complete_path = os.path.join(directory, new_file_str)
-                if os.path.exists(new_complete_path):
-                    self.complete_path = new_complete_path
-                    return new_complete_path
-                new_complete_path = os.path.join(directory, new_file_str_no_leading_zeros)
-                if os.path.exists(new_complete_path):
-                    self.complete_path = new_complete_path
-                    return new_complete_path
+                for new_file_str in sorted({new_file_str, new_file_str_no_leading_zeros}, key=len, reverse=True):
+                    new_complete_path = os.path.join(directory, new_file_str)
+                    if os.path.exists(new_complete_path):
+                        if file_index is not None:
+                            file_index.add([new_file_str])
+                        return new_complete_path
         return None
 
-    def _iterate_folder_number(self, path, step, mec_mode=False):
+    def _find_file_time(self, path, step):
+        directory, file_str = os.path.split(path)
+        if directory != self.directory:
+            return None
+        file_index = self._get_file_index()
+        file_index.add([file_str])  # the current file might not have been reported by the watcher yet
+        new_file_str = file_index.get_time_ordered_filename(file_str, step, self.is_correct_file_type)
+        if new_file_str is None:
+            return None
+        return os.path.join(directory, new_file_str)
+
+    def _find_folder_number(self, path, step, mec_mode=False):
         directory_str, file_str = os.path.split(path)
         pattern = re.compile(r'\d+')
 
@@ -152,9 +203,19 @@ class FileNameIterator(QtCore.QObject):
             else:
                 new_complete_path = os.path.join(new_directory_str, file_str)
             if os.path.exists(new_complete_path):
-                self.complete_path = new_complete_path
                 return new_complete_path
 
+    def _find_file(self, path, step, mode='number', pos=None):
+        if mode == 'time':
+            return self._find_file_time(path, step)
+        elif mode == 'number':
+            return self._find_file_number(path, step, pos)
+
+    def _set_complete_path(self, new_path):
+        if new_path is not None:
+            self.complete_path = new_path
+        return new_path
+
     def get_next_filename(self, step=1, filename=None, mode='number', pos=None):
         if filename is not None:
             self.complete_path = filename
@@ -162,17 +223,7 @@ class FileNameIterator(QtCore.QObject):
         if self.complete_path is None:
             return None
 
-        if mode == 'time':
-            time_stat = os.path.getctime(self.complete_path)
-            cur_ind = self.ordered_file_list.index((time_stat, self.complete_path))
-            # cur_ind = self.ordered_file_list.index(self.complete_path)
-            try:
-                self.complete_path = self.ordered_file_list[cur_ind + step][1]
-                return self.complete_path
-            except IndexError:
-                return None
-        elif mode == 'number':
-            return self._iterate_file_number(self.complete_path, step, pos)
+        return self._set_complete_path(self._find_file(self.complete_path, step, mode, pos))
 
     def get_previous_filename(self, step=1, filename=None, mode='number', pos=None):
         """
@@ -194,18 +245,7 @@ class FileNameIterator(QtCore.QObject):
         if self.complete_path is None:
             return None
 
-        if mode == 'time':
-            time_stat = os.path.getctime(self.complete_path)
-            cur_ind = self.ordered_file_list.index((time_stat, self.complete_path))
-            # cur_ind = self.ordered_file_list.index(self.complete_path)
-            if cur_ind > 0:
-                try:
-                    self.complete_path = self.ordered_file_list[cur_ind - step][1]
-                    return self.complete_path
-                except IndexError:
-                    return None
-        elif mode == 'number':
-            return self._iterate_file_number(self.complete_path, -step, pos)
+        return self._set_complete_path(self._find_file(self.complete_path, -step, mode, pos))
 
     def get_next_folder(self, filename=None, mec_mode=False):
         if filename is not None:
@@ -213,7 +253,7 @@ class FileNameIterator(QtCore.QObject):
 
         if self.complete_path is None:
             return None
-        return self._iterate_folder_number(self.complete_path, 1, mec_mode)
+        return self._set_complete_path(self._find_folder_number(self.complete_path, 1, mec_mode))
 
     def get_previous_folder(self, filename=None, mec_mode=False):
         if filename is not None:
@@ -221,7 +261,42 @@ class FileNameIterator(QtCore.QObject):
 
         if self.complete_path is None:
             return None
-        return self._iterate_folder_number(self.complete_path, -1, mec_mode)
+        return self._set_complete_path(self._find_folder_number(self.complete_path, -1, mec_mode))
+
+    def get_following_filenames(self, path, num, step=1, mode='number', pos=None):
+        """
+        Gets the filenames following a file without changing the current file of the iterator. Can be called from
+        another thread than the one using the iterator.
+        :param path: path of the file to start from
+        :param num: maximum number of filenames
+        :param step: step between the files, negative for previous files
+        :param mode: 'number' or 'time', see get_next_filename
+        :param pos: position of the number in the filename, see get_next_filename
+        :return: list of paths
+        """
+        filenames = []
+        while path is not None and len(filenames) < num:
+            path = self._find_file(path, step, mode, pos)
+            if path is not None:
+                filenames.append(path)
+        return filenames
+
+    def get_following_folders(self, path, num, step=1, mec_mode=False):
+        """
+        Gets the files with the same name in the folders following the folder of a file, without changing the current
+        file of the iterator. Can be called from another thread than the one using the iterator.
+        :param path: path of the file to start from
+        :param num: maximum number of filenames
+        :param step: 1 for the next folders, -1 for the previous folders
+        :param mec_mode: see get_next_folder
+        :return: list of paths
+        """
+        filenames = []
+        while path is not None and len(filenames) < num:
+            path = self._find_folder_number(path, step, mec_mode)
+            if path is not None:
+                filenames.append(path)
+        return filenames
 
     def update_filename(self, new_filename):
         self.complete_path = os.path.abspath(new_filename)
@@ -231,38 +306,62 @@ class FileNameIterator(QtCore.QObject):
         except AttributeError:
             pass
         if self.directory != new_directory:
-            if self.directory is not None and self.directory != '':
-                self.directory_watcher.removePath(self.directory)
-            self.directory_watcher.addPath(new_directory)
+            if self.directory_watcher is None:
+                self._set_directory_watcher(NewFileInDirectoryWatcher(new_directory))
+            self.directory_watcher.path = new_directory
             self.directory = new_directory
+            self._file_index = None
             if self.create_timed_file_list:
                 self.update_file_list()
 
-        if (self.create_timed_file_list and self.ordered_file_list == []):
+        if self.create_timed_file_list and self._file_index is None:
             self.update_file_list()
 
     def add_new_files_to_list(self):
         """
-        checks for new files in folder and adds them to the sorted_file_list
-        :return:
+        Lists the current directory and applies the changes to the file index. Normally not needed, since the changes
+        are reported by the directory watcher.
         """
-        cur_filename_list = os.listdir(self.directory)
-        cur_filename_list = [os.path.join(self.directory, filename) for filename in cur_filename_list if
-                             self.is_correct_file_type(filename)]
-        new_filename_list = [filename for filename in cur_filename_list if filename not in list(self.filename_list)]
-        self.filename_list = cur_filename_list
-        for filename in new_filename_list:
-            creation_time = os.path.getctime(filename)
-            if len(self.ordered_file_list) > 0:
-                if creation_time > self.ordered_file_list[-1][0]:
-                    self.ordered_file_list.append((creation_time, filename))
-                else:
-                    for ind in range(len(self.ordered_file_list)):
-                        if creation_time < self.ordered_file_list[ind][0]:
-                            self.ordered_file_list.insert(ind, (creation_time, filename))
-                            break
-            else:
-                self.ordered_file_list.append((creation_time, filename))
+        if self._file_index is not None:
+            self._file_index.update()
+            self._schedule_index_cache_save()
+
+    def save_index_cache(self):
+        """
+        Writes the creation times of the file index to the cache file, if they changed.
+        """
+        self._cache_timer.stop()
+        if self._file_index is not None:
+            self._file_index.save_cache()
+
+    def _directory_files_changed(self, directory, added, removed):
+        """
+        Applies the changes reported by the directory watcher to the file index.
+        """
+        if self._file_index is None or directory != self._file_index.directory:
+            return
+        self._file_index.remove(removed)
+        self._file_index.add(added)
+        self._schedule_index_cache_save()
+
+    def _schedule_index_cache_save(self):
+        if self._file_index.cache_outdated:
+            self._cache_timer.start()
+
+
+def supersample_array(array, factor):
+    """
+    Splits every element of a 2d array into factor x factor elements with the same value (block replication). The
+    result is created with a single allocation and keeps the dtype of the array (e.g. bool for masks).
+    :param array: 2d array
+    :param factor: int - supersampling factor
+    :return: supersampled array, or the array itself for factors <= 1
+    """
+    if factor is None or factor <= 1:
+        return array
+    rows, cols = array.shape
+    blocks = np.broadcast_to(array[:, np.newaxis, :, np.newaxis], (rows, factor, cols, factor))
+    return blocks.reshape(rows * factor, cols * factor)
 
 
 def rotate_matrix_m90(matrix):
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ImagePrefetcher(object):
+    """
+    Speculatively loads image files in a background thread, so that they are already read and decoded when they are
+    requested. The total size of the prefetched image data is limited by max_bytes, files which would exceed the
+    budget are not prefetched.
+
+    The loading is done in a single worker thread. With prefetch_following the files to load are also determined in
+    the worker thread, so that e.g. looking up the next files of a directory does not block the GUI thread.
+    """
+
+    def __init__(self, load_function, max_bytes=512 * 1024 ** 2):
+        """
+        :param load_function: function taking a filename and returning a dictionary with at least "img_data"
+        :param max_bytes: maximum number of bytes used for the prefetched image data
+        """
+        self.load_function = load_function
+        self.max_bytes = max_bytes
+
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._futures = OrderedDict()
+        self._lookup_futures = []
+        self._lock = threading.RLock()
+        self._cached_bytes = 0
+        self._generation = 0  # increased by clear, lookups started before are not used anymore
+
+    def prefetch(self, filenames):
+        """
+        Starts loading the given files in the given order. Previously prefetched files which are not in the list are
+        discarded.
+        :param filenames: list of filenames
+        """
+        with self._lock:
+            for filename in list(self._futures.keys()):
+                if filename not in filenames:
+                    self._discard(self._futures.pop(filename))
+            for filename in filenames:
+                if filename not in self._futures:
+                    self._futures[filename] = self._executor.submit(self._load, filename)
+
+    def prefetch_following(self, get_filenames):
+        """
+        Determines the files to prefetch in the worker thread and starts loading them, see prefetch.
+        :param get_filenames: function returning the list of filenames, called in the worker thread
+        """
+        with self._lock:
+            self._lookup_futures = [future for future in self._lookup_futures if not future.done()]
+            self._lookup_futures.append(self._executor.submit(self._lookup, get_filenames, self._generation))
+
+    def get(self, filename):
+        """
+        Returns the prefetched data of a file. If the file is still being loaded, this waits for the result.
+        :param filename: filename
+        :return: the data returned by the load_function or None if the file was not prefetched, loading failed or
+                 the file has been changed in the meantime
+        """
+        with self._lock:
+            future = self._futures.pop(filename, None)
+        if future is None or future.cancel():
+            return None
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.debug("Prefetching {0} failed: {1}".format(filename, e))
+            return None
+        self._release(future)
+
+        if result is None:
+            return None
+        file_stat, _, data = result
+        if file_stat != get_file_stat(filename):
+            return None
+        return data
+
+    def wait(self):
+        """
+        Waits until the files to prefetch are determined and all of them are loaded.
+        """
+        with self._lock:
+            lookup_futures = list(self._lookup_futures)
+        for future in lookup_futures:
+            try:
+                future.result()
+            except CancelledError:
+                pass
+        with self._lock:
+            futures = list(self._futures.values())
+        for future in futures:
+            try:
+                future.result()
+            except (CancelledError, Exception):
+                pass
+
+    def clear(self):
+        """
+        Discards all prefetched data.
+        """
+        with self._lock:
+            self._generation += 1
+            while self._futures:
+                self._discard(self._futures.popitem()[1])
+
+    @property
+    def filenames(self):
+        with self._lock:
+            return list(self._futures.keys())
+
+    @property
+    def cached_bytes(self):
+        return self._cached_bytes
+
+    def _lookup(self, get_filenames, generation):
+        try:
+            filenames = get_filenames()
+        except (OSError, ValueError) as e:  # e.g. files deleted in the meantime
+            logger.debug("Determining the files to prefetch failed: {0}".format(e))
+            return
+        with self._lock:
+            if generation == self._generation:
+                self.prefetch(filenames)
+
+    def _load(self, filename):
+        with self._lock:
+            if self._cached_bytes >= self.max_bytes:
+                return None
+
+        file_stat = get_file_stat(filename)
+        data = self.load_function(filename)
+        if not data:
+            return None
+        if isinstance(data["img_data"], np.memmap):
+            # read the data now, otherwise it would only be read when it is displayed
+            data["img_data"] = np.array(data["img_data"])
+
+        nbytes = data["img_data"].nbytes
+        with self._lock:
+            if self._cached_bytes + nbytes > self.max_bytes:
+                return None
+            self._cached_bytes += nbytes
+        return file_stat, nbytes, data
+
+    def _discard(self, future):
+        if not future.cancel():
+            future.add_done_callback(self._release)
+
+    def _release(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        if result is not None:
+            with self._lock:
+                self._cached_bytes -= result[1]
+
+
+def get_file_stat(filename):
+    """
+    :return: modification time and size of a file, used to detect changes of the file
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+
+
+class ImagePyramid(object):
+    """
+    Multi-resolution representation of an image for displaying it. Level 0 is the image itself, every further level
+    averages blocks of 2x2 pixels of the previous one. The levels are calculated when they are requested for the first
+    time, so that a view showing the whole image at screen resolution does not need to process more than the full
+    image once.
+
+    The histogram used for the color scale is calculated from a regularly subsampled part of the full resolution
+    image and is independent of the displayed level and region.
+    """
+
+    def __init__(self, img_data, min_size=256, histogram_size=512):
+        """
+        :param img_data: 2d image array
+        :param min_size: the last level is the first one where both dimensions are at most min_size
+        :param histogram_size: approximate number of samples along each axis used for the histogram
+        """
+        self.img_data = img_data
+        self.histogram_size = histogram_size
+
+        num_levels = 1
+        while max(self.shape) > min_size * 2 ** (num_levels - 1):
+            num_levels += 1
+        self.num_levels = num_levels
+
+        self._levels = [img_data]
+        self._histograms = {}
+
+    @property
+    def shape(self):
+        return self.img_data.shape
+
+    def get_level(self, level):
+        """
+        :param level: pyramid level, each pixel of the level covers 2**level x 2**level image pixels
+        :return: image array of the level, the shape is the image shape divided by 2**level, rounded up
+        """
+        level = min(level, self.num_levels - 1)
+        while len(self._levels) <= level:
+            self._levels.append(downsample(self._levels[-1]))
+        return self._levels[level]
+
+    def get_level_for_pixel_size(self, pixel_size):
+        """
+        :param pixel_size: number of image pixels covered by one screen pixel
+        :return: the coarsest level which still has at least one level pixel per screen pixel
+        """
+        if not np.isfinite(pixel_size) or pixel_size <= 1:
+            return 0
+        return int(min(np.floor(np.log2(pixel_size)), self.num_levels - 1))
+
+    def get_histogram(self, bins=1000):
+        """
+        Calculates the histogram of the image, in the same format as pyqtgraph's ImageItem.getHistogram.
+        :param bins: number of bins
+        :return: tuple of the left bin edges and the counts or (None, None) if the image has no finite values
+        """
+        if bins not in self._histograms:
+            step_1 = max(1, int(np.ceil(self.shape[0] / self.histogram_size)))
+            step_2 = max(1, int(np.ceil(self.shape[1] / self.histogram_size)))
+            samples = np.asarray(self.img_data[::step_1, ::step_2])
+            samples = samples[np.isfinite(samples)]
+            if samples.size == 0:
+                self._histograms[bins] = None, None
+            else:
+                counts, edges = np.histogram(samples, bins=bins)
+                self._histograms[bins] = edges[:-1], counts
+        return self._histograms[bins]
+
+
+def downsample(img_data):
+    """
+    Averages blocks of 2x2 pixels, odd dimensions are extended by repeating the last row or column.
+    :return: float32 array with half the size of img_data (rounded up)
+    """
+    if img_data.shape[0] % 2 or img_data.shape[1] % 2:
+        img_data = np.pad(img_data, ((0, img_data.shape[0] % 2), (0, img_data.shape[1] % 2)), mode='edge')
+    result = img_data[0::2, 0::2].astype(np.float32)
+    result += img_data[1::2, 0::2]
+    result += img_data[0::2, 1::2]
+    result += img_data[1::2, 1::2]
+    result *= 0.25
+    return result
@@ -18,16 +18,33 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import zlib
+from collections import OrderedDict
+
 import numpy as np
 import fabio
 from PIL import Image
 
 
 class ImgCorrectionManager(object):
-    def __init__(self, img_shape=None):
+    """
+    Holds the corrections applied to an image. The product of all correction maps is cached until a correction is
+    added, deleted or recalculated.
+    """
+
+    def __init__(self, img_shape=None, dtype=np.float64):
+        """
+        :param img_shape: shape of the corrected images, defaults to the shape of the first added correction
+        :param dtype: dtype of the combined correction map, np.float32 halves the memory and the time needed for
+                      applying the corrections
+        """
         self._corrections = {}
         self._ind = 0
         self.shape = img_shape
+        self.dtype = dtype
+
+        self._combined_data = None
+        self._combined_data_sources = []
 
     def add(self, img_correction, name=None):
         if self.shape is None:
@@ -58,15 +75,28 @@ class ImgCorrectionManager(object):
         self._corrections = {}
         self.shape = None
         self._ind = 0
+        self._combined_data = None
+        self._combined_data_sources = []
 
     def get_data(self):
+        """
+        :return: product of all correction maps or None if there are no corrections. The returned array is cached and
+                 should not be modified in place.
+        """
         if len(self._corrections) == 0:
             return None
 
-        res = np.ones(self.shape)
-        for key, correction in self._corrections.items():
-            res *= correction.get_data()
-        return res
+        # corrections replace their data array when they are recalculated, the cached product stays valid as long as
+        # the same arrays are used (they are referenced, so their ids can not be reused)
+        sources = [correction.get_data() for correction in self._corrections.values()]
+        if self._combined_data is None or len(sources) != len(self._combined_data_sources) or \
+                any(source is not cached for source, cached in zip(sources, self._combined_data_sources)):
+            res = np.ones(self.shape, dtype=self.dtype)
+            for data in sources:
+                res *= data
+            self._combined_data = res
+            self._combined_data_sources = sources
+        return self._combined_data
 
     def get_correction(self, name):
         try:
@@ -140,83 +170,9 @@ class CbnCorrection(ImgCorrectionInterface):
         self._center_offset_angle = params['center_offset_angle']
 
     def update(self):
-
-        # diam - diamond thickness
-        # ds - seat thickness
-        # r1 - small radius
-        # r2 - large radius
-        # tilt - tilting angle of DAC
-        dtor = np.pi / 180.0
-
-        diam = self._diamond_thickness
-        ds = self._seat_thickness
-        r1 = self._small_cbn_seat_radius
-        r2 = self._large_cbn_seat_radius
-        tilt = -self._tilt * dtor
-        tilt_rotation = self._tilt_rotation * dtor + np.pi / 2
-        center_offset_angle = self._center_offset_angle * dtor
-
-        two_theta = self._tth_array * dtor
-        azi = self._azi_array * dtor
-
-        # calculate radius of the cone for each pixel specific to a center_offset and rotation angle
-        if self._center_offset != 0:
-            beta = azi - np.arcsin(
-                self._center_offset * np.sin((np.pi - (azi + center_offset_angle))) / r1) + center_offset_angle
-            r1 = np.sqrt(r1 ** 2 + self._center_offset ** 2 - 2 * r1 * self._center_offset * np.cos(beta))
-            r2 = np.sqrt(r2 ** 2 + self._center_offset ** 2 - 2 * r2 * self._center_offset * np.cos(beta))
-
-        # defining rotation matrices for the diamond anvil cell
-        Rx = np.matrix([[1, 0, 0],
-                        [0, np.cos(tilt_rotation), -np.sin(tilt_rotation)],
-                        [0, np.sin(tilt_rotation), np.cos(tilt_rotation)]])
-
-        Ry = np.matrix([[np.cos(tilt), 0, np.sin(tilt)],
-                        [0, 1, 0],
-                        [-np.sin(tilt), 0, np.cos(tilt)]])
-
-        dac_vector = np.array(Rx * Ry * np.matrix([1, 0, 0]).T)
-
-        # calculating a diffraction vector for each pixel
-        diffraction_vec = np.array([np.cos(two_theta),
-                                    np.cos(azi) * np.sin(two_theta),
-                                    np.sin(azi) * np.sin(two_theta)])
-
-        # angle between diffraction vector and diamond anvil cell vector based on dot product:
-        tt = np.arccos(dot_product(dac_vector, diffraction_vec) / \
-                       (vector_len(dac_vector) * vector_len(diffraction_vec)))
-
-        # calculate path through diamond its absorption
-        path_diamond = diam / np.cos(tt)
-        abs_diamond = np.exp(-path_diamond / self._diamond_abs_length)
-
-        # define the different regions for the absorption in the seat
-        # region 2 is partial absorption (in the cone) and region 3 is complete absorbtion
-        ts1 = np.arctan(r1 / diam)
-        ts2 = np.arctan(r2 / (diam + ds))
-        tseat = np.arctan((r2 - r1) / ds)
-
-        region2 = np.logical_and(tt > ts1, tt < ts2)
-        region3 = tt >= ts2
-
-        # calculate the paths through each region
-        path_seat = np.zeros(tt.shape)
-        if self._center_offset != 0:
-            deltar = diam * np.tan(tt[region2]) - r1[region2]
-            alpha = np.pi / 2. - tseat[region2]
-            gamma = np.pi - (alpha + tt[region2] + np.pi / 2)
-        else:
-            deltar = diam * np.tan(tt[region2]) - r1
-            alpha = np.pi / 2. - tseat
-            gamma = np.pi - (alpha + tt[region2] + np.pi / 2)
-
-        path_seat[region2] = deltar * np.sin(alpha) / np.sin(gamma)
-        path_seat[region3] = ds / np.cos(tt[region3])
-
-        abs_seat = np.exp(-path_seat / self._seat_abs_length)
-
-        # combine both, diamond and seat absorption correction
-        self._data = abs_diamond * abs_seat
+        params = self.get_params()
+        self._data = calculate_correction_map(calculate_cbn_absorption, self._tth_array, self._azi_array,
+                                              ('cbn',) + tuple(sorted(params.items())), **params)
 
     def __eq__(self, other):
         if not isinstance(other, CbnCorrection):
@@ -280,18 +236,9 @@ class ObliqueAngleDetectorAbsorptionCorrection(ImgCorrectionInterface):
         return self._data.shape
 
     def update(self):
-        tilt_rad = self.tilt / 180.0 * np.pi
-        rotation_rad = self.rotation / 180.0 * np.pi
-
-        path_length = self.detector_thickness / np.cos(
-            np.sqrt(self.tth_array ** 2 + tilt_rad ** 2 - 2 * tilt_rad * self.tth_array * \
-                    np.cos(np.pi - self.azi_array + rotation_rad)))
-
-        attenuation_constant = 1.0 / self.absorption_length
-        absorption_correction = (1 - np.exp(-attenuation_constant * path_length)) / \
-                                (1 - np.exp(-attenuation_constant * self.detector_thickness))
-
-        self._data = absorption_correction
+        params = self.get_params()
+        self._data = calculate_correction_map(calculate_oblique_angle_absorption, self.tth_array, self.azi_array,
+                                              ('oiadac',) + tuple(sorted(params.items())), **params)
 
 
 class TransferFunctionCorrection(ImgCorrectionInterface):
@@ -400,3 +347,306 @@ def vector_len(vec):
 
 def dot_product(vec1, vec2):
     return vec1[0] * vec2[0] + vec1[1] * vec2[1] + vec1[2] * vec2[2]
+
+
+def calculate_cbn_absorption(tth_array, azi_array, diamond_thickness, seat_thickness, small_cbn_seat_radius,
+                             large_cbn_seat_radius, tilt, tilt_rotation, diamond_abs_length, seat_abs_length,
+                             center_offset, center_offset_angle):
+    """
+    Calculates the absorption of the diamond anvil and the cBN seat for the given two theta and azimuth values.
+    :param tth_array: two theta in degree
+    :param azi_array: azimuth in degree
+    :return: transmission with the shape of tth_array
+    """
+    # diam - diamond thickness
+    # ds - seat thickness
+    # r1 - small radius
+    # r2 - large radius
+    # tilt - tilting angle of DAC
+    dtor = np.pi / 180.0
+
+    diam = diamond_thickness
+    ds = seat_thickness
+    r1 = small_cbn_seat_radius
+    r2 = large_cbn_seat_radius
+    tilt = -tilt * dtor
+    tilt_rotation = tilt_rotation * dtor + np.pi / 2
+    center_offset_angle = center_offset_angle * dtor
+
+    two_theta, azi = np.broadcast_arrays(np.asarray(tth_array) * dtor, np.asarray(azi_array) * dtor)
+
+    # calculate radius of the cone for each pixel specific to a center_offset and rotation angle
+    if center_offset != 0:
+        beta = azi - np.arcsin(
+            center_offset * np.sin((np.pi - (azi + center_offset_angle))) / r1) + center_offset_angle
+        r1 = np.sqrt(r1 ** 2 + center_offset ** 2 - 2 * r1 * center_offset * np.cos(beta))
+        r2 = np.sqrt(r2 ** 2 + center_offset ** 2 - 2 * r2 * center_offset * np.cos(beta))
+
+    # defining rotation matrices for the diamond anvil cell
+    Rx = np.array([[1, 0, 0],
+                   [0, np.cos(tilt_rotation), -np.sin(tilt_rotation)],
+                   [0, np.sin(tilt_rotation), np.cos(tilt_rotation)]])
+
+    Ry = np.array([[np.cos(tilt), 0, np.sin(tilt)],
+                   [0, 1, 0],
+                   [-np.sin(tilt), 0, np.cos(tilt)]])
+
+    dac_vector = Rx.dot(Ry).dot(np.array([1., 0, 0]))
+
+    # angle between diffraction vector and diamond anvil cell vector based on dot product, the diffraction vector
+    # (cos(2th), cos(azi) sin(2th), sin(azi) sin(2th)) has unit length
+    sin_two_theta = np.sin(two_theta)
+    tt = np.arccos(np.clip((dac_vector[0] * np.cos(two_theta) +
+                            dac_vector[1] * np.cos(azi) * sin_two_theta +
+                            dac_vector[2] * np.sin(azi) * sin_two_theta) / vector_len(dac_vector), -1, 1))
+
+    # calculate path through diamond its absorption
+    path_diamond = diam / np.cos(tt)
+    abs_diamond = np.exp(-path_diamond / diamond_abs_length)
+
+    # define the different regions for the absorption in the seat
+    # region 2 is partial absorption (in the cone) and region 3 is complete absorbtion
+    ts1 = np.arctan(r1 / diam)
+    ts2 = np.arctan(r2 / (diam + ds))
+    tseat = np.arctan((r2 - r1) / ds)
+
+    region2 = np.logical_and(tt > ts1, tt < ts2)
+    region3 = tt >= ts2
+
+    # calculate the paths through each region
+    path_seat = np.zeros(tt.shape)
+    if center_offset != 0:
+        deltar = diam * np.tan(tt[region2]) - r1[region2]
+        alpha = np.pi / 2. - tseat[region2]
+        gamma = np.pi - (alpha + tt[region2] + np.pi / 2)
+    else:
+        deltar = diam * np.tan(tt[region2]) - r1
+        alpha = np.pi / 2. - tseat
+        gamma = np.pi - (alpha + tt[region2] + np.pi / 2)
+
+    path_seat[region2] = deltar * np.sin(alpha) / np.sin(gamma)
+    path_seat[region3] = ds / np.cos(tt[region3])
+
+    abs_seat = np.exp(-path_seat / seat_abs_length)
+
+    # combine both, diamond and seat absorption correction
+    return abs_diamond * abs_seat
+
+
+def calculate_oblique_angle_absorption(tth_array, azi_array, detector_thickness, absorption_length, tilt, rotation):
+    """
+    Calculates the absorption correction for the oblique incidence of the x-rays on the detector.
+    :param tth_array: two theta in radians
+    :param azi_array: azimuth in radians
+    :param tilt: detector tilt in degree
+    :param rotation: rotation of the detector tilt in degree
+    :return: relative absorption with the shape of tth_array
+    """
+    tilt_rad = tilt / 180.0 * np.pi
+    rotation_rad = rotation / 180.0 * np.pi
+
+    path_length = detector_thickness / np.cos(
+        np.sqrt(tth_array ** 2 + tilt_rad ** 2 - 2 * tilt_rad * tth_array * \
+                np.cos(np.pi - azi_array + rotation_rad)))
+
+    attenuation_constant = 1.0 / absorption_length
+    return (1 - np.exp(-attenuation_constant * path_length)) / \
+           (1 - np.exp(-attenuation_constant * detector_thickness))
+
+
+class CorrectionCache(object):
+    """
+    Least recently used cache of calculated correction maps. The maps are stored per geometry (the two theta and
+    azimuth arrays) and correction parameters, so that going back to previous parameters (e.g. when changing a
+    value back and forth in the GUI or when loading a project) does not need any calculation.
+    """
+
+    def __init__(self, max_size=8, max_bytes=256 * 1024 ** 2):
+        """
+        :param max_size: maximum number of stored maps
+        :param max_bytes: maximum memory used by the stored maps, the most recent map is always kept
+        """
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._maps = OrderedDict()
+
+    def get(self, key):
+        correction_map = self._maps.pop(key, None)
+        if correction_map is not None:
+            self._maps[key] = correction_map
+        return correction_map
+
+    def add(self, key, correction_map):
+        self._maps[key] = correction_map
+        while len(self._maps) > 1 and (len(self._maps) > self.max_size or self.nbytes > self.max_bytes):
+            self._maps.popitem(last=False)
+
+    @property
+    def nbytes(self):
+        return sum(correction_map.nbytes for correction_map in self._maps.values())
+
+    def clear(self):
+        self._maps.clear()
+
+    def __len__(self):
+        return len(self._maps)
+
+
+correction_cache = CorrectionCache()
+
+# maximum absolute deviation of a correction map interpolated from a coarse grid from the exact values
+grid_tolerance = 1e-4
+
+
+def calculate_correction_map(function, tth_array, azi_array, parameter_key, **parameters):
+    """
+    Calculates a correction map depending only on two theta and azimuth. Previously calculated maps are taken from
+    the correction_cache. Large maps are calculated on a coarse grid and interpolated, if the interpolation is accurate
+    enough (see evaluate_on_grid).
+    :param function: function(tth_array, azi_array, **parameters) returning the correction values
+    :param parameter_key: hashable representation of the correction and its parameters
+    :return: correction map with the shape of tth_array
+    """
+    tth_array = np.asarray(tth_array)
+    azi_array = np.asarray(azi_array)
+    key = (get_array_key(tth_array), get_array_key(azi_array), parameter_key)
+    correction_map = correction_cache.get(key)
+    if correction_map is None:
+        correction_map = evaluate_on_grid(function, tth_array, azi_array, **parameters)
+        correction_cache.add(key, correction_map)
+    return correction_map
+
+
+def get_array_key(array, num_samples=65536):
+    """
+    Creates a key identifying an array of pixel coordinates. To keep this fast for large detectors, only an evenly
+    spaced subset of the values is hashed, which is enough for smooth coordinate arrays calculated from a geometry.
+    """
+    flat_array = np.ravel(array)
+    step = max(flat_array.size // num_samples, 1)
+    samples = np.ascontiguousarray(flat_array[::step], dtype=np.float64)
+    return array.shape, zlib.crc32(samples.tobytes()), float(flat_array[-1]) if flat_array.size else None
+
+
+def evaluate_on_grid(function, tth_array, azi_array, grid_sizes=(256, 1024), tolerance=None,
+                     max_exact_fraction=0.25, **parameters):
+    """
+    Evaluates function(tth, azi, **parameters) for every pixel. For large arrays, the function is evaluated on a
+    regular (tth, azi) grid and bilinearly interpolated to the pixels instead. The interpolation error is estimated
+    in the centers of the grid cells, pixels in cells (and their neighbours) where it exceeds the tolerance, e.g. at
+    the sharp edge of a seat, are calculated exactly. If this applies to more than max_exact_fraction of the cells,
+    the next larger grid is tried and finally every pixel is calculated.
+    :param grid_sizes: number of grid points along both axes which are tried
+    :param tolerance: maximum absolute error of the interpolation, defaults to grid_tolerance
+    :return: function values with the shape of tth_array
+    """
+    if tolerance is None:
+        tolerance = grid_tolerance
+
+    for grid_size in grid_sizes:
+        if 4 * grid_size ** 2 > tth_array.size:
+            break
+        interpolator = get_grid_interpolator(tth_array, azi_array, grid_size)
+        if interpolator is None:
+            break
+        tth_grid, azi_grid = interpolator.tth_grid, interpolator.azi_grid
+        grid_values = function(tth_grid[:, None], azi_grid[None, :], **parameters)
+
+        # the interpolation error is largest in the centers of the cells
+        tth_centers = (tth_grid[1:] + tth_grid[:-1]) / 2
+        azi_centers = (azi_grid[1:] + azi_grid[:-1]) / 2
+        center_values = function(tth_centers[:, None], azi_centers[None, :], **parameters)
+        interpolated_center_values = (grid_values[1:, 1:] + grid_values[1:, :-1] +
+                                      grid_values[:-1, 1:] + grid_values[:-1, :-1]) / 4
+        with np.errstate(invalid='ignore'):
+            exact_cells = ~(np.abs(center_values - interpolated_center_values) <= tolerance)
+        exact_cells = _dilate(exact_cells)
+        if np.mean(exact_cells) <= max_exact_fraction:
+            result = interpolator.interpolate(grid_values)
+            exact = interpolator.get_pixels_in_cells(exact_cells)
+            result[exact] = function(tth_array.ravel()[exact], azi_array.ravel()[exact], **parameters)
+            return result.reshape(tth_array.shape)
+
+    return function(tth_array, azi_array, **parameters)
+
+
+class GridInterpolator(object):
+    """
+    Bilinear interpolation from a regular (tth, azi) grid to the pixel positions of a detector. The grid indices and
+    weights of all pixels only depend on the geometry, they are calculated once and reused for every new set of grid
+    values.
+    """
+
+    def __init__(self, tth_array, azi_array, grid_size):
+        tth_flat = np.ravel(tth_array)
+        azi_flat = np.ravel(azi_array)
+        tth_range = (np.min(tth_flat), np.max(tth_flat))
+        azi_range = (np.min(azi_flat), np.max(azi_flat))
+        self.grid_size = grid_size
+        self.tth_grid = np.linspace(tth_range[0], tth_range[1], grid_size)
+        self.azi_grid = np.linspace(azi_range[0], azi_range[1], grid_size)
+
+        tth_pos = (tth_flat - tth_range[0]) * ((grid_size - 1) / (tth_range[1] - tth_range[0]))
+        azi_pos = (azi_flat - azi_range[0]) * ((grid_size - 1) / (azi_range[1] - azi_range[0]))
+        tth_ind = np.clip(tth_pos.astype(np.int32), 0, grid_size - 2)
+        azi_ind = np.clip(azi_pos.astype(np.int32), 0, grid_size - 2)
+        # index of the lower corner of the cell of every pixel in the flattened grid
+        self._ind = tth_ind * np.int32(grid_size) + azi_ind
+        self._tth_weight = (tth_pos - tth_ind).astype(np.float32)
+        self._azi_weight = (azi_pos - azi_ind).astype(np.float32)
+
+    def interpolate(self, grid_values):
+        """
+        :param grid_values: values on the grid with the shape (grid_size, grid_size)
+        :return: flat array with the interpolated values of all pixels
+        """
+        flat_grid = np.ravel(grid_values)
+        lower = flat_grid.take(self._ind)
+        lower += self._azi_weight * (flat_grid.take(self._ind + 1) - lower)
+        upper = flat_grid.take(self._ind + self.grid_size)
+        upper += self._azi_weight * (flat_grid.take(self._ind + self.grid_size + 1) - upper)
+        upper -= lower
+        upper *= self._tth_weight
+        lower += upper
+        return lower
+
+    def get_pixels_in_cells(self, cells):
+        """
+        :param cells: boolean array with the shape (grid_size - 1, grid_size - 1)
+        :return: flat indices of the pixels inside of the cells marked True
+        """
+        cell_ind = self._ind - self._ind // self.grid_size
+        return np.flatnonzero(np.ravel(cells).take(cell_ind))
+
+
+_grid_interpolators = OrderedDict()
+
+
+def get_grid_interpolator(tth_array, azi_array, grid_size, max_size=2):
+    """
+    Returns a GridInterpolator for the pixel positions, recently used interpolators are reused.
+    :return: GridInterpolator or None if the pixels do not span a two dimensional range
+    """
+    key = (get_array_key(tth_array), get_array_key(azi_array), grid_size)
+    interpolator = _grid_interpolators.pop(key, None)
+    if interpolator is None:
+        if np.min(tth_array) == np.max(tth_array) or np.min(azi_array) == np.max(azi_array):
+            return None
+        interpolator = GridInterpolator(tth_array, azi_array, grid_size)
+    _grid_interpolators[key] = interpolator
+    while len(_grid_interpolators) > max_size:
+        _grid_interpolators.popitem(last=False)
+    return interpolator
+
+
+def _dilate(mask):
+    """
+    Extends a 2d boolean mask by one element in every direction (including diagonals).
+    """
+    dilated = np.copy(mask)
+    dilated[1:] |= mask[:-1]
+    dilated[:-1] |= mask[1:]
+    rows = np.copy(dilated)
+    dilated[:, 1:] |= rows[:, :-1]
+    dilated[:, :-1] |= rows[:, 1:]
+    return dilated
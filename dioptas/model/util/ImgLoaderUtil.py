@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Helper functions for reading uncompressed image data without copying it. The returned arrays are memory mapped in
+copy-on-write mode, i.e. the data is only read from disk when it is accessed and changing the array never modifies
+the file.
+"""
+
+import os
+
+import numpy as np
+
+# first bytes of the file formats which can be recognized without trying a loader
+file_signatures = [
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+    (b'\x89HDF\r\n\x1a\n', 'hdf5'),
+    (b'{', 'edf'),
+]
+
+# PIL raw modes of uncompressed tiff data and the corresponding dtypes, only modes where np.array(image) gives the
+# same dtype are used
+tiff_raw_modes = {
+    'L': np.dtype('u1'),
+    'I;16': np.dtype('<u2'),
+    'I;32S': np.dtype('<i4'),
+    'F;32F': np.dtype('<f4'),
+}
+
+edf_data_types = {
+    'SignedByte': 'i1', 'UnsignedByte': 'u1',
+    'SignedShort': 'i2', 'UnsignedShort': 'u2', 'UnsignedShortInteger': 'u2',
+    'SignedInteger': 'i4', 'UnsignedInteger': 'u4', 'SignedLong': 'i4', 'UnsignedLong': 'u4',
+    'Signed64': 'i8', 'Unsigned64': 'u8',
+    'FloatValue': 'f4', 'Float': 'f4', 'FloatIEEE32': 'f4',
+    'DoubleValue': 'f8', 'Double': 'f8', 'FloatIEEE64': 'f8',
+}
+
+
+def get_file_signature(filename):
+    """
+    Determines the file format from the first bytes of a file.
+    :param filename: path to the file
+    :return: 'tiff', 'hdf5', 'edf' or None if the format is not known or the file can not be read
+    """
+    try:
+        with open(filename, 'rb') as f:
+            header = f.read(8)
+    except (IOError, OSError):
+        return None
+    for signature, file_format in file_signatures:
+        if header.startswith(signature):
+            return file_format
+    return None
+
+
+def memmap(filename, dtype, offset, shape):
+    """
+    Memory maps a part of a file in copy-on-write mode.
+    :return: memory mapped array or None if the file is too small
+    """
+    try:
+        return np.memmap(filename, dtype=dtype, mode='c', offset=offset, shape=shape)
+    except (ValueError, OSError):
+        return None
+
+
+def get_tiff_memmap(image, filename):
+    """
+    Memory maps the pixel data of an opened tiff image, this is only possible if the data is stored uncompressed in
+    consecutive strips.
+    :param image: PIL image opened from filename, only the header needs to be read
+    :param filename: path to the tiff file
+    :return: memory mapped 2d array or None if the data can not be mapped
+    """
+    tiles = getattr(image, 'tile', None)
+    if not tiles:
+        return None
+    width, height = image.size
+
+    _, _, offset, args = tiles[0]
+    raw_mode = args[0] if isinstance(args, tuple) else args
+    dtype = tiff_raw_modes.get(raw_mode)
+    if dtype is None:
+        return None
+    row_size = width * dtype.itemsize
+
+    for codec, extents, tile_offset, args in tiles:
+        if codec != 'raw' or not isinstance(args, tuple) or args[0] != raw_mode:
+            return None
+        stride = args[1] if len(args) > 1 else 0
+        orientation = args[2] if len(args) > 2 else 1
+        if stride not in (0, row_size) or orientation != 1:
+            return None
+        x0, y0, x1, _ = extents
+        if x0 != 0 or x1 != width or tile_offset != offset + y0 * row_size:
+            return None
+
+    return memmap(filename, dtype, offset, (height, width))
+
+
+def load_edf_memmap(filename):
+    """
+    Memory maps the data of an uncompressed single frame EDF file.
+    :param filename: path to the edf file
+    :return: tuple of (header dictionary, memory mapped 2d array) or None if the data can not be mapped
+    """
+    with open(filename, 'rb') as f:
+        header_bytes = f.read(65536)
+    header_end = header_bytes.find(b'}\n')
+    if not header_bytes.startswith(b'{') or header_end == -1:
+        return None
+
+    header = {}
+    for line in header_bytes[1:header_end].decode('ascii', 'ignore').split(';'):
+        if '=' in line:
+            key, value = line.split('=', 1)
+            header[key.strip()] = value.strip()
+
+    try:
+        dtype = np.dtype(edf_data_types[header['DataType']])
+        shape = (int(header['Dim_2']), int(header['Dim_1']))
+    except (KeyError, ValueError):
+        return None
+    if header.get('Compression', 'None').lower() not in ('none', ''):
+        return None
+    dtype = dtype.newbyteorder('>' if header.get('ByteOrder') == 'HighByteFirst' else '<')
+
+    offset = header_end + 2
+    size = shape[0] * shape[1] * dtype.itemsize
+    if int(header.get('Size', size)) != size or os.path.getsize(filename) != offset + size:
+        # several frames or additional data blocks
+        return None
+
+    data = memmap(filename, dtype, offset, shape)
+    if data is None:
+        return None
+    return header, data
+
+
+def get_hdf5_memmap(dataset):
+    """
+    Memory maps an uncompressed and unchunked h5py dataset.
+    :param dataset: h5py dataset
+    :return: memory mapped array with the shape of the dataset or None if the dataset can not be mapped
+    """
+    if dataset.chunks is not None or dataset.compression is not None or dataset.dtype.kind not in 'iuf':
+        return None
+    try:
+        offset = dataset.id.get_offset()
+    except (AttributeError, ValueError):
+        return None
+    if offset is None:
+        return None
+    return memmap(dataset.file.filename, dataset.dtype, offset, dataset.shape)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import copy
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+from pyFAI.azimuthalIntegrator import AzimuthalIntegrator
+
+from .RingPixelIndex import get_spline_filename
+
+
+class IntegratorCache(object):
+    """
+    Least recently used cache of pyFAI azimuthal integrators. pyFAI keeps the sparse (CSR) integration matrix inside
+    of the azimuthal integrator and drops it whenever the geometry, the image shape or the mask changes. The cache
+    keeps a separate integrator for every combination of geometry, image shape, mask and integration settings, so
+    that switching back and forth between units, supersampling factors, masks or configurations reuses the already
+    calculated matrices.
+
+    Typical usage::
+
+        integrator = integrator_cache.get_integrator(calibration_model.pattern_geometry, img_data.shape, mask=mask,
+                                                     unit='q_A^-1', npt=2000)
+        integrator.integrate1d(img_data, 2000, unit='q_A^-1', mask=mask, method='csr')
+    """
+
+    def __init__(self, max_size=4):
+        """
+        :param max_size: maximum number of integrators kept in memory, the least recently used one is removed
+                         when the size is exceeded
+        """
+        self.max_size = max_size
+        self._integrators = OrderedDict()
+
+    def get_integrator(self, geometry, shape, mask=None, **integration_settings):
+        """
+        Returns an azimuthal integrator with the parameters and the detector (including its mask, orientation and
+        distortion spline) of geometry for images with the given shape. If an integrator was already created for the
+        same geometry, shape, mask and integration settings it is reused.
+
+        :param geometry: pyFAI geometry whose parameters (dist, poni1, poni2, rot1, rot2, rot3, pixel1, pixel2 and
+                         wavelength) and detector are used
+        :param shape: shape of the integrated image
+        :param mask: mask used for the integration (2d array, 1 denotes masked pixel)
+        :param integration_settings: all further settings which change the integration matrix, e.g. unit, npt,
+                                     method, polarization_factor or correct_solid_angle
+        :rtype: AzimuthalIntegrator
+        """
+        pyfai_parameter = get_geometry_parameter(geometry)
+        key = (tuple(sorted(pyfai_parameter.items())), get_detector_key(geometry.detector), tuple(shape),
+               calculate_mask_hash(mask),
+               tuple(sorted((name, _make_hashable(value)) for name, value in integration_settings.items())))
+
+        integrator = self._integrators.pop(key, None)
+        if integrator is None:
+            integrator = create_integrator(geometry)
+            while len(self._integrators) >= max(self.max_size, 1):
+                _, removed_integrator = self._integrators.popitem(last=False)
+                removed_integrator.reset()
+        self._integrators[key] = integrator
+        return integrator
+
+    def clear(self):
+        """
+        Removes all integrators from the cache.
+        """
+        for integrator in self._integrators.values():
+            integrator.reset()
+        self._integrators.clear()
+
+    def __len__(self):
+        return len(self._integrators)
+
+
+def get_geometry_parameter(geometry):
+    """
+    :return: dictionary with the geometric parameters (dist, poni1, poni2, rot1, rot2, rot3, pixel1, pixel2) and the
+             wavelength of a pyFAI geometry
+    """
+    pyfai_parameter = {}
+    for name in ('dist', 'poni1', 'poni2', 'rot1', 'rot2', 'rot3', 'pixel1', 'pixel2', 'wavelength'):
+        value = getattr(geometry, name)
+        pyfai_parameter[name] = None if value is None else float(value)
+    return pyfai_parameter
+
+
+def get_detector_key(detector):
+    """
+    :return: tuple of the properties of a pyFAI detector which are not covered by the geometry parameters (type, name,
+             orientation and distortion spline file)
+    """
+    orientation = getattr(detector, 'orientation', None)
+    return (type(detector).__name__, getattr(detector, 'name', None),
+            None if orientation is None else int(orientation), get_spline_filename(detector))
+
+
+def create_integrator(geometry):
+    """
+    Creates an azimuthal integrator with the parameters of a pyFAI geometry and a copy of its detector, so that the
+    integrator is not changed together with the geometry.
+    """
+    integrator = AzimuthalIntegrator(dist=geometry.dist, poni1=geometry.poni1, poni2=geometry.poni2,
+                                     rot1=geometry.rot1, rot2=geometry.rot2, rot3=geometry.rot3,
+                                     detector=copy.deepcopy(geometry.detector))
+    if geometry.wavelength is not None:
+        integrator.wavelength = geometry.wavelength
+    return integrator
+
+
+def calculate_mask_hash(mask):
+    """
+    Calculates a checksum of a mask, None is returned when no mask is given.
+    """
+    if mask is None:
+        return None
+    mask = np.ascontiguousarray(mask, dtype=bool)
+    return mask.shape, zlib.crc32(mask.view(np.uint8).data)
+
+
+def _make_hashable(value):
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_make_hashable(item) for item in value)
+    return value
+
+
+# integrators shared by all calibration models (and thereby all configurations) of the current process
+integrator_cache = IntegratorCache()
@@ -22,6 +22,8 @@ import numpy as np
 import h5py
 import re
 
+from .ImgLoaderUtil import get_hdf5_memmap
+
 
 class LambdaImage:
     def __init__(self, filename):
@@ -61,7 +63,11 @@ class LambdaImage:
             except OSError:
                 pass
 
-        self.full_img_data = [imageFile[data_path] for imageFile in lambda_files]
+        # uncompressed and unchunked module data is memory mapped, the h5py datasets are used otherwise
+        self.full_img_data = []
+        for image_file in lambda_files:
+            module_data = get_hdf5_memmap(image_file[data_path])
+            self.full_img_data.append(module_data if module_data is not None else image_file[data_path])
 
         self._module_pos = np.array([np.ravel(nxim[module_positions_path]).astype(int) for nxim in lambda_files])
 
@@ -76,22 +82,30 @@ class LambdaImage:
         :param image_nr: position from which to take the image from the image set
         :return: image_data
         """
-        # the empty array needs to have the width of the detector data for concatenate()
-        image = np.empty((0, self.full_img_data[-1].shape[-1] + self._module_pos[:, 0].max()))
+        return self.get_images(image_nr, image_nr + 1)[0]
+
+    def get_images(self, start, stop):
+        """
+        Gets the data for a range of images at once and stitches the tiles together. Each module dataset is only read
+        once for the whole range, which is much faster than reading the images one by one.
+        :param start: position of the first image in the image set
+        :param stop: position after the last image, will be limited to series_max
+        :return: 3d array with the image data (image, row, column)
+        """
+        stop = min(stop, self.series_max)
+        if len(self.full_img_data) == 1 and not self._module_pos.any() and isinstance(self.full_img_data[0],
+                                                                                      np.ndarray):
+            # a single memory mapped module does not need to be stitched
+            return self.full_img_data[0][start:stop, ::-1]
+
+        width = self.full_img_data[-1].shape[-1] + self._module_pos[:, 0].max()
+        height = int(self._module_pos[-1, 1]) + self.full_img_data[-1].shape[1]
 
+        images = np.zeros((max(stop - start, 0), height, width))
         for modulenr, moduleImageData in enumerate(self.full_img_data):
-            # generate empty columns to the left and right of the data to match with the others
-            imagedata = np.concatenate([np.zeros((moduleImageData.shape[1], self._module_pos[modulenr, 0])),
-                                        moduleImageData[image_nr],
-                                        np.zeros((moduleImageData.shape[1], self._module_pos[:, 0].max() - self._module_pos[modulenr, 0]))], axis=1)
-
-            image = np.concatenate(
-                [image,
-                 np.zeros((
-                     # generate as many empty rows as needed to get to the position where the module data wants to be
-                     int(self._module_pos[modulenr, 1]) -
-                     image.shape[0],
-                     moduleImageData.shape[-1] + self._module_pos[:, 0].max())),
-                 imagedata])  # append the actual new image data
-
-        return image[::-1]
+            # place the module data at its position, everything else stays empty
+            x = int(self._module_pos[modulenr, 0])
+            y = int(self._module_pos[modulenr, 1])
+            images[:, y:y + moduleImageData.shape[1], x:x + moduleImageData.shape[2]] = moduleImageData[start:stop]
+
+        return images[:, ::-1]
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import zlib
+from collections import deque
+
+import numpy as np
+
+from .PackedMask import pack_mask, unpack_mask
+
+
+class MaskPatch(object):
+    """
+    Content of a rectangular region of a boolean mask, stored bit-packed and compressed.
+    """
+
+    def __init__(self, mask, region=None):
+        """
+        :param mask: 2d mask array
+        :param region: tuple of (row_slice, column_slice) which is stored, None stores the whole mask
+        """
+        self.region = region
+        data = np.asarray(mask if region is None else mask[region], dtype=bool)
+        self.shape = data.shape
+        self._data = zlib.compress(pack_mask(data).tobytes(), 1)
+
+    @property
+    def nbytes(self):
+        return len(self._data)
+
+    def get_data(self):
+        """
+        :return: the stored boolean array
+        """
+        return unpack_mask(np.frombuffer(zlib.decompress(self._data), dtype=np.uint8), self.shape)
+
+    def apply(self, mask):
+        """
+        Restores the stored region.
+        :param mask: mask the patch was taken from, it is not modified
+        :return: new mask array with the stored content in the region
+        """
+        if self.region is None:
+            return self.get_data()
+        mask = np.array(mask, dtype=bool)
+        mask[self.region] = self.get_data()
+        return mask
+
+
+class MaskHistory(object):
+    """
+    Undo and redo steps of a mask. For every step only the region of the mask which is changed is stored as a
+    compressed MaskPatch. The number of steps is limited by the memory they use, the oldest undo steps are discarded
+    first.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 ** 2, max_steps=None):
+        """
+        :param max_bytes: maximum memory used by the stored undo and redo steps
+        :param max_steps: optional maximum number of undo steps
+        """
+        self.max_bytes = max_bytes
+        self.max_steps = max_steps
+        self._undo_patches = deque()
+        self._redo_patches = deque()
+        self._nbytes = 0
+
+    def save(self, mask, region=None):
+        """
+        Saves the mask before it is changed, this clears the redo steps.
+        :param mask: mask before the change
+        :param region: tuple of (row_slice, column_slice) which will be changed, None if the whole mask can change
+        """
+        self._push(self._undo_patches, MaskPatch(mask, region))
+        while self._redo_patches:
+            self._nbytes -= self._redo_patches.pop().nbytes
+        self._limit()
+
+    def undo(self, mask):
+        """
+        :param mask: current mask
+        :return: the mask before the last change or None if there is nothing to undo
+        """
+        return self._restore(mask, self._undo_patches, self._redo_patches)
+
+    def redo(self, mask):
+        """
+        :param mask: current mask
+        :return: the mask after the last undone change or None if there is nothing to redo
+        """
+        return self._restore(mask, self._redo_patches, self._undo_patches)
+
+    def clear(self):
+        self._undo_patches.clear()
+        self._redo_patches.clear()
+        self._nbytes = 0
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    @property
+    def undo_steps(self):
+        return len(self._undo_patches)
+
+    @property
+    def redo_steps(self):
+        return len(self._redo_patches)
+
+    def _restore(self, mask, source, target):
+        if not source:
+            return None
+        patch = source.pop()
+        self._nbytes -= patch.nbytes
+        self._push(target, MaskPatch(mask, patch.region))
+        restored_mask = patch.apply(mask)
+        self._limit()
+        return restored_mask
+
+    def _push(self, patches, patch):
+        patches.append(patch)
+        self._nbytes += patch.nbytes
+
+    def _limit(self):
+        # the latest undo step is always kept
+        while len(self._undo_patches) > 1 and (self._nbytes > self.max_bytes or
+                                               (self.max_steps is not None and
+                                                len(self._undo_patches) > self.max_steps)):
+            self._nbytes -= self._undo_patches.popleft().nbytes
@@ -19,7 +19,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import threading
 import time
+from collections import deque
 
 from qtpy import QtCore
 
@@ -28,6 +30,17 @@ class NewFileInDirectoryWatcher(QtCore.QObject):
     """
     This class watches a given filepath for any new files with a given file extension added to it.
 
+    New files are checked for completeness (their size does not change anymore) in a background thread, so the GUI
+    is not blocked while files are being written. Every new file is queued in the order it was found and the
+    file_added signal is emitted for one file per event loop iteration. When files arrive faster than they are
+    processed, the queue_policy decides what happens:
+        - 'queue': every file is processed, if more than max_queue_size files are waiting the oldest are dropped
+        - 'latest': only the newest file is processed, all files which are still waiting are skipped
+
+    With track_changes enabled the directory is also watched while the watcher is not active and all added and removed
+    files are reported with the files_changed signal, e.g. for keeping a DirectoryFileIndex up to date without
+    listing the directory in the GUI thread. The first listing of a directory reports all its files as added.
+
     Typical usage::
         def callback_fcn(path):
             print(path)
@@ -37,106 +50,238 @@ class NewFileInDirectoryWatcher(QtCore.QObject):
 
     """
     file_added = QtCore.Signal(str)
+    files_changed = QtCore.Signal(str, list, list)  # directory, added filenames, removed filenames
+    _file_ready = QtCore.Signal()
 
-    def __init__(self, path=None, file_types=None, activate=False):
+    def __init__(self, path=None, file_types=None, activate=False, queue_policy='queue', max_queue_size=100,
+                 check_interval=0.1, track_changes=False):
         """
         :param path: path to folder which will be watched
         :param file_types: list of file types which will be watched for, e.g. ['.tif', '.jpeg]
         :param activate: whether or not the Watcher will already emit signals
+        :param queue_policy: 'queue' or 'latest', see class description
+        :param max_queue_size: maximum number of files waiting to be processed
+        :param check_interval: time in seconds the size of a new file has to stay constant until it is considered
+                               to be completely written
+        :param track_changes: whether all changes of the directory are reported with the files_changed signal
         """
         super(NewFileInDirectoryWatcher, self).__init__()
 
-        self._file_system_watcher = QtCore.QFileSystemWatcher()
         if path is None:
             path = os.getcwd()
-        self._file_system_watcher.addPath(path)
-        self._files_in_path = os.listdir(path)
+        self._path = path
+        self._files_in_path = None
 
+        self._file_system_watcher = QtCore.QFileSystemWatcher()
+        self._file_system_watcher.addPath(path)
         self._file_system_watcher.directoryChanged.connect(self._directory_changed)
-        self._file_system_watcher.blockSignals(~activate)
-
-        self._file_changed_watcher = QtCore.QFileSystemWatcher()
-        self._file_changed_watcher.fileChanged.connect(self._file_changed)
+        self._file_system_watcher.blockSignals(True)
 
         if file_types is None:
             self.file_types = set([])
         else:
             self.file_types = set(file_types)
 
+        self.queue_policy = queue_policy
+        self.max_queue_size = max_queue_size
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._directory_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._active = False
+        self._track_changes = False
+        self._pending_files = []  # new files which might still be written, as [path, size, time of size] lists
+        self._ready_files = deque()
+        self._processing_scheduled = False
+
+        self._file_ready.connect(self._process_ready_files)
+
+        self.track_changes = track_changes
+        if activate:
+            self.activate()
+
     @property
     def path(self):
-        return self._file_system_watcher.directories()[0]
+        return self._path
 
     @path.setter
     def path(self, new_path):
-        if len(self._file_system_watcher.directories()):
-            self._file_system_watcher.removePath(self._file_system_watcher.directories()[0])
-        self._file_system_watcher.addPath(new_path)
-        self._files_in_path = os.listdir(new_path)
+        if new_path == self._path:
+            return
+        with self._lock:
+            self._file_system_watcher.removePath(self._path)
+            self._file_system_watcher.addPath(new_path)
+            self._path = new_path
+            self._pending_files = []
+            self._files_in_path = None
+        if self._thread is not None:  # the new directory is listed in the background thread
+            self._directory_event.set()
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def track_changes(self):
+        return self._track_changes
+
+    @track_changes.setter
+    def track_changes(self, value):
+        self._track_changes = value
+        if value and self._thread is None:
+            self._start_thread()
+            self._directory_event.set()
+        elif not self.active:
+            self._stop_thread()
 
     def activate(self):
         """
         activates the watcher to emit signals when a new file is added
         """
-        self._file_system_watcher.blockSignals(False)
+        if self.active:
+            return
+        with self._lock:
+            if self._files_in_path is None:
+                self._files_in_path = set(os.listdir(self._path))
+            self._active = True
+        self._start_thread()
 
     def deactivate(self):
         """
         deactivates the watcher so it will not emit a signal when a new file is added
         """
+        if not self.active:
+            return
+        with self._lock:
+            self._active = False
+            self._pending_files = []
+            self._ready_files.clear()
+        if not self.track_changes:
+            self._stop_thread()
+
+    def _start_thread(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._check_files)
+        self._thread.daemon = True
+        self._thread.start()
+        self._file_system_watcher.blockSignals(False)
+
+    def _stop_thread(self):
         self._file_system_watcher.blockSignals(True)
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._directory_event.set()
+        self._thread.join()
+        self._thread = None
+        self._files_in_path = None
 
     def _directory_changed(self):
         """
-        internal function which determines whether the change in directory is an actual new file. If a new file was
-        detected it looks if it has the right extension and checks the file size. When the file is not completely
-        written yet it watches it for changes and will call the _file_changed function which wil acctually emit the
-        signal.
+        Callback of the file system watcher, the directory is checked for new files in the background thread.
         """
-        files_now = os.listdir(self.path)
-        files_added = [f for f in files_now if not f in self._files_in_path]
-
-        if len(files_added) > 0:
-            new_file_path = os.path.join(str(self.path), files_added[-1])
+        self._directory_event.set()
 
-            # abort if the new_file added is actually a directory...
-            if os.path.isdir(new_file_path):
-                self._files_in_path = files_now
-                return
+    def _check_files(self):
+        """
+        Runs in the background thread. Looks for new files after every directory change and releases them in order
+        once their size does not change anymore.
+        """
+        while not self._stop_event.is_set():
+            timeout = self.check_interval if self._pending_files else None
+            directory_changed = self._directory_event.wait(timeout)
+            self._directory_event.clear()
+            if self._stop_event.is_set():
+                break
+            with self._lock:
+                if directory_changed:
+                    self._find_new_files()
+                self._release_complete_files()
 
-            valid_file = False
-            for file_type in self.file_types:
-                if new_file_path.endswith(file_type):
-                    valid_file = True
-                    break
-
-            if valid_file:
-                if self._file_closed(new_file_path):
-                    self.file_added.emit(new_file_path)
-                else:
-                    self._file_changed_watcher.addPath(new_file_path)
+    def _find_new_files(self):
+        try:
+            files_now = set(os.listdir(self._path))
+        except OSError:
+            return
+        if self._files_in_path is None:
             self._files_in_path = files_now
+            if self.track_changes:
+                self.files_changed.emit(self._path, sorted(files_now), [])
+            return
+        files_added = sorted(files_now - self._files_in_path)
+        files_removed = sorted(self._files_in_path - files_now)
+        self._files_in_path = files_now
+
+        if self.track_changes and (files_added or files_removed):
+            self.files_changed.emit(self._path, files_added, files_removed)
+        if not self.active:
+            return
 
-    def _file_closed(self, path):
+        for filename in files_added:
+            new_file_path = os.path.join(str(self._path), filename)
+            if os.path.isdir(new_file_path) or not self._valid_file_type(filename):
+                continue
+            self._pending_files.append([new_file_path, self._get_file_size(new_file_path), time.time()])
+
+    def _release_complete_files(self):
         """
-        Checks whether a file is used by other processes.
+        Moves files whose size did not change for check_interval into the queue of ready files. The order is kept,
+        i.e. a file is only released if all files found before it are complete.
         """
-        # since it is hard to ask the operating system for this directly, the change in file size is checked.
-        size1 = os.stat(path).st_size
-        time.sleep(0.10)
-        size2 = os.stat(path).st_size
+        released = False
+        while self._pending_files:
+            path, size, check_time = self._pending_files[0]
+            new_size = self._get_file_size(path)
+            if new_size is None:  # file was removed in the meantime
+                self._pending_files.pop(0)
+            elif new_size != size:
+                self._pending_files[0] = [path, new_size, time.time()]
+                break
+            elif time.time() - check_time < self.check_interval:
+                break
+            else:
+                self._pending_files.pop(0)
+                self._add_ready_file(path)
+                released = True
+
+        if released:
+            self._file_ready.emit()
 
-        return size1 == size2
+    def _add_ready_file(self, path):
+        if self.queue_policy == 'latest':
+            self._ready_files.clear()
+        self._ready_files.append(path)
+        while len(self._ready_files) > self.max_queue_size:
+            self._ready_files.popleft()
 
-    def _file_changed(self, path):
+    def _process_ready_files(self):
         """
-        internal function callback for the file_changed_watcher. The watcher is invoked if a new file is detected but
-        the file is still below 100 bytes (basically only the file handle created, and no data yet). The _file_changed
-        callback function is then invoked when the data is completely written into the file. To ensure that everything
-        is correct this function also checks whether the file is above 100 byte after the system sends a file changed
-        signal.
-        :param path: file path of the watched file
+        Emits the file_added signal for the next ready file. If more files are waiting, this is scheduled again for
+        the next event loop iteration, so that the GUI stays responsive and new files can still be queued (or
+        dropped) in the meantime.
         """
-        if self._file_closed(path):
-            self.file_added.emit(path)
-            self._file_changed_watcher.removePath(path)
+        with self._lock:
+            if not self._ready_files:
+                return
+            path = self._ready_files.popleft()
+            files_left = len(self._ready_files) > 0
+        self.file_added.emit(path)
+        if files_left:
+            QtCore.QTimer.singleShot(0, self._process_ready_files)
+
+    def _valid_file_type(self, filename):
+        for file_type in self.file_types:
+            if filename.endswith(file_type):
+                return True
+        return False
+
+    @staticmethod
+    def _get_file_size(path):
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return None
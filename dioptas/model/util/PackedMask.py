@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Bit-packed storage of boolean masks (one bit instead of one byte per pixel) for mask files and projects.
+"""
+
+import hashlib
+
+import h5py
+import numpy as np
+
+packed_mask_file_endings = ('.h5', '.hdf5')
+
+
+def pack_mask(mask):
+    """
+    :param mask: mask array, all non-zero values are masked
+    :return: flat uint8 array with 8 pixels per byte
+    """
+    return np.packbits(np.asarray(mask, dtype=bool), axis=None)
+
+
+def unpack_mask(packed_mask, shape):
+    """
+    :param packed_mask: flat uint8 array returned by pack_mask
+    :param shape: shape of the mask
+    :return: boolean mask array
+    """
+    count = int(np.prod(shape))
+    return np.unpackbits(np.asarray(packed_mask, dtype=np.uint8), count=count).view(bool).reshape(shape)
+
+
+def write_mask_dataset(group, name, mask, shared_group=None):
+    """
+    Writes a mask bit-packed and compressed into an hdf5 group.
+    :param group: h5py.Group
+    :param name: name of the dataset
+    :param mask: mask array
+    :param shared_group: optional h5py.Group of the same file where the mask data is stored instead, the dataset in
+                         group is then a link to it. Identical masks are only stored once in the shared group.
+    :return: the written h5py.Dataset
+    """
+    mask = np.asarray(mask, dtype=bool)
+    packed_mask = pack_mask(mask)
+
+    if shared_group is not None:
+        digest = hashlib.sha1(packed_mask.tobytes() + str(mask.shape).encode()).hexdigest()
+        if digest not in shared_group:
+            _create_mask_dataset(shared_group, digest, packed_mask, mask.shape)
+        group[name] = shared_group[digest]
+        return group[name]
+    return _create_mask_dataset(group, name, packed_mask, mask.shape)
+
+
+def _create_mask_dataset(group, name, packed_mask, shape):
+    dataset = group.create_dataset(name, data=packed_mask, compression='gzip', compression_opts=4)
+    dataset.attrs['shape'] = shape
+    return dataset
+
+
+def read_mask_dataset(dataset):
+    """
+    Reads a mask written by write_mask_dataset.
+    :param dataset: h5py.Dataset
+    :return: boolean mask array
+    """
+    return unpack_mask(dataset[...], tuple(dataset.attrs['shape']))
+
+
+def save_mask_file(filename, mask):
+    """
+    Saves a mask into a compressed hdf5 file.
+    """
+    with h5py.File(filename, 'w') as f:
+        write_mask_dataset(f, 'mask', mask)
+
+
+def load_mask_file(filename):
+    """
+    Loads a mask saved by save_mask_file.
+    :return: boolean mask array
+    :raises ValueError: if the file does not contain a packed mask
+    """
+    with h5py.File(filename, 'r') as f:
+        dataset = f.get('mask')
+        if not isinstance(dataset, h5py.Dataset) or 'shape' not in dataset.attrs:
+            raise ValueError("{0} does not contain a packed mask".format(filename))
+        return read_mask_dataset(dataset)
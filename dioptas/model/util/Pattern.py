@@ -26,7 +26,8 @@ import numpy as np
 from scipy.interpolate import interp1d
 from scipy.ndimage import gaussian_filter1d
 
-from . import extract_background
+from .BackgroundExtraction import BackgroundCache
+from .PatternFile import binary_pattern_file_endings, read_binary_pattern, write_binary_pattern
 
 logger = logging.getLogger(__name__)
 
@@ -61,15 +62,20 @@ class Pattern(QtCore.QObject):
 
         self._auto_background_before_subtraction_pattern = None
         self._auto_background_pattern = None
+        self._auto_background_cache = BackgroundCache()
 
     def load(self, filename, skiprows=0):
         try:
-            if filename.endswith('.chi'):
-                skiprows = 4
-            data = np.loadtxt(filename, skiprows=skiprows)
+            if filename.endswith(binary_pattern_file_endings):
+                x, y, _ = read_binary_pattern(filename)
+            else:
+                if filename.endswith('.chi'):
+                    skiprows = 4
+                data = np.loadtxt(filename, skiprows=skiprows)
+                x, y = data.T[0], data.T[1]
             self.filename = filename
-            self._original_x = data.T[0]
-            self._original_y = data.T[1]
+            self._original_x = x
+            self._original_y = y
             self.name = os.path.basename(filename).split('.')[:-1][0]
             self.recalculate_pattern()
 
@@ -78,6 +84,9 @@ class Pattern(QtCore.QObject):
             return -1
 
     def save(self, filename, header=''):
+        if filename.endswith(binary_pattern_file_endings):
+            write_binary_pattern(filename, self._original_x, self._original_y, header)
+            return
         data = np.dstack((self._original_x, self._original_y))
         np.savetxt(filename, data[0], header=header)
 
@@ -162,10 +171,10 @@ class Pattern(QtCore.QObject):
             if self.auto_background_subtraction_roi[1]>x_max:
                 self.auto_background_subtraction_roi[1]=x_max
 
-            y_bkg = extract_background(x, y,
-                                       self.auto_background_subtraction_parameters[0],
-                                       self.auto_background_subtraction_parameters[1],
-                                       self.auto_background_subtraction_parameters[2])
+            y_bkg = self._auto_background_cache.extract_background(x, y,
+                                                                   self.auto_background_subtraction_parameters[0],
+                                                                   self.auto_background_subtraction_parameters[1],
+                                                                   self.auto_background_subtraction_parameters[2])
             self._auto_background_pattern = Pattern(x, y_bkg, name='auto_bg_' + self.name)
             y -= y_bkg
 
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from .Pattern import Pattern
+
+
+class PatternCombiner(object):
+    """
+    Combines patterns with different x ranges (e.g. from several detector positions) into one pattern.
+
+    The combined pattern uses the x values of the pattern starting at the lowest x and is extended by the x values of
+    the following patterns beyond its end. Where patterns overlap, the y values are averaged with weights which
+    decrease linearly towards the ends of each pattern, so that there are no steps at the borders of the overlap.
+
+    The result is kept until the data of one of the patterns changes, repeated calls with unchanged patterns return the
+    same combined pattern.
+    """
+
+    def __init__(self):
+        self._pattern_data = []
+        self._combined_pattern = None
+
+    def combine(self, patterns):
+        """
+        :param patterns: list of Pattern objects, x values have to be ascending
+        :return: combined Pattern
+        """
+        pattern_data = [(pattern.x, pattern.y) for pattern in patterns]
+        if self._combined_pattern is None or not self._is_same_data(pattern_data):
+            self._combined_pattern = Pattern(*combine_pattern_data(pattern_data), name="Combined Pattern")
+            self._pattern_data = pattern_data
+        return self._combined_pattern
+
+    def reset(self):
+        self._pattern_data = []
+        self._combined_pattern = None
+
+    def _is_same_data(self, pattern_data):
+        # a Pattern replaces its x and y arrays whenever it is recalculated, so comparing the identity of the arrays
+        # is enough to detect changes. The cached arrays are referenced, so their ids can not be reused.
+        if len(pattern_data) != len(self._pattern_data):
+            return False
+        for (x, y), (cached_x, cached_y) in zip(pattern_data, self._pattern_data):
+            if x is not cached_x or y is not cached_y:
+                return False
+        return True
+
+
+def combine_pattern_data(pattern_data):
+    """
+    Combines the data of several patterns, see PatternCombiner.
+    :param pattern_data: list of (x, y) tuples with ascending x values
+    :return: x, y of the combined pattern
+    """
+    pattern_data = [(np.asarray(x), np.asarray(y)) for x, y in pattern_data if len(x) > 0]
+    if len(pattern_data) == 0:
+        return np.array([]), np.array([])
+    pattern_data.sort(key=lambda data: data[0][0])
+
+    combined_x = [pattern_data[0][0]]
+    x_max = pattern_data[0][0][-1]
+    for x, _ in pattern_data[1:]:
+        if x[-1] > x_max:
+            combined_x.append(x[x > x_max])
+            x_max = x[-1]
+    combined_x = np.concatenate(combined_x)
+
+    summed_y = np.zeros(combined_x.shape)
+    summed_weights = np.zeros(combined_x.shape)
+    for x, y in pattern_data:
+        weights = get_overlap_weights(x, combined_x)
+        summed_y += weights * np.interp(combined_x, x, y)
+        summed_weights += weights
+    return combined_x, summed_y / summed_weights
+
+
+def get_overlap_weights(x, grid):
+    """
+    Calculates the weights of a pattern at the grid positions. They are proportional to the distance to the closer
+    end of the pattern and zero outside of it. A small offset ensures a non-zero weight for the first and last point.
+    """
+    x_min, x_max = x[0], x[-1]
+    inside = (grid >= x_min) & (grid <= x_max)
+    distance = np.minimum(grid - x_min, x_max - grid)
+    offset = max(x_max - x_min, 1) * 1e-6
+    return np.where(inside, distance + offset, 0)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Reading and writing of pattern files. The text formats are written with one string formatting operation for all
+points, which is much faster than formatting and writing every point separately and gives the same output.
+"""
+
+import h5py
+import numpy as np
+
+binary_pattern_file_endings = ('.h5', '.hdf5')
+
+
+def format_columns(row_format, *columns):
+    """
+    Formats the columns with a printf style format for a single row (e.g. '%.9E  %.9E\n').
+    :return: string with all rows
+    """
+    num_rows = len(columns[0])
+    if num_rows == 0:
+        return ''
+    values = np.column_stack([np.asarray(column) for column in columns]).ravel().tolist()
+    return (row_format * num_rows) % tuple(values)
+
+
+def write_pattern(filename, x, y, header=None, unit=''):
+    """
+    Writes a pattern, the format depends on the file ending:
+        .chi - fit2d chi format, a header with filename and unit is created if no header is given
+        .fxye - GSAS format, NUM_POINTS, MIN_X_VAL and STEP_X_VAL in the header are replaced by the actual values
+        .h5, .hdf5 - binary HDF5 file with x and y datasets, the header and unit are stored as attributes
+        everything else - two column text file with an optional header
+    :param filename: path of the file
+    :param x: x values
+    :param y: y values
+    :param header: header string
+    :param unit: unit of the x values
+    """
+    if filename.endswith(binary_pattern_file_endings):
+        write_binary_pattern(filename, x, y, header, unit)
+        return
+
+    num_points = len(x)
+    with open(filename, 'w') as file_handle:
+        if filename.endswith('.chi'):
+            if header is None or header == '':
+                file_handle.write(filename + '\n')
+                file_handle.write(unit + '\n\n')
+                file_handle.write("       {0}\n".format(num_points))
+            else:
+                file_handle.write(header)
+            file_handle.write(format_columns(' %.7E  %.7E\n', x, y))
+        elif filename.endswith('.fxye'):
+            if header is None:
+                header = ''
+            factor = 100
+            if 'CONQ' in header:
+                factor = 1
+            header = header.replace('NUM_POINTS', '{0:.6g}'.format(num_points))
+            header = header.replace('MIN_X_VAL', '{0:.6g}'.format(factor * x[0]))
+            header = header.replace('STEP_X_VAL', '{0:.6g}'.format(factor * (x[1] - x[0])))
+
+            file_handle.write(header)
+            file_handle.write('\n')
+            y = np.asarray(y)
+            y_error = np.sqrt(np.abs(y).astype(np.float64))
+            file_handle.write(format_columns('\t%.6g\t%.6g\t%.6g\n', factor * np.asarray(x), y, y_error))
+        else:
+            if header is not None:
+                file_handle.write(header)
+                file_handle.write('\n')
+            file_handle.write(format_columns('%.9E  %.9E\n', x, y))
+
+
+def write_binary_pattern(filename, x, y, header=None, unit=''):
+    """
+    Writes a pattern into an HDF5 file with the datasets x and y.
+    """
+    with h5py.File(filename, 'w') as f:
+        f.create_dataset('x', data=np.asarray(x, dtype=np.float64))
+        f.create_dataset('y', data=np.asarray(y, dtype=np.float64))
+        f.attrs['header'] = header if header is not None else ''
+        f.attrs['unit'] = unit
+
+
+def read_binary_pattern(filename):
+    """
+    Reads a pattern written by write_binary_pattern.
+    :return: x, y, unit
+    """
+    try:
+        with h5py.File(filename, 'r') as f:
+            x = f['x'][()]
+            y = f['y'][()]
+            unit = f.attrs.get('unit', '')
+    except (OSError, KeyError) as e:
+        raise ValueError("{0} is not a binary pattern file: {1}".format(filename, e))
+    if isinstance(unit, bytes):
+        unit = unit.decode()
+    return x, y, str(unit)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .RingPixelIndex import get_geometry_key
+
+
+class PixelLookup(object):
+    """
+    Finds the pixel position of given two theta and azimuth values, i.e. the inverse of the two theta and chi arrays
+    of a pyFAI geometry. The values are calculated on a coarse grid of pixels, which is cached for every geometry,
+    and the nearest grid point is refined with a few Newton steps using the two theta and chi functions of the
+    geometry. This works for all geometries pyFAI supports, including distortion corrections.
+
+    To avoid the discontinuity of the azimuth at +-pi and its singularity at the beam center, the position is solved
+    for the cartesian coordinates (tth * cos(azi), tth * sin(azi)).
+    """
+
+    def __init__(self, grid_size=64, max_iterations=20, tolerance=1e-6):
+        """
+        :param grid_size: number of grid points along each axis of the image
+        :param max_iterations: maximum number of Newton steps
+        :param tolerance: position accuracy in pixels
+        """
+        self.grid_size = grid_size
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+
+        self._grid_key = None
+        self._grid_positions = None
+        self._grid_tree = None
+
+    def get_pixel_position(self, geometry, shape, tth, azi):
+        """
+        :param geometry: pyFAI geometry
+        :param shape: shape of the image
+        :param tth: two theta in radians
+        :param azi: azimuth in radians
+        :return: tuple of the (fractional) pixel indices along the first and second axis or None if the position is
+                 not on the image
+        """
+        position = self.get_pixel_positions(geometry, shape, [tth], [azi])[0]
+        if np.any(np.isnan(position)):
+            return None
+        return position[0], position[1]
+
+    def get_pixel_positions(self, geometry, shape, tth, azi):
+        """
+        Vectorized version of get_pixel_position.
+        :param tth: array of two theta values in radians
+        :param azi: array of azimuth values in radians
+        :return: array with the shape (n, 2) of the pixel indices along the first and second axis, positions which
+                 are not on the image are NaN
+        """
+        tth = np.asarray(tth, dtype=np.float64)
+        azi = np.asarray(azi, dtype=np.float64)
+        targets = np.stack([tth * np.cos(azi), tth * np.sin(azi)], axis=1)
+
+        grid_positions, grid_tree = self._get_grid(geometry, shape)
+        positions = grid_positions[grid_tree.query(targets)[1]]
+        positions = self._refine(geometry, positions, targets)
+
+        outside = np.any((positions < -0.5) | (positions > np.array(shape) - 0.5), axis=1)
+        positions[outside] = np.nan
+        return positions
+
+    def get_ring_segments(self, geometry, shape, tth, num_points=1440):
+        """
+        Calculates the line of constant two theta on the image by sampling the azimuth.
+        :param geometry: pyFAI geometry
+        :param shape: shape of the image
+        :param tth: two theta in radians
+        :param num_points: number of azimuth samples of the full ring
+        :return: list of arrays with the shape (n, 2) of pixel indices, one array for every continuous part of the
+                 ring on the image
+        """
+        azi = np.linspace(-np.pi, np.pi, num_points, endpoint=False)
+        positions = self.get_pixel_positions(geometry, shape, np.full(num_points, tth), azi)
+        return get_continuous_segments(positions)
+
+    def _refine(self, geometry, positions, targets):
+        """
+        Newton iteration of the positions until the cartesian values match the targets. The Jacobian is calculated
+        with finite differences, so that every step needs only one evaluation of the geometry for all positions.
+        Positions which do not converge are set to NaN.
+        """
+        step = 0.5
+        offsets = np.array([[0, 0], [step, 0], [0, step]])
+        active = np.arange(len(positions))
+        positions = positions.astype(np.float64)
+        for _ in range(self.max_iterations):
+            values = get_cartesian_values(geometry, (positions[active, None, :] + offsets).reshape(-1, 2))
+            values = values.reshape(-1, 3, 2)
+            jacobian = (values[:, 1:] - values[:, :1]) / step  # jacobian[:, j] is the derivative along axis j
+            residual = targets[active] - values[:, 0]
+
+            det = jacobian[:, 0, 0] * jacobian[:, 1, 1] - jacobian[:, 1, 0] * jacobian[:, 0, 1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                delta = np.stack([jacobian[:, 1, 1] * residual[:, 0] - jacobian[:, 1, 0] * residual[:, 1],
+                                  jacobian[:, 0, 0] * residual[:, 1] - jacobian[:, 0, 1] * residual[:, 0]],
+                                 axis=1) / det[:, None]
+            positions[active] += delta
+
+            converged = np.max(np.abs(delta), axis=1) < self.tolerance
+            diverged = ~np.all(np.isfinite(delta), axis=1)
+            positions[active[diverged]] = np.nan
+            active = active[~(converged | diverged)]
+            if len(active) == 0:
+                break
+        positions[active] = np.nan
+        return positions
+
+    def _get_grid(self, geometry, shape):
+        key = (get_geometry_key(geometry), tuple(shape))
+        if key != self._grid_key:
+            ind1 = np.linspace(0, shape[0] - 1, min(self.grid_size, shape[0]))
+            ind2 = np.linspace(0, shape[1] - 1, min(self.grid_size, shape[1]))
+            grid_positions = np.stack([axis.ravel() for axis in np.meshgrid(ind1, ind2, indexing='ij')], axis=1)
+            self._grid_tree = cKDTree(get_cartesian_values(geometry, grid_positions))
+            self._grid_positions = grid_positions
+            self._grid_key = key
+        return self._grid_positions, self._grid_tree
+
+
+def get_cartesian_values(geometry, positions):
+    """
+    :param positions: array of pixel positions with the shape (n, 2)
+    :return: array with the shape (n, 2) of (tth * cos(chi), tth * sin(chi)) at the positions
+    """
+    tth = geometry.tth(positions[:, 0], positions[:, 1])
+    chi = geometry.chi(positions[:, 0], positions[:, 1])
+    return np.stack([tth * np.cos(chi), tth * np.sin(chi)], axis=1)
+
+
+def get_continuous_segments(positions):
+    """
+    Splits a closed line of positions at the NaN entries.
+    :param positions: array with the shape (n, 2), the last position is connected to the first one
+    :return: list of arrays with the continuous parts of the line, parts with a single position are dropped
+    """
+    valid = ~np.any(np.isnan(positions), axis=1)
+    if np.all(valid):
+        return [np.concatenate((positions, positions[:1]))]
+    if not np.any(valid):
+        return []
+
+    # start at an invalid position, so that no segment wraps around the end of the array
+    positions = np.roll(positions, -np.argmin(valid), axis=0)
+    valid = np.roll(valid, -np.argmin(valid))
+    edges = np.flatnonzero(np.diff(valid.astype(np.int8)))
+    starts = edges[::2] + 1
+    ends = edges[1::2] + 1 if len(edges) % 2 == 0 else np.append(edges[1::2] + 1, len(valid))
+    return [positions[start:end] for start, end in zip(starts, ends) if end - start > 1]
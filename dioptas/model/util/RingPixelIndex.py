@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
+
+
+class RingPixelIndex(object):
+    """
+    Finds the pixels of a detector within a two theta range (a ring). The pixels are sorted once by their two theta
+    value in a reference geometry, so that for every ring only the pixels in the two theta range of the ring, widened
+    by how much the geometry changed since, have to be looked at. The exact two theta values are only calculated for
+    these pixels. When the geometry moves further away from the reference than the width of the searched ring, the
+    index is rebuilt with the current geometry.
+    """
+
+    def __init__(self, grid_step=32):
+        """
+        :param grid_step: spacing in pixels of the grid on which the change of the geometry is estimated
+        """
+        self.grid_step = grid_step
+
+        self._shape = None
+        self._order = None  # flat pixel indices sorted by two theta of the reference geometry
+        self._sorted_tth = None
+        self._grid = None
+        self._grid_tth = None
+        self._margin_key = None
+        self._margin = None
+
+    def get_ring_pixels(self, geometry, shape, tth, delta_tth):
+        """
+        :param geometry: pyFAI geometry
+        :param shape: shape of the image
+        :param tth: two theta of the ring in radians
+        :param delta_tth: maximum deviation from tth in radians
+        :return: sorted flat indices of the pixels with abs(two theta - tth) <= delta_tth
+        """
+        shape = tuple(shape)
+        margin = self._get_margin(geometry, shape)
+        if margin is None or margin > delta_tth:
+            self._build(geometry, shape)
+            margin = self._margin
+
+        start = np.searchsorted(self._sorted_tth, tth - delta_tth - margin, side='left')
+        stop = np.searchsorted(self._sorted_tth, tth + delta_tth + margin, side='right')
+        candidates = np.sort(self._order[start:stop])
+
+        rows, cols = np.divmod(candidates, shape[1])
+        # float32 pixel coordinates give the same values as geometry.twoThetaArray
+        candidates_tth = geometry.tth(rows.astype(np.float32), cols.astype(np.float32))
+        return candidates[np.abs(candidates_tth - tth) <= delta_tth]
+
+    def reset(self):
+        self._shape = None
+        self._order = None
+        self._sorted_tth = None
+        self._grid = None
+        self._grid_tth = None
+        self._margin_key = None
+        self._margin = None
+
+    def _build(self, geometry, shape):
+        tth_array = np.fromfunction(geometry.tth, shape, dtype=np.float32)
+        tth_flat = tth_array.ravel().astype(np.float32)
+        self._order = np.argsort(tth_flat).astype(np.int32 if tth_flat.size < 2 ** 31 else np.int64)
+        self._sorted_tth = tth_flat[self._order]
+        self._shape = shape
+
+        rows = np.unique(np.append(np.arange(0, shape[0], self.grid_step), shape[0] - 1))
+        cols = np.unique(np.append(np.arange(0, shape[1], self.grid_step), shape[1] - 1))
+        self._grid = np.meshgrid(rows.astype(np.float32), cols.astype(np.float32), indexing='ij')
+        self._grid_tth = tth_array[np.ix_(rows, cols)]
+
+        # two theta is stored with single precision
+        self._margin = 1e-6
+        self._margin_key = get_geometry_key(geometry)
+
+    def _get_margin(self, geometry, shape):
+        """
+        Estimates how far the two theta values of the pixels moved from the reference geometry.
+        :return: margin in radians or None if there is no index for the shape
+        """
+        if self._order is None or shape != self._shape:
+            return None
+        key = get_geometry_key(geometry)
+        if key != self._margin_key:
+            grid_tth = geometry.tth(*self._grid)
+            # the maximum deviation between the grid points can be somewhat larger than on the grid
+            self._margin = 2 * np.max(np.abs(grid_tth - self._grid_tth)) + 1e-6
+            self._margin_key = key
+        return self._margin
+
+
+def get_geometry_key(geometry):
+    """
+    :return: tuple of the parameters of a pyFAI geometry which change the two theta values of the pixels
+    """
+    return (geometry.dist, geometry.poni1, geometry.poni2, geometry.rot1, geometry.rot2, geometry.rot3,
+            geometry.pixel1, geometry.pixel2, get_spline_filename(geometry.detector))
+
+
+def get_spline_filename(detector):
+    """
+    :return: filename of the distortion spline of a pyFAI detector or None. Newer pyFAI versions log a deprecation
+             warning for every access of the old splineFile attribute, it is only used if splinefile does not exist.
+    """
+    if hasattr(type(detector), 'splinefile'):
+        return detector.splinefile
+    return getattr(detector, 'splineFile', None)
@@ -21,14 +21,11 @@
 from __future__ import division, unicode_literals
 
 import os
-import itertools
 try:
     from urllib import pathname2url
 except ImportError:
     from urllib.request import pathname2url
 
-from math import degrees
-
 from CifFile import ReadCif
 from .jcpds import jcpds
 from ... import data_path
@@ -84,8 +81,8 @@ class CifConverter(object):
         :return: converted jcpds object
         :rtype: jcpds
         """
-        reflections = self._calculate_hkl_within_sphere_and_min_d_spacing(cif_phase)
-        xrd_reflections = self._calculate_reflection_intensities(cif_phase, reflections)
+        hkl, d_hkl, multiplicities = self._calculate_hkl_within_sphere_and_min_d_spacing(cif_phase)
+        xrd_reflections = self._calculate_reflection_intensities(cif_phase, hkl, d_hkl, multiplicities)
         jcpds_phase = self._create_jcpds_from_cif_parameters(cif_phase)
 
         for reflection in xrd_reflections:
@@ -120,112 +117,75 @@ class CifConverter(object):
 
     def _calculate_hkl_within_sphere_and_min_d_spacing(self, cif_phase):
         """
-        Generates a list of hkl reflections which can satisfy the diffraction condition using the given wavelength and
-        also the minimum d spacing
-        :return: list of reflections
-        :rtype: list[Reflection]
+        Generates the hkl reflections which can satisfy the diffraction condition using the given wavelength and
+        also the minimum d spacing. Reflections which are equivalent by the Laue symmetry of the phase are only
+        given once, represented by the largest hkl (in lexicographic order) of the equivalent ones.
+        :return: tuple of an integer array of hkl (shape (n, 3)), the d spacings and the multiplicities
         """
-        max_h = np.floor(2 * cif_phase.a / self.wavelength)
-        max_k = np.floor(2 * cif_phase.b / self.wavelength)
-        max_l = np.floor(2 * cif_phase.c / self.wavelength)
+        min_d_spacing = max(self.min_d_spacing, 0.5 * self.wavelength)
 
-        h = reversed(np.arange(-max_h + 1, max_h, 1))
-        k = reversed(np.arange(-max_k + 1, max_k, 1))
-        l = reversed(np.arange(-max_l + 1, max_l, 1))
-        s = [h, k, l]
+        # |h| <= |a| / d holds for every reflection with the d spacing d
+        max_h = int(np.floor(cif_phase.a / min_d_spacing))
+        max_k = int(np.floor(cif_phase.b / min_d_spacing))
+        max_l = int(np.floor(cif_phase.c / min_d_spacing))
 
-        reciprocal_hkl = np.array(list(itertools.product(*s)))
-        h = reciprocal_hkl[:, 0]
-        k = reciprocal_hkl[:, 1]
-        l = reciprocal_hkl[:, 2]
+        h, k, l = np.meshgrid(np.arange(-max_h, max_h + 1), np.arange(-max_k, max_k + 1),
+                              np.arange(-max_l, max_l + 1), indexing='ij')
+        hkl = np.stack((h.ravel(), k.ravel(), l.ravel()), axis=1)
+        hkl = hkl[np.any(hkl != 0, axis=1)]
 
-        d_hkl = compute_d_hkl(h, k, l, cif_phase)
-        good_indices = np.argwhere(d_hkl > self.min_d_spacing)
+        d_hkl = compute_d_hkl(hkl[:, 0], hkl[:, 1], hkl[:, 2], cif_phase)
+        in_sphere = (d_hkl > self.min_d_spacing) & (d_hkl >= 0.5 * self.wavelength)
+        hkl = hkl[in_sphere]
 
-        reflections = []
-        for i in good_indices:
-            reflections.append(Reflection(int(h[i][0]), int(k[i][0]), int(l[i][0]), d_hkl[i][0]))
+        laue_group = get_laue_group(cif_phase)
+        if not is_metric_invariant(laue_group, hkl, cif_phase):
+            laue_group = get_laue_group(None)
 
-        return reflections
+        unique_keys, multiplicities = np.unique(get_orbit_keys(hkl, laue_group), return_counts=True)
+        unique_hkl = decode_hkl(unique_keys)
+        d_hkl = compute_d_hkl(unique_hkl[:, 0], unique_hkl[:, 1], unique_hkl[:, 2], cif_phase)
+        return unique_hkl, d_hkl, multiplicities
 
-    def _calculate_reflection_intensities(self, cif_phase, base_reflections):
+    def _calculate_reflection_intensities(self, cif_phase, hkl, d_hkl, multiplicities):
         """
+        Calculates the intensities of symmetry unique reflections, reflections with the same two theta are merged.
         :param cif_phase:
-        :param base_reflections:
-        :return:
+        :param hkl: integer array of hkl with the shape (n, 3)
+        :param d_hkl: d spacings of the reflections
+        :param multiplicities: number of equivalent reflections of each hkl
+        :return: list of reflections sorted by two theta
+        :rtype: list[Reflection]
         """
-        # provide atom parameters as lists
-        atom_numbers = []
-        form_coefficients = []
-        fractional_coordinates = []
-        occupancies = []
-        for atom in cif_phase.atoms:
-            atom_numbers.append(PERIODIC_TABLE[atom[0]]['Atomic no'])
-            try:
-                c = ATOMIC_SCATTERING_PARAMS[atom[0]]
-            except KeyError:
-                raise ValueError("Unable to calculate XRD pattern as "
-                                 "there is no scattering coefficients for"
-                                 " %s." % atom[0])
-            form_coefficients.append(c)
-            fractional_coordinates.append(atom[1:4])
-            occupancies.append(atom[4])
-
-        atom_numbers = np.array(atom_numbers)
-        form_coefficients = np.array(form_coefficients)
-        fractional_coordinates = np.array(fractional_coordinates)
-        occupancies = np.array(occupancies)
-
-        two_thetas = []
-        peaks = {}
-
-        for reflection in base_reflections:
-            d_hkl = reflection.d_spacing
-            g_hkl = 1. / d_hkl
-            if g_hkl != 0:
-                hkl = np.array([reflection.h, reflection.k, reflection.l])
-
-                s = g_hkl * 0.5
-                s2 = s ** 2
-
-                theta = np.arcsin(self.wavelength * g_hkl * 0.5)
-                two_theta = degrees(2 * theta)
-
-                g_dot_r = np.dot(fractional_coordinates, np.transpose([hkl])).T[0]
-
-                fs = atom_numbers - 41.78214 * s2 * np.sum(
-                    form_coefficients[:, :, 0] * np.exp(-form_coefficients[:, :, 1] * s2), axis=1)
-                f_hkl = np.sum(fs * occupancies * np.exp(2j * np.pi * g_dot_r))
-                i_hkl = (f_hkl * f_hkl.conjugate()).real
-
-                ind = np.where(np.abs(np.subtract(two_thetas, two_theta)) < CifConverter.TWO_THETA_TOL)
-
-                lorentz_factor = (1 + np.cos(2 * theta) ** 2) / (np.sin(theta) ** 2 * np.cos(theta))
-
-                if len(ind[0]) > 0:
-                    peak_ind = two_thetas[ind[0][0]]
-                    peaks[peak_ind][0] += i_hkl * lorentz_factor
-                    peaks[peak_ind][1].append(tuple(hkl))
-                else:
-                    peaks[two_theta] = [i_hkl * lorentz_factor, [tuple(hkl)], d_hkl]
-                    two_thetas.append(two_theta)
-
-        max_intensity = max([v[0] for v in peaks.values()])
+        if len(hkl) == 0:
+            return []
+
+        theta = np.arcsin(self.wavelength * 0.5 / d_hkl)
+        two_theta = np.degrees(2 * theta)
+        lorentz_factor = (1 + np.cos(2 * theta) ** 2) / (np.sin(theta) ** 2 * np.cos(theta))
+        intensities = calculate_structure_factor_intensities(cif_phase, hkl, d_hkl) * lorentz_factor * multiplicities
+
+        # reflections within TWO_THETA_TOL of their neighbor form one peak, which is labeled by its largest hkl
+        order = np.argsort(two_theta, kind='stable')
+        peak_starts = np.concatenate(([0], np.flatnonzero(np.diff(two_theta[order]) >= CifConverter.TWO_THETA_TOL)
+                                      + 1))
+        peak_intensities = np.add.reduceat(intensities[order], peak_starts)
+        keys = encode_hkl(hkl[order])
+        peak_ends = np.append(peak_starts[1:], len(order))
+        label_indices = [order[start + np.argmax(keys[start:end])] for start, end in zip(peak_starts, peak_ends)]
+
+        scaled_intensities = peak_intensities / np.max(peak_intensities) * 100
         calculated_reflections = []
-        for k in sorted(peaks.keys()):
-            v = peaks[k]
-            scaled_intensity = v[0] / max_intensity * 100
-            fam = get_unique_families(v[1])
+        for ind, scaled_intensity in zip(label_indices, scaled_intensities):
             if scaled_intensity > self.min_intensity:
                 calculated_reflections.append(
                     Reflection(
-                        *list(fam.keys())[0],
-                        d_spacing=v[2],
+                        int(hkl[ind, 0]), int(hkl[ind, 1]), int(hkl[ind, 2]),
+                        d_spacing=d_hkl[ind],
                         intensity=scaled_intensity,
-                        multiplicity=fam[list(fam.keys())[0]]
+                        multiplicity=int(multiplicities[ind])
                     )
                 )
-
         return calculated_reflections
 
 
@@ -291,36 +251,144 @@ def compute_d_hkl(h, k, l, cif_phase):
     return d_spacings
 
 
-def get_unique_families(hkls):
+def calculate_structure_factor_intensities(cif_phase, hkl, d_hkl, chunk_size=2 ** 20):
+    """
+    Calculates |F(hkl)|^2 for all reflections. The phases of all reflections and atoms are calculated as one matrix
+    product, split into chunks of about chunk_size elements to limit the memory usage.
+    :param cif_phase:
+    :param hkl: integer array of hkl with the shape (n, 3)
+    :param d_hkl: d spacings of the reflections
+    :return: array of intensities
+    """
+    elements = sorted(set(atom[0] for atom in cif_phase.atoms))
+    atom_numbers = []
+    form_coefficients = []
+    for element in elements:
+        atom_numbers.append(PERIODIC_TABLE[element]['Atomic no'])
+        try:
+            form_coefficients.append(ATOMIC_SCATTERING_PARAMS[element])
+        except KeyError:
+            raise ValueError("Unable to calculate XRD pattern as "
+                             "there is no scattering coefficients for"
+                             " %s." % element)
+    atom_numbers = np.array(atom_numbers, dtype=np.float64)
+    form_coefficients = np.array(form_coefficients, dtype=np.float64)
+
+    element_indices = np.array([elements.index(atom[0]) for atom in cif_phase.atoms])
+    fractional_coordinates = np.array([atom[1:4] for atom in cif_phase.atoms], dtype=np.float64)
+    occupancies = np.array([atom[4] for atom in cif_phase.atoms], dtype=np.float64)
+
+    s2 = (0.5 / d_hkl) ** 2
+    intensities = np.empty(len(hkl))
+    chunk_length = max(1, chunk_size // max(1, len(fractional_coordinates)))
+    for start in range(0, len(hkl), chunk_length):
+        chunk = slice(start, start + chunk_length)
+        chunk_s2 = s2[chunk, None, None]
+        # form factors of the elements, shape (reflections, elements)
+        form_factors = atom_numbers - 41.78214 * chunk_s2[:, :, 0] * np.sum(
+            form_coefficients[:, :, 0] * np.exp(-form_coefficients[:, :, 1] * chunk_s2), axis=2)
+        phases = np.exp(2j * np.pi * np.dot(hkl[chunk], fractional_coordinates.T))
+        f_hkl = np.sum(form_factors[:, element_indices] * occupancies * phases, axis=1)
+        intensities[chunk] = (f_hkl * f_hkl.conjugate()).real
+    return intensities
+
+
+def get_laue_group(cif_phase):
+    """
+    Creates the rotations of the Laue group acting on hkl from the symmetry operations of a phase, i.e. the point
+    group of the symmetry operations combined with the inversion (Friedel's law).
+    :param cif_phase: CifPhase or None for only using the inversion
+    :return: integer array with the shape (n, 3, 3), a reflection hkl is equivalent to all np.dot(matrix, hkl)
+    """
+    group = {tuple(np.eye(3, dtype=int).ravel()), tuple(-np.eye(3, dtype=int).ravel())}
+    if cif_phase is not None:
+        try:
+            for op in cif_phase.symmetry_operations:
+                rotation = get_rotation_matrix(op)
+                if rotation is None:
+                    return get_laue_group(None)
+                # hkl transforms with the transposed rotation of the fractional coordinates
+                group.add(tuple(rotation.T.ravel()))
+        except AttributeError:
+            pass
+
+    # close the group under multiplication, a crystallographic Laue group has at most 48 elements
+    matrices = [np.array(element).reshape(3, 3) for element in group]
+    while True:
+        new_elements = set()
+        for m1 in matrices:
+            for m2 in matrices:
+                product = tuple(np.dot(m1, m2).ravel())
+                if product not in group:
+                    new_elements.add(product)
+        if not new_elements:
+            break
+        group.update(new_elements)
+        if len(group) > 48:
+            return get_laue_group(None)
+        matrices = [np.array(element).reshape(3, 3) for element in group]
+    return np.array(matrices)
+
+
+def get_rotation_matrix(symmetry_operation):
+    """
+    :param symmetry_operation: symmetry operation string as in the cif file (e.g. '-y, x-y, z+1./3')
+    :return: integer rotation matrix of the operation on fractional coordinates or None if it can not be evaluated
     """
-    Returns unique families of Miller indices. Families must be permutations
-    of each other.
+    try:
+        origin = np.array(eval(symmetry_operation, {}, {'x': 0., 'y': 0., 'z': 0.}), dtype=np.float64)
+        rotation = np.empty((3, 3))
+        for ind, (x, y, z) in enumerate(np.eye(3)):
+            rotation[:, ind] = np.array(eval(symmetry_operation, {}, {'x': x, 'y': y, 'z': z})) - origin
+    except Exception:
+        return None
+    if not np.allclose(rotation, np.round(rotation)):
+        return None
+    return np.round(rotation).astype(int)
+
+
+def is_metric_invariant(laue_group, hkl, cif_phase, num_samples=1000):
+    """
+    Checks on a sample of reflections that the Laue group operations keep the d spacing, otherwise the symmetry
+    operations do not fit to the cell of the phase.
+    """
+    sample = hkl[::max(1, len(hkl) // num_samples)]
+    if len(sample) == 0:
+        return True
+    d_hkl = compute_d_hkl(sample[:, 0], sample[:, 1], sample[:, 2], cif_phase)
+    for matrix in laue_group:
+        equivalent = np.dot(sample, matrix.T)
+        d_equivalent = compute_d_hkl(equivalent[:, 0], equivalent[:, 1], equivalent[:, 2], cif_phase)
+        if not np.allclose(d_equivalent, d_hkl, rtol=1e-6):
+            return False
+    return True
 
-    Args:
-        hkls ([h, k, l]): List of Miller indices.
 
-    Returns:
-        {hkl: multiplicity}: A dict with unique hkl and multiplicity.
+_hkl_offset = 2 ** 19
+_hkl_base = 2 ** 20
+
+
+def encode_hkl(hkl):
+    """
+    Encodes hkl into single integers which have the same (lexicographic) order as the hkl.
     """
+    hkl = np.asarray(hkl, dtype=np.int64) + _hkl_offset
+    return (hkl[:, 0] * _hkl_base + hkl[:, 1]) * _hkl_base + hkl[:, 2]
 
-    # TODO: Definitely can be sped up.
-    def is_perm(hkl1, hkl2):
-        h1 = map(abs, hkl1)
-        h2 = map(abs, hkl2)
-        return all([i == j for i, j in zip(sorted(h1), sorted(h2))])
-
-    unique = {}
-    for hkl1 in hkls:
-        found = False
-        for hkl2 in unique.keys():
-            if is_perm(hkl1, hkl2):
-                found = True
-                unique[hkl2] += 1
-                break
-        if not found:
-            unique[hkl1] = 1
-
-    return unique
+
+def decode_hkl(keys):
+    keys = np.asarray(keys, dtype=np.int64)
+    return np.stack((keys // _hkl_base ** 2, keys // _hkl_base % _hkl_base, keys % _hkl_base), axis=1) - _hkl_offset
+
+
+def get_orbit_keys(hkl, laue_group):
+    """
+    :return: encoded largest equivalent hkl for every hkl, equivalent reflections get the same key
+    """
+    keys = encode_hkl(hkl)
+    for matrix in laue_group:
+        keys = np.maximum(keys, encode_hkl(np.dot(hkl, matrix.T)))
+    return keys
 
 
 class CifPhase(object):
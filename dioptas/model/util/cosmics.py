@@ -116,7 +116,7 @@ class cosmicsimage:
         # In lacosmiciteration() we work on this guy
         self.cleanarray = self.rawarray.copy()
         # All False, no cosmics yet
-        self.mask = np.cast['bool'](np.zeros(self.rawarray.shape))
+        self.mask = np.zeros(self.rawarray.shape, dtype=bool)
 
         self.gain = gain
         self.readnoise = readnoise
@@ -166,14 +166,14 @@ class cosmicsimage:
             "Labeling mask pixels ..."
         # We morphologicaly dilate the mask to generously connect "sparse" cosmics :
         #dilstruct = np.ones((5,5))
-        dilmask = ndimage.morphology.binary_dilation(
+        dilmask = ndimage.binary_dilation(
             self.mask, structure=dilstruct, iterations=1, mask=None, output=None, border_value=0, origin=0,
             brute_force=False)
         # origin = 0 means center
-        (labels, n) = ndimage.measurements.label(dilmask)
+        (labels, n) = ndimage.label(dilmask)
         # print "Number of cosmic ray hits : %i" % n
         #tofits(labels, "labels.fits", verbose = False)
-        slicecouplelist = ndimage.measurements.find_objects(labels)
+        slicecouplelist = ndimage.find_objects(labels)
         # Now we have a huge list of couples of numpy slice objects giving a frame around each object
         # For plotting purposes, we want to transform this into the center of
         # each object.
@@ -184,7 +184,7 @@ class cosmicsimage:
                    for tup in slicecouplelist]
         # We also want to know how many pixels where affected by each cosmic ray.
         # Why ? Dunno... it's fun and available in scipy :-)
-        sizes = ndimage.measurements.sum(
+        sizes = ndimage.sum(
             self.mask.ravel(), labels.ravel(), np.arange(1, n + 1, 1))
         retdictlist = [{"name": "%i" % size, "x": center[0], "y": center[1]}
                        for (size, center) in zip(sizes, centers)]
@@ -201,11 +201,11 @@ class cosmicsimage:
         size = 3 or 5 decides how to dilate.
         """
         if size == 3:
-            dilmask = ndimage.morphology.binary_dilation(
+            dilmask = ndimage.binary_dilation(
                 self.mask, structure=growkernel, iterations=1, mask=None, output=None, border_value=0, origin=0,
                 brute_force=False)
         elif size == 5:
-            dilmask = ndimage.morphology.binary_dilation(
+            dilmask = ndimage.binary_dilation(
                 self.mask, structure=dilstruct, iterations=1, mask=None, output=None, border_value=0, origin=0,
                 brute_force=False)
         else:
@@ -242,12 +242,12 @@ class cosmicsimage:
         # print cosmicindices
 
         # We put cosmic ray pixels to np.Inf to flag them :
-        self.cleanarray[mask] = np.Inf
+        self.cleanarray[mask] = np.inf
 
         # Now we want to have a 2 pixel frame of Inf padding around our image.
         w = self.cleanarray.shape[0]
         h = self.cleanarray.shape[1]
-        padarray = np.zeros((w + 4, h + 4)) + np.Inf
+        padarray = np.zeros((w + 4, h + 4)) + np.inf
         # that copy is important, we need 2 independent arrays
         padarray[2:w + 2, 2:h + 2] = self.cleanarray.copy()
 
@@ -255,36 +255,42 @@ class cosmicsimage:
         # Now in this copy called padarray, we also put the saturated stars to
         # np.Inf, if available :
         if self.satstars is not None:
-            padarray[2:w + 2, 2:h + 2][self.satstars] = np.Inf
+            padarray[2:w + 2, 2:h + 2][self.satstars] = np.inf
             # Viva python, I tested this one, it works...
 
-        # A loop through every cosmic pixel :
-        for cosmicpos in cosmicindices:
-            x = cosmicpos[0]
-            y = cosmicpos[1]
-            # remember the shift due to the padding !
-            cutout = padarray[x:x + 5, y:y + 5].ravel()
-            # print cutout
-            # Now we have our 25 pixels, some of them are np.Inf, and we want
-            # to take the median
-            goodcutout = cutout[cutout != np.Inf]
-            # print np.alen(goodcutout)
-
-            if np.alen(goodcutout) >= 25:
+        # The 5x5 cutouts around all cosmic pixels are processed at once (in blocks to limit the memory), remember
+        # the shift due to the padding ! Sorting moves the np.inf pixels to the end of each cutout, so the median of
+        # the good pixels is in the middle of the first ngood values.
+        offsets = np.arange(5)
+        blocksize = 65536
+        for start in range(0, len(cosmicindices), blocksize):
+            block = cosmicindices[start:start + blocksize]
+            cutouts = padarray[block[:, 0, None, None] + offsets[None, :, None],
+                               block[:, 1, None, None] + offsets[None, None, :]].reshape(len(block), 25)
+            ngood = np.sum(cutouts != np.inf, axis=1)
+
+            if np.any(ngood >= 25):
                 # This never happened, but you never know ...
                 raise RuntimeError("Mega error in clean !")
-            elif np.alen(goodcutout) > 0:
-                replacementvalue = np.median(goodcutout)
-            else:
+
+            sortedcutouts = np.sort(cutouts, axis=1)
+            rows = np.arange(len(block))
+            lower = sortedcutouts[rows, np.maximum(ngood - 1, 0) // 2]
+            upper = sortedcutouts[rows, ngood // 2]
+            replacementvalues = np.where(ngood % 2 == 1, lower, (lower + upper) / 2.0)
+            # like np.median, cutouts containing nan give nan
+            replacementvalues[np.isnan(cutouts).any(axis=1)] = np.nan
+
+            if np.any(ngood == 0):
                 # i.e. no good pixels : Shit, a huge cosmic, we will have to
                 # improvise ...
                 print("OH NO, I HAVE A HUUUUUUUGE COSMIC !!!!!")
-                replacementvalue = self.guessbackgroundlevel()
+                replacementvalues[ngood == 0] = self.guessbackgroundlevel()
 
             # We update the cleanarray,
             # but measure the medians in the padarray, so to not mix things
             # up...
-            self.cleanarray[x, y] = replacementvalue
+            self.cleanarray[block[:, 0], block[:, 1]] = replacementvalues
 
         # That's it.
         if verbose:
@@ -331,7 +337,7 @@ class cosmicsimage:
 
         # We build a smoothed version of the image to look for large stars and
         # their support :
-        m5 = ndimage.filters.median_filter(
+        m5 = ndimage.median_filter(
             self.rawarray, size=5, mode='mirror')
         # We look where this is above half the satlevel
         largestruct = m5 > (self.satlevel / 2.0)
@@ -349,13 +355,13 @@ class cosmicsimage:
         # We dilate the satpixels alone, to ensure connectivity in glitchy regions and to add a safety margin around them.
         #dilstruct = np.array([[0,1,0], [1,1,1], [0,1,0]])
 
-        dilsatpixels = ndimage.morphology.binary_dilation(
+        dilsatpixels = ndimage.binary_dilation(
             satpixels, structure=dilstruct, iterations=2, mask=None, output=None, border_value=0, origin=0,
             brute_force=False)
         # It turns out it's better to think large and do 2 iterations...
 
         # We label these :
-        (dilsatlabels, nsat) = ndimage.measurements.label(dilsatpixels)
+        (dilsatlabels, nsat) = ndimage.label(dilsatpixels)
         #tofits(dilsatlabels, "test.fits")
 
         if verbose:
@@ -374,7 +380,7 @@ class cosmicsimage:
                 # we add thisisland to the mask
                 outmask = np.logical_or(outmask, thisisland)
 
-        self.satstars = np.cast['bool'](outmask)
+        self.satstars = np.asarray(outmask, dtype=bool)
 
         if verbose:
             print()
@@ -457,7 +463,7 @@ class cosmicsimage:
             "Creating noise model ..."
 
         # We build a custom noise map, so to compare the laplacian to
-        m5 = ndimage.filters.median_filter(
+        m5 = ndimage.median_filter(
             self.cleanarray, size=5, mode='mirror')
         # We keep this m5, as I will use it later for the interpolation.
         m5clipped = m5.clip(min=0.00001)  # As we will take the sqrt
@@ -473,7 +479,7 @@ class cosmicsimage:
         # This s is called sigmap in the original lacosmic.cl
 
         # We remove the large structures (s prime) :
-        sp = s - ndimage.filters.median_filter(s, size=5, mode='mirror')
+        sp = s - ndimage.median_filter(s, size=5, mode='mirror')
 
         if verbose:
             print()
@@ -506,9 +512,9 @@ class cosmicsimage:
             "Building fine structure image ..."
 
         # We build the fine structure image :
-        m3 = ndimage.filters.median_filter(
+        m3 = ndimage.median_filter(
             self.cleanarray, size=3, mode='mirror')
-        m37 = ndimage.filters.median_filter(m3, size=7, mode='mirror')
+        m37 = ndimage.median_filter(m3, size=7, mode='mirror')
         f = m3 - m37
         # In the article that's it, but in lacosmic.cl f is divided by the noise...
         # Ok I understand why, it depends on if you use sp/f or L+/f as criterion.
@@ -541,8 +547,8 @@ class cosmicsimage:
 
         # We grow these cosmics a first time to determine the immediate
         # neighborhod  :
-        growcosmics = np.cast['bool'](
-            signal.convolve2d(np.cast['float32'](cosmics), growkernel, mode="same", boundary="symm"))
+        growcosmics = signal.convolve2d(cosmics.astype(np.float32), growkernel, mode="same",
+                                        boundary="symm").astype(bool)
 
         # From this grown set, we keep those that have sp > sigmalim
         # so obviously not requiring sp/f > objlim, otherwise it would be
@@ -552,8 +558,8 @@ class cosmicsimage:
         # Now we repeat this procedure, but lower the detection limit to
         # sigmalimlow :
 
-        finalsel = np.cast['bool'](
-            signal.convolve2d(np.cast['float32'](growcosmics), growkernel, mode="same", boundary="symm"))
+        finalsel = signal.convolve2d(growcosmics.astype(np.float32), growkernel, mode="same",
+                                     boundary="symm").astype(bool)
         finalsel = np.logical_and(sp > self.sigcliplow, finalsel)
 
         # Again, we have to kick out pixels on saturated stars :
@@ -22,14 +22,19 @@
 import numpy as np
 
 def smooth_bruckner(y, smooth_points, iterations):
-    y_original = y
-    N_data = y.size
+    """
+    Pure python version of the bruckner smoothing, used when neither the Fortran nor the Cython version is available.
+    The padding and clipping is done with numpy, the iterations work on a list of python floats, because indexing
+    single elements of a list is much faster than indexing a numpy array.
+    """
+    y_original = np.asarray(y, dtype=np.float64)
+    N_data = y_original.size
     N = smooth_points
-    N_float = float(N)
-    y = np.empty(N_data + N + N)
+    window_size = N * 2. + 1
 
+    y = np.empty(N_data + N + N)
     y[0:N].fill(y_original[0])
-    y[N:N + N_data] = y_original[0:N_data]
+    y[N:N + N_data] = y_original
     y[N + N_data:N_data + N + N].fill(y_original[-1])
 
     y_avg = np.average(y)
@@ -38,19 +43,17 @@ def smooth_bruckner(y, smooth_points, iterations):
     y_c = y_avg + 2. * (y_avg - y_min)
     y[y > y_c] = y_c
 
-    window_size = N_float*2+1
-
-
+    y = y.tolist()
     for j in range(0, iterations):
-        window_avg = np.average(y[0: 2*N + 1])
+        window_avg = float(np.average(y[0: 2 * N + 1]))
         for i in range(N, N_data - 1 - N - 1):
-            if y[i]>window_avg:
-                y_new = window_avg
-                #updating central value in average (first bracket)
-                #and shifting average by one index (second bracket)
-                window_avg += ((window_avg-y[i]) + (y[i+N+1]-y[i - N]))/window_size
-                y[i] = y_new
+            y_i = y[i]
+            # shifting average by one index
+            shift = y[i + N + 1] - y[i - N]
+            if y_i > window_avg:
+                # updating central value in average
+                y[i] = window_avg
+                window_avg += ((window_avg - y_i) + shift) / window_size
             else:
-                #shifting average by one index
-                window_avg += (y[i+N+1]-y[i - N])/window_size
-    return y[N:N + N_data]
\ No newline at end of file
+                window_avg += shift / window_size
+    return np.array(y[N:N + N_data])
@@ -311,15 +311,52 @@ class SpeFile(object):
         return np.fromfile(self._fid, ntype, size)
 
     def _read_img(self):
-        self.img = self._read_frame(4100)
-        if self.num_frames > 1:
-            img_temp = []
-            img_temp.append(self.img)
-            for n in range(self.num_frames - 1):
-                img_temp.append(self._read_frame())
-            self.img = img_temp
-        if type(self.img) == list:
-            self.img = self.img[0]
+        # only the first frame is mapped, further frames can be obtained by get_image or get_images
+        self.img = self.get_image(0)
+
+    def get_image(self, ind):
+        """
+        Reads a single frame of the file.
+        :param ind: index of the frame, starting at 0
+        :return: 2d array with the frame data
+        """
+        return self.get_images(ind, ind + 1)[0]
+
+    def get_images(self, start, stop):
+        """
+        Reads the frames from start to stop (exclusive). The frames are memory mapped, therefore the data is only read
+        from the file when it is accessed.
+        :param start: index of the first frame, starting at 0
+        :param stop: index after the last frame, will be limited to num_frames
+        :return: 3d array with the frame data (frame, y, x)
+        """
+        stop = min(stop, self.num_frames)
+        num_frames = max(stop - start, 0)
+        ntype = self._get_ntype()
+        frame_size = self._xdim * self._ydim
+        offset = 4100 + start * frame_size * np.dtype(ntype).itemsize
+        if num_frames > 0:
+            try:
+                return np.memmap(self.filename, ntype, mode='c', offset=offset,
+                                 shape=(num_frames, self._ydim, self._xdim))
+            except (ValueError, OSError):  # truncated file
+                pass
+        with open(self.filename, 'rb') as fid:
+            fid.seek(offset)
+            data = np.fromfile(fid, ntype, num_frames * frame_size)
+        return data.reshape((num_frames, self._ydim, self._xdim))
+
+    def _get_ntype(self):
+        if self._data_type == 0:
+            return np.float32
+        elif self._data_type == 1:
+            return np.int32
+        elif self._data_type == 2:
+            return np.int16
+        elif self._data_type == 3:
+            return np.uint16
+        elif self._data_type == 8:
+            return np.uint32
 
     def _read_frame(self, pos=None):
         """Reads in a frame at a specific binary position. The following parameters have to
@@ -330,16 +367,7 @@ class SpeFile(object):
         """
         if pos == None:
             pos = self._fid.tell()
-        if self._data_type == 0:
-            img = self._read_at(pos, self._xdim * self._ydim, np.float32)
-        elif self._data_type == 1:
-            img = self._read_at(pos, self._xdim * self._ydim, np.int32)
-        elif self._data_type == 2:
-            img = self._read_at(pos, self._xdim * self._ydim, np.int16)
-        elif self._data_type == 3:
-            img = self._read_at(pos, self._xdim * self._ydim, np.uint16)
-        elif self._data_type == 8:
-            img = self._read_at(pos, self._xdim * self._ydim, np.uint32)
+        img = self._read_at(pos, self._xdim * self._ydim, self._get_ntype())
         return img.reshape((self._ydim, self._xdim))
 
     def get_index_from(self, wavelength):
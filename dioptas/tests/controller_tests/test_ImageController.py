@@ -27,7 +27,7 @@ from mock import MagicMock
 from ..utility import QtTest, click_button, click_checkbox
 
 from qtpy import QtCore, QtWidgets
-from qtpy.QtTest import QTest
+from qtpy.QtTest import QTest, QSignalSpy
 
 from ...widgets.integration import IntegrationWidget
 from ...controller.integration.ImageController import ImageController
@@ -77,8 +77,11 @@ class ImageControllerTest(QtTest):
         shutil.copy2(os.path.join(unittest_data_path, 'image_001.tif'),
                      os.path.join(unittest_data_path, 'image_003.tif'))
 
+        img_changed_spy = QSignalSpy(self.model.configurations[0].img_model.img_changed)
         self.model.configurations[0].img_model._directory_watcher._file_system_watcher.directoryChanged.emit(
             unittest_data_path)
+        # new files are checked in a background thread, the file is loaded once the event loop processes the result
+        self.assertTrue(img_changed_spy.wait(5000))
 
         self.assertEqual('image_003.tif', str(self.widget.img_filename_txt.text()))
 
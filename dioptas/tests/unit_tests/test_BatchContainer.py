@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import h5py
+
+from ...model.util.BatchContainer import BatchContainerFile, source_filename_key
+
+
+class BatchContainerFileTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_path, 'batch.h5')
+        self.x = np.linspace(1, 10, 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def add_patterns(self, container, num, **kwargs):
+        for ind in range(num):
+            container.add_pattern('img_{0}.tif'.format(ind), self.x, np.ones(100) * ind, unit='2th_deg', **kwargs)
+
+    def test_add_patterns(self):
+        with BatchContainerFile(self.filename) as container:
+            container.add_pattern('img_0.tif', self.x, np.ones(100), unit='2th_deg', motors_info={'Omega': 3},
+                                  calibration_header='calibration 1')
+            container.add_pattern('img_1.tif', self.x, np.ones(100) * 2, unit='2th_deg',
+                                  motors_info={'Vertical': 1.5}, calibration_header='calibration 2')
+            container.add_pattern('img_2.tif', self.x[::2], self.x[::2], unit='2th_deg',
+                                  calibration_header='calibration 1')
+            self.assertEqual(len(container), 3)
+
+        with h5py.File(self.filename, 'r') as f:
+            np.testing.assert_array_equal(f['x'][()], self.x)
+            np.testing.assert_array_equal(f['intensity'][1], 2)
+            np.testing.assert_array_almost_equal(f['intensity'][2][:-1], self.x[:-1])
+            self.assertTrue(np.isnan(f['intensity'][2][-1]))
+            np.testing.assert_array_equal(f['motors/Omega'][()], [3, np.nan, np.nan])
+            np.testing.assert_array_equal(f['motors/Vertical'][()], [np.nan, 1.5, np.nan])
+            np.testing.assert_array_equal(f['calibration_index'][()], [0, 1, 0])
+            self.assertEqual(list(f['calibrations'].asstr()[()]), ['calibration 1', 'calibration 2'])
+            self.assertEqual(f['intensity'].compression, 'gzip')
+
+    def test_continue_after_interruption(self):
+        with BatchContainerFile(self.filename) as container:
+            self.add_patterns(container, 2)
+        # simulate an interruption after the intensity of the third row was written
+        with h5py.File(self.filename, 'a') as f:
+            f['intensity'].resize(3, axis=0)
+            f['intensity'][2] = 5
+
+        with BatchContainerFile(self.filename) as container:
+            self.assertEqual(len(container), 2)
+            self.assertEqual(container.integrated_filenames,
+                             {source_filename_key('img_0.tif'), source_filename_key('img_1.tif')})
+            container.add_pattern('img_2.tif', self.x, np.ones(100) * 7, unit='2th_deg')
+
+        with h5py.File(self.filename, 'r') as f:
+            self.assertEqual(f['intensity'].shape, (3, 100))
+            np.testing.assert_array_equal(f['intensity'][2], 7)
+
+    def test_different_unit_raises_error(self):
+        with BatchContainerFile(self.filename) as container:
+            self.add_patterns(container, 1)
+            with self.assertRaises(ValueError):
+                container.add_pattern('img_1.tif', self.x, np.ones(100), unit='q_A^-1')
+
+    def test_background_subtracted_patterns_and_cakes(self):
+        cake = (np.ones((36, 50)), np.linspace(1, 10, 50), np.linspace(-180, 180, 36))
+        with BatchContainerFile(self.filename) as container:
+            self.add_patterns(container, 2, y_bkg_subtracted=np.zeros(100), cake=cake)
+
+        with h5py.File(self.filename, 'r') as f:
+            self.assertEqual(f['intensity_bkg_subtracted'].shape, (2, 100))
+            self.assertEqual(f['cake'].shape, (2, 36, 50))
+            np.testing.assert_array_equal(f['cake_azi'][()], cake[2])
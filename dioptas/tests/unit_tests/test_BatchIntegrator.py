@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import h5py
+
+from ...model.Configuration import Configuration
+from ...model.BatchIntegrator import BatchIntegrator, save_atomically
+
+unittest_path = os.path.dirname(__file__)
+data_path = os.path.join(unittest_path, '../data')
+
+
+class BatchIntegratorTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = tempfile.mkdtemp()
+        self.img_filenames = []
+        for ind in range(3):
+            filename = os.path.join(self.temp_path, 'CeO2_{0:03d}.tif'.format(ind))
+            shutil.copy(os.path.join(data_path, 'CeO2_Pilatus1M.tif'), filename)
+            self.img_filenames.append(filename)
+        self.output_path = os.path.join(self.temp_path, 'patterns')
+        os.mkdir(self.output_path)
+
+        self.configuration = Configuration()
+        self.configuration.calibration_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.poni'))
+        self.configuration.img_model.load(self.img_filenames[0])
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def save_reference_pattern(self, file_ending):
+        reference_filename = os.path.join(self.temp_path, 'reference' + file_ending)
+        self.configuration.save_pattern(reference_filename)
+        with open(reference_filename) as f:
+            return f.read()
+
+    def read_batch_pattern(self, img_filename, file_ending):
+        base_name = os.path.splitext(os.path.basename(img_filename))[0]
+        with open(os.path.join(self.output_path, base_name + file_ending)) as f:
+            return f.read()
+
+    def test_integrate_files_in_current_process(self):
+        batch_integrator = BatchIntegrator(self.configuration, self.output_path, ['.xy', '.chi'], num_workers=1)
+        saved_filenames = batch_integrator.integrate(self.img_filenames)
+        self.assertEqual(len(saved_filenames), 6)
+
+        reference_xy = self.save_reference_pattern('.xy')
+        for img_filename in self.img_filenames:
+            self.assertEqual(self.read_batch_pattern(img_filename, '.xy'), reference_xy)
+
+    def test_integrate_files_with_worker_processes(self):
+        self.configuration.integration_unit = 'q_A^-1'
+        self.configuration.use_mask = True
+        self.configuration.mask_model.mask_rect(100, 100, 200, 300)
+        self.configuration.integrate_image_1d()
+
+        batch_integrator = BatchIntegrator(self.configuration, self.output_path, ['.xy', '.chi'], num_workers=2)
+        batch_integrator.integrate(self.img_filenames)
+
+        reference_xy = self.save_reference_pattern('.xy')
+        for img_filename in self.img_filenames:
+            self.assertEqual(self.read_batch_pattern(img_filename, '.xy'), reference_xy)
+            self.assertTrue(os.path.exists(os.path.join(
+                self.output_path, os.path.splitext(os.path.basename(img_filename))[0] + '.chi')))
+
+    def test_integrate_with_background_pattern(self):
+        x, y = self.configuration.pattern_model.pattern.data
+        self.configuration.pattern_model.background_pattern = \
+            type(self.configuration.pattern_model.pattern)(x, np.ones(y.shape))
+
+        batch_integrator = BatchIntegrator(self.configuration, self.output_path, ['.xy'], num_workers=1)
+        batch_integrator.integrate(self.img_filenames[:1])
+
+        self.assertTrue(os.path.exists(os.path.join(self.output_path, 'bkg_subtracted', 'CeO2_000.xy')))
+
+    def test_abort_integration_with_callback(self):
+        processed = []
+
+        def callback(ind, filename):
+            processed.append(filename)
+            return False
+
+        batch_integrator = BatchIntegrator(self.configuration, self.output_path, ['.xy'], num_workers=1)
+        batch_integrator.integrate(self.img_filenames, callback=callback)
+
+        self.assertEqual(processed, self.img_filenames[:1])
+        self.assertEqual(len(os.listdir(self.output_path)), 1)
+
+    def test_integrate_files_with_spawned_worker_processes(self):
+        batch_integrator = BatchIntegrator(self.configuration, self.output_path, ['.xy', '.fxye'], num_workers=2,
+                                           start_method='spawn')
+        batch_integrator.integrate(self.img_filenames)
+
+        reference_xy = self.save_reference_pattern('.xy')
+        for img_filename in self.img_filenames:
+            self.assertEqual(self.read_batch_pattern(img_filename, '.xy'), reference_xy)
+        fxye_filename = os.path.join(self.output_path, 'CeO2_000.fxye')
+        self.assertIn('Generated file ' + fxye_filename, self.read_batch_pattern(self.img_filenames[0], '.fxye'))
+        self.assertEqual(len(os.listdir(self.output_path)), 6)
+
+    def test_abort_integration_with_worker_processes_leaves_no_partial_files(self):
+        batch_integrator = BatchIntegrator(self.configuration, self.output_path, ['.xy'], cake_formats=['.txt'],
+                                           num_workers=2)
+        batch_integrator.integrate(self.img_filenames, callback=lambda ind, filename: False)
+
+        reference_xy = self.save_reference_pattern('.xy')
+        for filename in os.listdir(self.output_path):
+            self.assertFalse(filename.startswith('.'))
+            if filename.endswith('.xy'):
+                with open(os.path.join(self.output_path, filename)) as f:
+                    self.assertEqual(f.read(), reference_xy)
+
+    def test_failed_save_leaves_no_file(self):
+        filename = os.path.join(self.output_path, 'CeO2_000.xy')
+
+        def save_function(temp_filename):
+            with open(temp_filename, 'w') as f:
+                f.write('incomplete')
+            raise IOError
+
+        with self.assertRaises(IOError):
+            save_atomically(save_function, filename, 'marker')
+        self.assertEqual(os.listdir(self.output_path), [])
+
+    def test_integrate_into_container_and_continue(self):
+        batch_integrator = BatchIntegrator(self.configuration, self.output_path, [], num_workers=1,
+                                           container_filename='batch.h5', container_cakes=True)
+        batch_integrator.integrate(self.img_filenames, callback=lambda ind, filename: False)
+        self.assertEqual(os.listdir(self.output_path), ['batch.h5'])
+
+        processed = []
+        saved_filenames = batch_integrator.integrate(self.img_filenames,
+                                                     callback=lambda ind, filename: processed.append(filename))
+        self.assertEqual(processed, self.img_filenames[1:])
+        self.assertEqual(saved_filenames, [os.path.join(self.output_path, 'batch.h5')])
+
+        self.configuration.integrate_image_1d()
+        x, y = self.configuration.pattern_model.pattern.data
+        with h5py.File(os.path.join(self.output_path, 'batch.h5'), 'r') as f:
+            self.assertEqual(f['intensity'].shape, (3, len(y)))
+            np.testing.assert_array_almost_equal(f['x'][()], x)
+            np.testing.assert_array_almost_equal(f['intensity'][2], y)
+            self.assertEqual(f['x'].attrs['unit'], '2th_deg')
+            self.assertEqual([os.path.basename(filename) for filename in f['source_filename'].asstr()[()]],
+                             ['CeO2_000.tif', 'CeO2_001.tif', 'CeO2_002.tif'])
+            self.assertEqual(len(f['calibrations']), 1)
+            self.assertEqual(f['cake'].shape[0], 3)
+
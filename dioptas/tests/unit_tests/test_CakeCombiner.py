@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import numpy as np
+
+from ...model.util.CakeCombiner import CakeCombiner, calculate_interpolation_map, interpolate
+
+
+class CakeCombinerTest(unittest.TestCase):
+    def setUp(self):
+        self.tth = np.linspace(10, 20, 11)
+        self.azi = np.linspace(-180, 180, 37)
+        self.cake = np.outer(np.arange(37), np.ones(11)) + np.arange(11)
+
+    def test_interpolation_is_linear(self):
+        tth_grid = np.array([5, 10, 12.5, 20, 25])
+        azi_grid = np.array([-175, 0])
+        tth_map = calculate_interpolation_map(self.tth, tth_grid)
+        azi_map = calculate_interpolation_map(self.azi, azi_grid)
+
+        result = interpolate(self.cake, tth_map, azi_map)
+        np.testing.assert_array_almost_equal(result, [[0, 0.5, 3, 10.5, 0],
+                                                      [0, 18, 20.5, 28, 0]])
+
+    def test_combine_single_cake_on_same_grid(self):
+        combiner = CakeCombiner(num_tth=11, num_azi=37)
+        combined = combiner.combine([(self.cake, self.tth, self.azi, None)])
+        np.testing.assert_array_almost_equal(combiner.tth, self.tth)
+        np.testing.assert_array_almost_equal(combiner.azi, self.azi)
+        # the bin with zero intensity has no weight
+        np.testing.assert_array_almost_equal(combined, self.cake)
+
+    def test_overlapping_cakes_are_averaged(self):
+        combiner = CakeCombiner(num_tth=21, num_azi=37)
+        cake1 = np.ones((37, 11))
+        cake2 = np.ones((37, 11)) * 3
+        combined = combiner.combine([(cake1, self.tth, self.azi, None),
+                                     (cake2, self.tth + 5, self.azi, np.ones((37, 11)) * 3)])
+
+        np.testing.assert_array_almost_equal(combiner.tth, np.linspace(10, 25, 21))
+        self.assertAlmostEqual(combined[0, 0], 1)
+        self.assertAlmostEqual(combined[0, -1], 3)
+        # pixel count weighted average in the overlap region
+        self.assertAlmostEqual(combined[0, 10], (1 * 1 + 3 * 3) / 4.)
+
+    def test_interpolation_maps_are_reused(self):
+        combiner = CakeCombiner(num_tth=100, num_azi=100)
+        combiner.combine([(self.cake, self.tth, self.azi, None)])
+        interpolation_maps = dict(combiner._interpolation_maps)
+        self.assertEqual(len(interpolation_maps), 2)
+
+        combiner.combine([(self.cake * 2, self.tth, self.azi, None)])
+        for key, interpolation_map in combiner._interpolation_maps.items():
+            self.assertIs(interpolation_map, interpolation_maps[key])
+
+        combiner.combine([(self.cake, self.tth * 2, self.azi, None)])
+        self.assertEqual(len(combiner._interpolation_maps), 2)
+        self.assertNotIn(list(interpolation_maps.keys())[0], combiner._interpolation_maps)
@@ -23,7 +23,7 @@ import os
 import numpy as np
 
 from ..utility import QtTest
-from ...model.CalibrationModel import CalibrationModel
+from ...model.CalibrationModel import CalibrationModel, NotEnoughSpacingsInCalibrant
 from ...model.ImgModel import ImgModel
 from ... import calibrants_path
 import gc
@@ -90,6 +90,27 @@ class CalibrationModelTest(QtTest):
         self.calibration_model.find_peaks_automatic(387.395462348, 390.987901686, 0)
         self.calibration_model.find_peaks_automatic(367.94835605, 554.290314848, 0)
 
+    def test_search_peaks_on_rings(self):
+        self.img_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.tif'))
+        self.calibration_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.poni'))
+        self.calibration_model.set_calibrant(os.path.join(calibrants_path, 'CeO2.D'))
+        self.calibration_model.calibrant.wavelength = self.calibration_model.pattern_geometry.wavelength
+        self.calibration_model.setup_peak_search_algorithm('Massif')
+
+        self.calibration_model.search_peaks_on_rings([0, 1, 2])
+        self.assertEqual(self.calibration_model.points_index, [0, 1, 2])
+
+        # all points are close to the expected rings
+        tth_array = self.calibration_model.pattern_geometry.twoThetaArray(self.img_model.img_data.shape)
+        for points, ring_index in zip(self.calibration_model.points, self.calibration_model.points_index):
+            self.assertGreater(len(points), 0)
+            ring_tth = self.calibration_model.calibrant.get_2th()[ring_index]
+            points_tth = tth_array[np.round(points[:, 0]).astype(int), np.round(points[:, 1]).astype(int)]
+            self.assertLess(np.max(np.abs(points_tth - ring_tth)), np.deg2rad(0.15))
+
+        with self.assertRaises(NotEnoughSpacingsInCalibrant):
+            self.calibration_model.search_peaks_on_ring(1000)
+
     def test_calibration_with_supersampling(self):
         self.load_pilatus_1M_and_find_peaks()
         self.calibration_model.set_calibrant(os.path.join(calibrants_path, 'CeO2.D'))
@@ -231,6 +252,21 @@ class CalibrationModelTest(QtTest):
         self.assertGreater(np.min(self.calibration_model.cake_azi), 150)
         self.assertLess(np.max(self.calibration_model.cake_azi), 230)
 
+    def test_integrate_1d_from_cake(self):
+        self.img_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.tif'))
+        self.calibration_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.poni'))
+
+        tth1, int1 = self.calibration_model.integrate_1d(num_points=1000)
+        self.calibration_model.integrate_2d(rad_points=1000)
+        tth2, int2 = self.calibration_model.integrate_1d_from_cake()
+
+        np.testing.assert_array_almost_equal(tth1, tth2)
+        np.testing.assert_array_almost_equal(int1 / np.max(int1), int2 / np.max(int1), decimal=4)
+
+        d, _ = self.calibration_model.integrate_1d_from_cake(unit='d_A')
+        np.testing.assert_array_almost_equal(
+            d, self.calibration_model.wavelength / (2 * np.sin(tth2 / 360 * np.pi)) * 1e10)
+
     def test_cake_integration_with_different_num_points(self):
         self.img_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.tif'))
         self.calibration_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.poni'))
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from ...model.util.cosmics import cosmicsimage
+from ...model.util.CosmicRemoval import find_cosmics, iterate_cosmic_masks, get_tiles
+
+unittest_path = os.path.dirname(__file__)
+data_path = os.path.join(unittest_path, '../data')
+
+
+def add_cosmics(img_data, num, seed=0):
+    img_data = np.array(img_data, dtype=np.float64)
+    random_state = np.random.RandomState(seed)
+    for _ in range(num):
+        row, col = random_state.randint(0, img_data.shape[0] - 3), random_state.randint(0, img_data.shape[1] - 3)
+        size = random_state.randint(1, 4)
+        img_data[row:row + size, col:col + size] += random_state.uniform(1e3, 1e5)
+    return img_data
+
+
+def find_cosmics_at_once(img_data, iterations=2):
+    image = cosmicsimage(img_data, sigclip=3.0, objlim=3.0, verbose=False)
+    for _ in range(iterations):
+        image.lacosmiciteration()
+        image.clean()
+    return image.mask
+
+
+class CosmicRemovalTest(unittest.TestCase):
+    def setUp(self):
+        img_data = np.array(Image.open(os.path.join(data_path, 'CeO2_Pilatus1M.tif')))[300:540, 400:650]
+        self.img_data = add_cosmics(img_data, 40)
+        self.reference_mask = find_cosmics_at_once(self.img_data)
+
+    def test_tiles_cover_image(self):
+        coverage = np.zeros((100, 70), dtype=int)
+        for region, padded_region, crop in get_tiles(coverage.shape, 32, 5):
+            coverage[region] += 1
+            self.assertEqual(coverage[padded_region][crop].shape, coverage[region].shape)
+            self.assertLessEqual(padded_region[0].stop - padded_region[0].start, 32 + 2 * 5)
+        self.assertTrue(np.all(coverage == 1))
+
+    def test_single_tile_matches_original(self):
+        mask = find_cosmics(self.img_data, num_workers=1)
+        self.assertGreater(np.sum(mask), 0)
+        self.assertTrue(np.array_equal(mask, self.reference_mask))
+
+    def test_tiles_match_original(self):
+        mask = find_cosmics(self.img_data, tile_size=64, num_workers=1)
+        self.assertTrue(np.array_equal(mask, self.reference_mask))
+
+    def test_tiles_in_worker_processes_match_original(self):
+        mask = find_cosmics(self.img_data, tile_size=128, num_workers=2)
+        self.assertTrue(np.array_equal(mask, self.reference_mask))
+
+    def test_tiles_in_spawned_worker_processes_match_original(self):
+        mask = find_cosmics(self.img_data, tile_size=128, num_workers=2, start_method='spawn')
+        self.assertTrue(np.array_equal(mask, self.reference_mask))
+
+    def test_float32(self):
+        mask = find_cosmics(self.img_data, dtype=np.float32, tile_size=128, num_workers=1)
+        self.assertLess(np.sum(mask != self.reference_mask), 0.001 * mask.size)
+
+    def test_series_of_frames(self):
+        frames = [self.img_data, add_cosmics(self.img_data, 20, seed=1)]
+        masks = list(iterate_cosmic_masks(frames, tile_size=128, num_workers=2))
+        self.assertEqual(len(masks), 2)
+        self.assertTrue(np.array_equal(masks[0], self.reference_mask))
+        self.assertTrue(np.array_equal(masks[1], find_cosmics_at_once(frames[1])))
@@ -20,11 +20,13 @@
 
 import os
 import numpy as np
+import h5py
 from mock import MagicMock
 
 from ..utility import QtTest, delete_if_exists
 from ...model.DioptasModel import DioptasModel
 from ...model.util import Pattern
+from ...model.util.PackedMask import read_mask_dataset
 
 unittest_path = os.path.dirname(__file__)
 data_path = os.path.join(unittest_path, '../data')
@@ -149,6 +151,28 @@ class DioptasModelTest(QtTest):
         self.assertGreater(self.model.current_configuration.calibration_model.cake_azi[0], -100)
         self.assertLess(self.model.current_configuration.calibration_model.cake_azi[-1], 100)
 
+    def test_integrate_pattern_from_cake(self):
+        self.model.calibration_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.poni'))
+        self.model.img_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.tif'))
+        x1, y1 = self.model.pattern.data
+
+        self.model.current_configuration.auto_integrate_cake = True
+        self.model.current_configuration.integrate_pattern_from_cake = True
+        self.model.calibration_model.integrate_1d = MagicMock(wraps=self.model.calibration_model.integrate_1d)
+        self.model.calibration_model.integrate_2d = MagicMock(wraps=self.model.calibration_model.integrate_2d)
+        self.model.img_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.tif'))
+        x2, y2 = self.model.pattern.data
+
+        self.model.calibration_model.integrate_1d.assert_not_called()
+        self.assertEqual(self.model.calibration_model.integrate_2d.call_count, 1)
+        np.testing.assert_array_almost_equal(x1, x2)
+        np.testing.assert_array_almost_equal(y1 / np.max(y1), y2 / np.max(y1), decimal=4)
+
+        # the pattern can not be calculated from a cake with limited azimuth range
+        self.model.current_configuration.cake_azimuth_range = [-100, 100]
+        self.model.img_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.tif'))
+        self.assertEqual(self.model.calibration_model.integrate_1d.call_count, 1)
+
     def test_combine_patterns(self):
         x1 = np.linspace(0, 10)
         y1 = np.ones(x1.shape)
@@ -167,6 +191,11 @@ class DioptasModelTest(QtTest):
         x3, y3 = self.model.pattern.data
         self.assertLess(np.min(x3), 7)
         self.assertGreater(np.max(x3), 10)
+        self.assertIs(self.model.pattern, self.model.pattern)
+
+        self.model.pattern_model.set_pattern(x2, y2 * 2)
+        x4, y4 = self.model.pattern.data
+        self.assertAlmostEqual(y4[-1], 4)
 
     def test_combine_cakes(self):
         self.model.calibration_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.poni'))
@@ -182,6 +211,29 @@ class DioptasModelTest(QtTest):
 
         self.model.combine_cakes = True
         self.assertFalse(np.array_equal(self.model.cake_data, cake1))
+        self.assertEqual(self.model.cake_data.shape, (len(self.model.cake_azi), len(self.model.cake_tth)))
+        self.assertLessEqual(np.min(self.model.cake_tth),
+                             np.min(self.model.configurations[0].calibration_model.cake_tth))
+
+    def test_save_combined_cake(self):
+        self.model.calibration_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.poni'))
+        self.model.current_configuration.auto_integrate_cake = True
+        self.model.img_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.tif'))
+        self.model.add_configuration()
+        self.model.calibration_model.load(os.path.join(data_path, 'CeO2_Pilatus1M_2.poni'))
+        self.model.current_configuration.auto_integrate_cake = True
+        self.model.img_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.tif'))
+        self.model.combine_cakes = True
+
+        filename = os.path.join(data_path, 'combined_cake.txt')
+        self.model.current_configuration.save_cake(
+            filename, cake=(self.model.cake_data, self.model.cake_tth, self.model.cake_azi))
+        data = np.loadtxt(filename)
+        delete_if_exists(filename)
+
+        np.testing.assert_array_almost_equal(data[0, 1:], self.model.cake_tth, decimal=3)
+        np.testing.assert_array_almost_equal(data[1:, 0], self.model.cake_azi, decimal=2)
+        self.assertEqual(data[1:, 1:].shape, self.model.cake_data.shape)
 
     def test_setting_factors(self):
         self.model.img_model.load(os.path.join(data_path, "image_001.tif"))
@@ -249,6 +301,23 @@ class DioptasModelTest(QtTest):
     def test_save_empty_configuration(self):
         self.model.save(os.path.join(data_path, 'empty.dio'))
 
+    def test_save_masks_of_configurations(self):
+        self.model.mask_model.mask_rect(10, 10, 20, 20)
+        self.model.add_configuration()
+        self.model.mask_model.mask_rect(10, 10, 20, 20)
+        self.model.add_configuration()
+        self.model.mask_model.mask_rect(100, 100, 20, 20)
+        masks = [np.copy(configuration.mask_model.get_mask()) for configuration in self.model.configurations]
+
+        filename = os.path.join(data_path, 'empty.dio')
+        self.model.save(filename)
+        with h5py.File(filename, 'r') as f:
+            # identical masks of the first two configurations are only stored once
+            self.assertEqual(len(f['masks']), 2)
+            for ind, mask in enumerate(masks):
+                saved_mask = read_mask_dataset(f['configurations'][str(ind)]['mask']['packed_data'])
+                self.assertTrue(np.array_equal(saved_mask, mask))
+
     def test_clear_model(self):
         self.model.calibration_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.poni'))
         self.model.img_model.load(os.path.join(data_path, "image_001.tif"))
@@ -19,6 +19,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import shutil
+import tempfile
+from mock import patch
 
 from ..utility import QtTest
 from ...model.util.HelperModule import FileNameIterator
@@ -102,3 +105,151 @@ class FileNameIteratorTest(QtTest):
         self.filename_iterator.update_filename(os.path.join(data_path, filename))
         new_filename = os.path.basename(self.filename_iterator.get_previous_filename(step=2))
         self.assertEqual(new_filename, 'image_001.tif')
+
+
+class FileNameIteratorIndexTest(QtTest):
+    def setUp(self):
+        self.temp_path = tempfile.mkdtemp()
+        self.filenames = []
+        self.ctimes = {}
+        for ind, number in enumerate([3, 1, 2, 10]):
+            filename = os.path.join(self.temp_path, 'image_{0:03d}.tif'.format(number))
+            self.create_file(filename, ctime=1000 + ind)
+        self.create_file(os.path.join(self.temp_path, 'notes.txt'), ctime=1001.5)
+        self.filename_iterator = FileNameIterator()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def create_file(self, filename, ctime):
+        open(filename, 'w').close()
+        self.filenames.append(filename)
+        self.ctimes[os.path.basename(filename)] = ctime
+
+    def get_ctime(self, path):
+        return self.ctimes[os.path.basename(path)]
+
+    def test_iterate_by_number_uses_the_index(self):
+        self.filename_iterator.update_filename(os.path.join(self.temp_path, 'image_001.tif'))
+        self.assertEqual(os.path.basename(self.filename_iterator.get_next_filename()), 'image_002.tif')
+
+        with patch('os.path.exists') as exists_mock:
+            self.assertEqual(os.path.basename(self.filename_iterator.get_next_filename()), 'image_003.tif')
+            exists_mock.assert_not_called()
+        self.assertEqual(len(self.filename_iterator._file_index), 5)
+
+    def test_iterate_by_number_with_and_without_leading_zeros(self):
+        for filename in ['scan_008.tif', 'scan_9.tif', 'scan_010.tif', 'scan_10.tif', 'scan_11.tif', 'scan_012.tif']:
+            self.create_file(os.path.join(self.temp_path, filename), ctime=3000)
+        self.filename_iterator.update_filename(os.path.join(self.temp_path, 'scan_008.tif'))
+
+        with patch('os.path.exists', wraps=os.path.exists) as exists_mock:
+            filenames = []
+            filename = self.filename_iterator.get_next_filename()
+            while filename is not None:
+                filenames.append(os.path.basename(filename))
+                filename = self.filename_iterator.get_next_filename()
+            # only the missing scan_12.tif is looked up in the file system
+            exists_mock.assert_called_once_with(os.path.join(self.temp_path, 'scan_12.tif'))
+        self.assertEqual(filenames, ['scan_9.tif', 'scan_10.tif', 'scan_11.tif'])
+
+    def test_files_not_reported_by_the_watcher_are_found(self):
+        self.filename_iterator.update_filename(os.path.join(self.temp_path, 'image_002.tif'))
+        self.assertEqual(os.path.basename(self.filename_iterator.get_next_filename()), 'image_003.tif')
+
+        # e.g. written to a network file system by another computer
+        self.create_file(os.path.join(self.temp_path, 'image_4.tif'), ctime=2000)
+        self.assertEqual(os.path.basename(self.filename_iterator.get_next_filename()), 'image_4.tif')
+        self.assertTrue(self.filename_iterator._file_index.exists('image_4.tif'))
+
+    def test_iterate_by_number_with_pos(self):
+        for filename in ['run_1_001.tif', 'run_2_001.tif', 'run_1_002.tif']:
+            self.create_file(os.path.join(self.temp_path, filename), ctime=3000)
+        self.filename_iterator.update_filename(os.path.join(self.temp_path, 'run_1_001.tif'))
+
+        self.assertEqual(os.path.basename(self.filename_iterator.get_next_filename(pos=1)), 'run_2_001.tif')
+        self.assertIsNone(self.filename_iterator.get_next_filename(pos=1))
+        self.assertEqual(os.path.basename(self.filename_iterator.get_next_filename(
+            filename=os.path.join(self.temp_path, 'run_1_001.tif'), pos=0)), 'run_1_002.tif')
+
+    def test_changes_reported_by_the_watcher_are_applied(self):
+        self.filename_iterator.update_filename(os.path.join(self.temp_path, 'image_002.tif'))
+        self.assertEqual(os.path.basename(self.filename_iterator.get_next_filename()), 'image_003.tif')
+
+        self.create_file(os.path.join(self.temp_path, 'image_004.tif'), ctime=2000)
+        os.remove(os.path.join(self.temp_path, 'image_002.tif'))
+        with patch('os.listdir') as listdir_mock:
+            self.filename_iterator._directory_files_changed(self.temp_path, ['image_004.tif'], ['image_002.tif'])
+            listdir_mock.assert_not_called()
+
+        self.assertEqual(os.path.basename(self.filename_iterator.get_next_filename()), 'image_004.tif')
+        self.assertEqual(os.path.basename(self.filename_iterator.get_previous_filename()), 'image_003.tif')
+        self.assertIsNone(self.filename_iterator.get_previous_filename())
+
+    def test_changed_creation_times_are_saved_after_a_delay(self):
+        cache_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_path)
+        with patch('os.path.getctime', side_effect=self.get_ctime):
+            self.filename_iterator.index_cache_directory = cache_path
+            self.filename_iterator.create_timed_file_list = True
+            self.filename_iterator.update_filename(os.path.join(self.temp_path, 'image_001.tif'))
+
+            self.create_file(os.path.join(self.temp_path, 'image_011.tif'), ctime=2000)
+            with patch('json.dump') as dump_mock:
+                self.filename_iterator._directory_files_changed(self.temp_path, ['image_011.tif'], [])
+                self.filename_iterator._directory_files_changed(self.temp_path, [], ['image_001.tif'])
+                dump_mock.assert_not_called()
+                self.assertTrue(self.filename_iterator._cache_timer.isActive())
+
+                self.filename_iterator.save_index_cache()
+                self.assertEqual(dump_mock.call_count, 1)
+                self.assertIn('image_011.tif', dump_mock.call_args[0][0]['ctimes'])
+                self.assertNotIn('image_001.tif', dump_mock.call_args[0][0]['ctimes'])
+
+    def test_iterate_by_time(self):
+        with patch('os.path.getctime', side_effect=self.get_ctime):
+            self.filename_iterator.create_timed_file_list = True
+            self.filename_iterator.update_filename(os.path.join(self.temp_path, 'image_003.tif'))
+
+            filenames = []
+            filename = self.filename_iterator.get_next_filename(mode='time')
+            while filename is not None:
+                filenames.append(os.path.basename(filename))
+                filename = self.filename_iterator.get_next_filename(mode='time')
+            self.assertEqual(filenames, ['image_001.tif', 'image_002.tif', 'image_010.tif'])
+
+            self.assertEqual(os.path.basename(self.filename_iterator.get_previous_filename(mode='time', step=2)),
+                             'image_001.tif')
+            self.assertIsNone(self.filename_iterator.get_previous_filename(mode='time', step=2))
+
+    def test_index_is_updated_incrementally(self):
+        with patch('os.path.getctime', side_effect=self.get_ctime) as getctime_mock:
+            self.filename_iterator.create_timed_file_list = True
+            self.filename_iterator.update_filename(os.path.join(self.temp_path, 'image_010.tif'))
+            self.assertEqual(getctime_mock.call_count, 5)
+
+            self.create_file(os.path.join(self.temp_path, 'image_011.tif'), ctime=2000)
+            os.remove(os.path.join(self.temp_path, 'image_001.tif'))
+            self.filename_iterator.add_new_files_to_list()
+            self.assertEqual(getctime_mock.call_count, 6)
+
+            self.assertEqual(os.path.basename(self.filename_iterator.get_next_filename(mode='time')),
+                             'image_011.tif')
+            self.assertEqual(os.path.basename(self.filename_iterator.get_previous_filename(mode='time', step=2)),
+                             'image_002.tif')
+            self.assertEqual(os.path.basename(self.filename_iterator.get_previous_filename(mode='time')),
+                             'image_003.tif')
+
+    def test_creation_times_are_cached(self):
+        cache_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_path)
+        cache_path = os.path.join(cache_path, 'file_index')  # is created when the cache is written
+        with patch('os.path.getctime', side_effect=self.get_ctime) as getctime_mock:
+            for _ in range(2):
+                filename_iterator = FileNameIterator()
+                filename_iterator.index_cache_directory = cache_path
+                filename_iterator.create_timed_file_list = True
+                filename_iterator.update_filename(os.path.join(self.temp_path, 'image_001.tif'))
+                self.assertEqual(os.path.basename(filename_iterator.get_next_filename(mode='time')),
+                                 'image_002.tif')
+            self.assertEqual(getctime_mock.call_count, 5)
@@ -22,7 +22,7 @@ import os
 import numpy as np
 
 from ..utility import QtTest
-from ...model.util.HelperModule import get_partial_index, FileNameIterator
+from ...model.util.HelperModule import get_partial_index, supersample_array, FileNameIterator
 
 unittest_path = os.path.dirname(__file__)
 data_path = os.path.join(unittest_path, '../data', 'FileIterator')
@@ -35,6 +35,15 @@ class HelperModuleTest(QtTest):
         self.assertEqual(get_partial_index(data, value), 2.5)
         self.assertEqual(get_partial_index(data, data[4]), 4)
 
+    def test_supersample_array(self):
+        data = np.array([[1, 2], [3, 4]], dtype=np.int32)
+        supersampled = supersample_array(data, 3)
+        self.assertEqual(supersampled.shape, (6, 6))
+        self.assertEqual(supersampled.dtype, np.int32)
+        np.testing.assert_array_equal(supersampled[::3, ::3], data)
+        np.testing.assert_array_equal(supersampled[2::3, 1::3], data)
+        self.assertIs(supersample_array(data, 1), data)
+
     def test_get_next_filename(self):
         filename = os.path.join(data_path, "dummy1_1.txt")
         self.file_iterator = FileNameIterator(filename)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from ...model.util.ImagePrefetcher import ImagePrefetcher
+
+
+class ImagePrefetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = tempfile.mkdtemp()
+        self.filenames = []
+        for ind in range(4):
+            filename = os.path.join(self.temp_path, 'image_{0:03d}.npy'.format(ind))
+            np.save(filename, np.ones((10, 10)) * ind)
+            self.filenames.append(filename)
+        self.loaded_filenames = []
+        self.prefetcher = ImagePrefetcher(self.load)
+
+    def tearDown(self):
+        self.prefetcher.clear()
+        shutil.rmtree(self.temp_path)
+
+    def load(self, filename):
+        self.loaded_filenames.append(filename)
+        return {"img_data": np.load(filename)}
+
+    def test_get_prefetched_data(self):
+        self.prefetcher.prefetch(self.filenames[1:3])
+        self.prefetcher.wait()
+        self.assertEqual(self.loaded_filenames, self.filenames[1:3])
+        self.assertEqual(self.prefetcher.cached_bytes, 2 * 800)
+
+        data = self.prefetcher.get(self.filenames[1])
+        np.testing.assert_array_equal(data["img_data"], np.ones((10, 10)))
+        self.assertEqual(self.prefetcher.filenames, self.filenames[2:3])
+        self.assertEqual(self.prefetcher.cached_bytes, 800)
+
+        self.assertIsNone(self.prefetcher.get(self.filenames[0]))
+
+    def test_prefetch_discards_other_files(self):
+        self.prefetcher.prefetch(self.filenames[1:3])
+        self.prefetcher.wait()
+        self.prefetcher.prefetch(self.filenames[2:4])
+        self.prefetcher.wait()
+        self.assertEqual(self.prefetcher.filenames, self.filenames[2:4])
+        self.assertEqual(self.loaded_filenames, self.filenames[1:4])
+        self.assertEqual(self.prefetcher.cached_bytes, 2 * 800)
+
+        self.prefetcher.clear()
+        self.assertEqual(self.prefetcher.cached_bytes, 0)
+
+    def test_changed_file_is_not_used(self):
+        self.prefetcher.prefetch(self.filenames[1:2])
+        self.prefetcher.wait()
+        np.save(self.filenames[1], np.ones((20, 10)))
+        self.assertIsNone(self.prefetcher.get(self.filenames[1]))
+
+    def test_memory_budget(self):
+        self.prefetcher.max_bytes = 1000
+        self.prefetcher.prefetch(self.filenames)
+        self.prefetcher.wait()
+        self.assertEqual(self.prefetcher.cached_bytes, 800)
+        self.assertIsNotNone(self.prefetcher.get(self.filenames[0]))
+        self.assertIsNone(self.prefetcher.get(self.filenames[1]))
+
+    def test_files_to_prefetch_are_determined_in_the_worker_thread(self):
+        threads = []
+
+        def get_filenames():
+            threads.append(threading.current_thread())
+            return self.filenames[2:4]
+
+        self.prefetcher.prefetch_following(get_filenames)
+        self.prefetcher.wait()
+        self.assertNotEqual(threads, [threading.current_thread()])
+        self.assertEqual(self.prefetcher.filenames, self.filenames[2:4])
+        self.assertEqual(self.loaded_filenames, self.filenames[2:4])
+
+    def test_lookup_started_before_clear_is_not_used(self):
+        self.prefetcher.prefetch_following(lambda: self.filenames[2:4])
+        self.prefetcher.clear()
+        self.prefetcher.wait()
+        self.assertEqual(self.prefetcher.filenames, [])
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+
+import numpy as np
+
+from ...model.util.ImagePyramid import ImagePyramid, downsample
+
+
+class ImagePyramidTest(unittest.TestCase):
+    def setUp(self):
+        self.img_data = np.random.RandomState(0).randint(0, 1000, (1001, 600)).astype(np.uint16)
+        self.pyramid = ImagePyramid(self.img_data, min_size=128)
+
+    def test_levels(self):
+        self.assertEqual(self.pyramid.num_levels, 4)
+        self.assertIs(self.pyramid.get_level(0), self.img_data)
+        self.assertEqual(self.pyramid.get_level(1).shape, (501, 300))
+        self.assertEqual(self.pyramid.get_level(3).shape, (126, 75))
+        # levels beyond the last one give the last one
+        self.assertIs(self.pyramid.get_level(10), self.pyramid.get_level(3))
+
+    def test_downsample(self):
+        data = np.array([[1, 3, 5],
+                         [5, 7, 9]], dtype=np.uint16)
+        self.assertTrue(np.array_equal(downsample(data), [[4, 7]]))
+        self.assertEqual(downsample(data).dtype, np.float32)
+        # the mean intensity is kept
+        self.assertAlmostEqual(np.mean(self.pyramid.get_level(1)[:-1]), np.mean(self.img_data[:1000]), places=3)
+
+    def test_level_for_pixel_size(self):
+        self.assertEqual(self.pyramid.get_level_for_pixel_size(0.1), 0)
+        self.assertEqual(self.pyramid.get_level_for_pixel_size(1.9), 0)
+        self.assertEqual(self.pyramid.get_level_for_pixel_size(2), 1)
+        self.assertEqual(self.pyramid.get_level_for_pixel_size(5), 2)
+        self.assertEqual(self.pyramid.get_level_for_pixel_size(100), 3)
+
+    def test_histogram(self):
+        hist_x, hist_y = self.pyramid.get_histogram(bins=100)
+        self.assertEqual(len(hist_x), 100)
+        self.assertEqual(np.sum(hist_y), len(range(0, 1001, 2)) * len(range(0, 600, 2)))
+        self.assertGreaterEqual(hist_x[0], 0)
+        self.assertLess(hist_x[-1], 1000)
+
+    def test_histogram_without_finite_values(self):
+        pyramid = ImagePyramid(np.full((10, 10), np.nan))
+        self.assertEqual(pyramid.get_histogram(), (None, None))
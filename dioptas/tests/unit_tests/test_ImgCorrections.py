@@ -26,6 +26,8 @@ import numpy as np
 from ...model.util.ImgCorrection import ImgCorrectionManager, ImgCorrectionInterface, \
     ObliqueAngleDetectorAbsorptionCorrection
 from ...model.util.ImgCorrection import TransferFunctionCorrection, load_image
+from ...model.util.ImgCorrection import CbnCorrection, CorrectionCache, correction_cache, evaluate_on_grid, \
+    calculate_cbn_absorption, calculate_oblique_angle_absorption
 from ..utility import unittest_data_path
 
 
@@ -99,6 +101,91 @@ class ImgCorrectionsUnitTest(unittest.TestCase):
         self.corrections.delete()
         self.assertEqual(np.mean(self.corrections.get_data()), 5)
 
+    def test_combined_data_is_cached_until_a_correction_changes(self):
+        cor1 = DummyCorrection((20, 20), 2)
+        cor2 = DummyCorrection((20, 20), 3)
+        self.corrections.add(cor1)
+        self.corrections.add(cor2)
+
+        data = self.corrections.get_data()
+        self.assertIs(self.corrections.get_data(), data)
+
+        cor2._data = np.ones((20, 20)) * 5
+        self.assertEqual(np.mean(self.corrections.get_data()), 10)
+
+        self.corrections.delete()
+        self.assertEqual(np.mean(self.corrections.get_data()), 2)
+
+    def test_combined_data_with_float32(self):
+        self.corrections = ImgCorrectionManager(dtype=np.float32)
+        self.corrections.add(DummyCorrection((20, 20), 2))
+        self.assertEqual(self.corrections.get_data().dtype, np.float32)
+        self.assertEqual(np.mean(self.corrections.get_data()), 2)
+
+
+class CorrectionMapTest(unittest.TestCase):
+    def setUp(self):
+        correction_cache.clear()
+        self.tth_array, self.azi_array = np.meshgrid(np.linspace(0.1, 30, 300), np.linspace(-179, 179, 300),
+                                                     indexing='ij')
+        self.cbn_parameters = {'diamond_thickness': 2.2, 'seat_thickness': 5.3, 'small_cbn_seat_radius': 0.4,
+                               'large_cbn_seat_radius': 1.95, 'tilt': 3, 'tilt_rotation': 20,
+                               'diamond_abs_length': 13.7, 'seat_abs_length': 21.1, 'center_offset': 0,
+                               'center_offset_angle': 0}
+
+    def tearDown(self):
+        correction_cache.clear()
+
+    def test_evaluate_on_grid_is_within_tolerance(self):
+        exact = calculate_cbn_absorption(self.tth_array, self.azi_array, **self.cbn_parameters)
+        interpolated = evaluate_on_grid(calculate_cbn_absorption, self.tth_array, self.azi_array, grid_sizes=(64,),
+                                        tolerance=1e-4, **self.cbn_parameters)
+        self.assertEqual(interpolated.shape, exact.shape)
+        self.assertLess(np.max(np.abs(interpolated - exact)), 1e-4)
+
+    def test_evaluate_on_grid_with_oblique_angle_absorption(self):
+        parameters = {'detector_thickness': 40, 'absorption_length': 465.5, 'tilt': 5, 'rotation': 30}
+        tth_array, azi_array = np.deg2rad(self.tth_array), np.deg2rad(self.azi_array)
+        exact = calculate_oblique_angle_absorption(tth_array, azi_array, **parameters)
+        interpolated = evaluate_on_grid(calculate_oblique_angle_absorption, tth_array, azi_array, grid_sizes=(64,),
+                                        **parameters)
+        self.assertLess(np.max(np.abs(interpolated - exact)), 1e-4)
+
+    def test_correction_map_is_reused_for_same_parameters(self):
+        cbn_correction = CbnCorrection(self.tth_array, self.azi_array, tilt=3, tilt_rotation=20)
+        cbn_correction.update()
+        self.assertEqual(len(correction_cache), 1)
+        first_data = cbn_correction.get_data()
+
+        parameters = cbn_correction.get_params()
+        parameters['tilt'] = 4
+        cbn_correction.set_params(parameters)
+        cbn_correction.update()
+        self.assertEqual(len(correction_cache), 2)
+        self.assertFalse(np.array_equal(first_data, cbn_correction.get_data()))
+
+        parameters['tilt'] = 3
+        cbn_correction.set_params(parameters)
+        cbn_correction.update()
+        self.assertEqual(len(correction_cache), 2)
+        self.assertIs(cbn_correction.get_data(), first_data)
+
+    def test_correction_cache_discards_least_recently_used_maps(self):
+        cache = CorrectionCache(max_size=2)
+        cache.add('a', np.ones(3))
+        cache.add('b', np.ones(3))
+        cache.get('a')
+        cache.add('c', np.ones(3))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+
+        cache = CorrectionCache(max_bytes=10)
+        cache.add('a', np.ones(3))
+        self.assertEqual(len(cache), 1)
+        cache.add('b', np.ones(3))
+        self.assertEqual(len(cache), 1)
+        self.assertIsNotNone(cache.get('b'))
+
 
 from pyFAI.azimuthalIntegrator import AzimuthalIntegrator
 from ...model.util.ImgCorrection import CbnCorrection
@@ -21,8 +21,12 @@
 import unittest
 from mock import MagicMock
 import os
+import shutil
+import tempfile
 
 import numpy as np
+from PIL import Image
+import fabio
 
 from ..utility import QtTest
 from ...model.ImgModel import ImgModel, BackgroundDimensionWrongException
@@ -302,5 +306,136 @@ class ImgModelTest(QtTest):
         self.assertTrue(np.array_equal(2 * data1, self.img_model._img_data))
 
 
+class ImgModelPipelineTest(QtTest):
+    def setUp(self):
+        self.img_model = ImgModel()
+        self.img_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.tif'))
+
+    def tearDown(self):
+        del self.img_model
+
+    def test_img_data_is_cached(self):
+        img_data = self.img_model.img_data
+        self.assertIs(img_data, self.img_model.img_data)
+
+        self.img_model.factor = 2
+        self.assertIsNot(img_data, self.img_model.img_data)
+        np.testing.assert_array_equal(self.img_model.img_data, 2 * self.img_model.raw_img_data)
+
+    def test_img_data_pipeline_with_background_factor_and_supersampling(self):
+        raw_img_data = np.copy(self.img_model.raw_img_data)
+        self.img_model.background_data = np.ones(raw_img_data.shape)
+        self.img_model.background_scaling = 2
+        self.img_model.factor = 3
+        self.img_model.set_supersampling(2)
+
+        img_data = self.img_model.img_data
+        self.assertEqual(img_data.shape, (raw_img_data.shape[0] * 2, raw_img_data.shape[1] * 2))
+        np.testing.assert_array_equal(img_data[::2, 1::2], (raw_img_data - 2) * 3)
+
+        self.img_model.background_offset = 1
+        np.testing.assert_array_equal(self.img_model.img_data[1::2, ::2], (raw_img_data - 3) * 3)
+
+        self.img_model.set_supersampling(1)
+        self.img_model.reset_background()
+        np.testing.assert_array_equal(self.img_model.img_data, raw_img_data * 3)
+
+    def test_img_data_changes_with_new_raw_data(self):
+        self.img_model._img_data = np.ones((10, 10))
+        self.assertEqual(np.sum(self.img_model.img_data), 100)
+        self.img_model._img_data = np.zeros((10, 10))
+        self.assertEqual(np.sum(self.img_model.img_data), 0)
+
+
+class ImgModelLoaderTest(QtTest):
+    def setUp(self):
+        self.img_model = ImgModel()
+        self.temp_path = tempfile.mkdtemp()
+        self.tif_filename = os.path.join(data_path, 'CeO2_Pilatus1M.tif')
+
+    def tearDown(self):
+        del self.img_model
+        shutil.rmtree(self.temp_path)
+
+    def test_uncompressed_tiff_is_memory_mapped(self):
+        self.img_model.load(self.tif_filename)
+        self.assertIsInstance(self.img_model.raw_img_data, np.memmap)
+        np.testing.assert_array_equal(self.img_model.raw_img_data, np.array(Image.open(self.tif_filename))[::-1])
+
+    def test_compressed_tiff_is_read_with_pil(self):
+        filename = os.path.join(self.temp_path, 'compressed.tif')
+        img_data = np.arange(600, dtype=np.int32).reshape((20, 30))
+        Image.fromarray(img_data).save(filename, compression='tiff_deflate')
+
+        self.img_model.load(filename)
+        self.assertNotIsInstance(self.img_model.raw_img_data, np.memmap)
+        np.testing.assert_array_equal(self.img_model.raw_img_data, img_data[::-1])
+
+    def test_edf_is_memory_mapped(self):
+        filename = os.path.join(self.temp_path, 'image.edf')
+        img_data = np.arange(600, dtype=np.uint16).reshape((20, 30))
+        fabio.edfimage.EdfImage(data=img_data).write(filename)
+
+        self.img_model.load(filename)
+        self.assertIsInstance(self.img_model.raw_img_data, np.memmap)
+        np.testing.assert_array_equal(self.img_model.raw_img_data, img_data[::-1])
+
+        saved_filename = os.path.join(self.temp_path, 'saved.edf')
+        self.img_model.save(saved_filename)
+        np.testing.assert_array_equal(fabio.open(saved_filename).data, img_data)
+
+    def test_memory_mapped_file_is_not_changed(self):
+        filename = os.path.join(self.temp_path, 'image.tif')
+        shutil.copy(self.tif_filename, filename)
+        self.img_model.load(filename)
+        self.img_model.add(filename)
+        np.testing.assert_array_equal(np.array(Image.open(filename)), np.array(Image.open(self.tif_filename)))
+
+    def test_img_loader_order(self):
+        edf_filename = os.path.join(self.temp_path, 'image.edf')
+        fabio.edfimage.EdfImage(data=np.ones((20, 30))).write(edf_filename)
+        loader_key = (self.temp_path, '.edf')
+        self.assertEqual(self.img_model._get_img_loaders(edf_filename, loader_key)[0], self.img_model.load_fabio)
+
+        # an edf file with an unusual file ending, which is identified by its signature
+        img_filename = os.path.join(self.temp_path, 'image.img')
+        shutil.copy(edf_filename, img_filename)
+        self.img_model.load_PIL = MagicMock(wraps=self.img_model.load_PIL)
+        self.img_model._img_loaders[0] = self.img_model.load_PIL
+        self.img_model.load(img_filename)
+        self.img_model.load_PIL.assert_not_called()
+
+    def test_successful_img_loader_is_remembered(self):
+        self.img_model.load(self.tif_filename)
+        self.assertEqual(self.img_model._successful_img_loaders[(data_path, '.tif')], self.img_model.load_PIL)
+
+        self.img_model.load(os.path.join(spe_path, 'CeO2_PI_CCD_Mo.SPE'))
+        self.assertEqual(self.img_model._successful_img_loaders[(spe_path, '.spe')], self.img_model.load_spe)
+        self.assertEqual(self.img_model._get_img_loaders(os.path.join(spe_path, 'other.spe'),
+                                                         (spe_path, '.spe'))[0], self.img_model.load_spe)
+
+    def test_next_files_are_prefetched(self):
+        filenames = [os.path.join(self.temp_path, 'image_{0:03d}.tif'.format(ind)) for ind in range(1, 6)]
+        for filename in filenames:
+            shutil.copy(self.tif_filename, filename)
+        self.img_model.prefetch_num_images = 2
+
+        self.img_model.load(filenames[0])
+        self.img_model.load_next_file()
+        self.img_model._img_prefetcher.wait()
+        self.assertEqual(self.img_model._img_prefetcher.filenames, filenames[2:4])
+        self.assertEqual(self.img_model.file_name_iterator.complete_path, filenames[1])
+
+        self.img_model.get_image_data = MagicMock(wraps=self.img_model.get_image_data)
+        self.img_model.load_next_file()
+        self.img_model.get_image_data.assert_not_called()
+        self.assertEqual(self.img_model.filename, filenames[2])
+        np.testing.assert_array_equal(self.img_model.raw_img_data, np.array(Image.open(self.tif_filename))[::-1])
+
+        self.img_model.load_previous_file()
+        self.img_model._img_prefetcher.wait()
+        self.assertEqual(self.img_model._img_prefetcher.filenames, filenames[:1])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+
+import numpy as np
+from PIL import Image
+from pyFAI.azimuthalIntegrator import AzimuthalIntegrator
+from pyFAI.detectors import detector_factory
+
+from ..utility import QtTest
+from ...model.util.IntegratorCache import IntegratorCache
+from ...model.CalibrationModel import CalibrationModel
+from ...model.ImgModel import ImgModel
+
+unittest_path = os.path.dirname(__file__)
+data_path = os.path.join(unittest_path, '../data')
+
+
+class IntegratorCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = IntegratorCache(max_size=2)
+        self.geometry = AzimuthalIntegrator()
+        self.geometry.load(os.path.join(data_path, 'CeO2_Pilatus1M.poni'))
+
+    def test_same_settings_give_same_integrator(self):
+        integrator1 = self.cache.get_integrator(self.geometry, (100, 100), unit='2th_deg', npt=100)
+        integrator2 = self.cache.get_integrator(self.geometry, (100, 100), unit='2th_deg', npt=100)
+        self.assertIs(integrator1, integrator2)
+        self.assertEqual(integrator1.dist, self.geometry.dist)
+        self.assertEqual(integrator1.wavelength, self.geometry.wavelength)
+
+    def test_different_settings_give_different_integrators(self):
+        integrator = self.cache.get_integrator(self.geometry, (100, 100), unit='2th_deg', npt=100)
+        self.assertIsNot(integrator, self.cache.get_integrator(self.geometry, (100, 101), unit='2th_deg', npt=100))
+        self.assertIsNot(integrator, self.cache.get_integrator(self.geometry, (100, 100), unit='q_A^-1', npt=100))
+
+        mask = np.zeros((100, 100))
+        mask_integrator = self.cache.get_integrator(self.geometry, (100, 100), mask=mask, unit='2th_deg', npt=100)
+        mask[10, 10] = 1
+        self.assertIsNot(mask_integrator,
+                         self.cache.get_integrator(self.geometry, (100, 100), mask=mask, unit='2th_deg', npt=100))
+
+        self.geometry.pixel1 = self.geometry.pixel1 / 2.0
+        new_integrator = self.cache.get_integrator(self.geometry, (100, 100), unit='2th_deg', npt=100)
+        self.assertIsNot(integrator, new_integrator)
+        self.assertEqual(new_integrator.pixel1, self.geometry.pixel1)
+
+    def test_least_recently_used_integrator_is_removed(self):
+        integrator1 = self.cache.get_integrator(self.geometry, (100, 100), npt=100)
+        integrator2 = self.cache.get_integrator(self.geometry, (100, 100), npt=200)
+        self.cache.get_integrator(self.geometry, (100, 100), npt=100)
+        self.cache.get_integrator(self.geometry, (100, 100), npt=300)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertIs(integrator1, self.cache.get_integrator(self.geometry, (100, 100), npt=100))
+        self.assertIsNot(integrator2, self.cache.get_integrator(self.geometry, (100, 100), npt=200))
+
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+
+    def test_detector_of_the_geometry_is_used(self):
+        self.geometry.detector = detector_factory('Pilatus1M')  # with the mask of the module gaps
+        img_data = np.array(Image.open(os.path.join(data_path, 'CeO2_Pilatus1M.tif')))
+
+        integrator = self.cache.get_integrator(self.geometry, img_data.shape, unit='2th_deg', npt=1000,
+                                               method='csr')
+        self.assertIsNot(integrator.detector, self.geometry.detector)
+        self.assertEqual(integrator.detector.name, 'Pilatus 1M')
+        _, y_cached = integrator.integrate1d(img_data, 1000, unit='2th_deg', method='csr')
+        _, y_geometry = self.geometry.integrate1d(img_data, 1000, unit='2th_deg', method='csr')
+        np.testing.assert_array_almost_equal(y_cached, y_geometry)
+
+    def test_different_detector_gives_different_integrator(self):
+        integrator = self.cache.get_integrator(self.geometry, (100, 100), unit='2th_deg', npt=100)
+        pixel1, pixel2 = self.geometry.pixel1, self.geometry.pixel2
+        self.geometry.detector = detector_factory('Pilatus1M')
+        self.geometry.pixel1, self.geometry.pixel2 = pixel1, pixel2
+        self.assertIsNot(integrator, self.cache.get_integrator(self.geometry, (100, 100), unit='2th_deg', npt=100))
+
+
+class CalibrationModelIntegratorCacheTest(QtTest):
+    def setUp(self):
+        self.img_model = ImgModel()
+        self.img_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.tif'))
+        self.calibration_model = CalibrationModel(self.img_model, IntegratorCache())
+        self.calibration_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.poni'))
+
+    def test_integrator_is_reused_after_changing_the_unit(self):
+        _, y1 = self.calibration_model.integrate_1d(num_points=1000)
+        self.calibration_model.integrate_1d(num_points=1000, unit='q_A^-1')
+        self.assertEqual(len(self.calibration_model.integrator_cache), 2)
+
+        _, y2 = self.calibration_model.integrate_1d(num_points=1000)
+        self.assertEqual(len(self.calibration_model.integrator_cache), 2)
+        np.testing.assert_array_equal(y1, y2)
+
+    def test_integrator_is_reused_after_supersampling_reset(self):
+        self.calibration_model.integrate_1d(num_points=1000)
+        self.calibration_model.reset_supersampling()
+        self.calibration_model.set_supersampling()
+        self.calibration_model.integrate_1d(num_points=1000)
+        self.assertEqual(len(self.calibration_model.integrator_cache), 1)
+
+    def test_d_spacing_integration(self):
+        tth, _ = self.calibration_model.integrate_1d(num_points=1000)
+        d, _ = self.calibration_model.integrate_1d(num_points=1000, unit='d_A')
+        np.testing.assert_array_almost_equal(
+            d, self.calibration_model.wavelength / (2 * np.sin(tth / 360 * np.pi)) * 1e10)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+
+import numpy as np
+
+from ...model.util.MaskHistory import MaskHistory, MaskPatch
+
+
+class MaskPatchTest(unittest.TestCase):
+    def test_restore_whole_mask(self):
+        mask = np.random.random((13, 17)) > 0.5
+        patch = MaskPatch(mask)
+        self.assertTrue(np.array_equal(patch.get_data(), mask))
+        self.assertTrue(np.array_equal(patch.apply(np.zeros_like(mask)), mask))
+
+    def test_restore_region(self):
+        mask = np.zeros((20, 20), dtype=bool)
+        region = (slice(2, 5), slice(3, 10))
+        patch = MaskPatch(mask, region)
+        self.assertEqual(patch.shape, (3, 7))
+
+        changed_mask = np.ones((20, 20), dtype=bool)
+        restored_mask = patch.apply(changed_mask)
+        self.assertFalse(np.any(restored_mask[region]))
+        self.assertEqual(np.sum(restored_mask), 400 - 21)
+        self.assertTrue(np.all(changed_mask))
+
+    def test_patch_is_compressed(self):
+        mask = np.zeros((1000, 1000), dtype=bool)
+        mask[100:200, 300:400] = True
+        self.assertLess(MaskPatch(mask).nbytes, mask.nbytes / 100)
+
+
+class MaskHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.history = MaskHistory()
+        self.mask = np.zeros((30, 30), dtype=bool)
+
+    def change(self, region):
+        self.history.save(self.mask, region)
+        self.mask = self.mask.copy()
+        self.mask[region] = True
+
+    def test_undo_and_redo(self):
+        self.assertIsNone(self.history.undo(self.mask))
+        first_region = (slice(0, 5), slice(0, 5))
+        second_region = (slice(3, 10), slice(3, 10))
+        self.change(first_region)
+        first_mask = self.mask
+        self.change(second_region)
+        second_mask = self.mask
+
+        self.mask = self.history.undo(self.mask)
+        self.assertTrue(np.array_equal(self.mask, first_mask))
+        self.mask = self.history.undo(self.mask)
+        self.assertFalse(np.any(self.mask))
+        self.assertIsNone(self.history.undo(self.mask))
+
+        self.mask = self.history.redo(self.mask)
+        self.assertTrue(np.array_equal(self.mask, first_mask))
+        self.mask = self.history.redo(self.mask)
+        self.assertTrue(np.array_equal(self.mask, second_mask))
+        self.assertIsNone(self.history.redo(self.mask))
+
+    def test_new_change_clears_redo_steps(self):
+        self.change((slice(0, 5), slice(0, 5)))
+        self.mask = self.history.undo(self.mask)
+        self.assertEqual(self.history.redo_steps, 1)
+        self.change(None)
+        self.assertEqual(self.history.redo_steps, 0)
+        self.assertEqual(self.history.undo_steps, 1)
+
+    def test_memory_limit_discards_oldest_steps(self):
+        self.mask = np.random.random((100, 100)) > 0.5
+        patch_size = MaskPatch(self.mask).nbytes
+        self.history = MaskHistory(max_bytes=int(2.5 * patch_size))
+        for _ in range(5):
+            self.history.save(self.mask)
+        self.assertEqual(self.history.undo_steps, 2)
+        self.assertLessEqual(self.history.nbytes, 2.5 * patch_size)
+
+        # the latest step is kept even if it exceeds the limit
+        self.history = MaskHistory(max_bytes=1)
+        self.history.save(self.mask)
+        self.assertEqual(self.history.undo_steps, 1)
+
+    def test_maximum_number_of_steps(self):
+        self.history = MaskHistory(max_steps=3)
+        for _ in range(5):
+            self.change(None)
+        self.assertEqual(self.history.undo_steps, 3)
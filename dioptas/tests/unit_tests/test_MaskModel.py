@@ -21,8 +21,10 @@
 import unittest
 import gc
 import os
+import sys
 import numpy as np
 from math import sqrt, atan2, cos, sin
+from mock import patch
 from qtpy import QtCore
 
 from ...model.MaskModel import MaskModel
@@ -141,12 +143,111 @@ class MaskModelTest(unittest.TestCase):
                                                  [1, 1, 1, 1, 1, 1]]))
                         )
 
+    def test_supersampled_mask_follows_mask_changes(self):
+        self.mask_model.set_supersampling(2)
+        self.assertEqual(self.mask_model.get_mask().shape, (20, 20))
+        self.assertEqual(self.mask_model.get_mask().dtype, bool)
+        self.assertFalse(np.any(self.mask_model.get_mask()))
+
+        self.mask_model.mask_rect(1, 1, 2, 2)
+        mask = self.mask_model.get_mask()
+        self.assertEqual(np.sum(mask), 4 * np.sum(self.mask_model.get_img()))
+        self.assertTrue(np.all(mask[2:4, 2:4]))
+        self.assertIs(mask, self.mask_model.get_mask())
+
+    def test_supersampled_mask_follows_all_mask_changes(self):
+        self.mask_model.set_supersampling(2)
+        self.mask_model.roi = [0, 10, 0, 10]
+
+        self.mask_model.mask_rect(1, 1, 2, 2)
+        self.assertEqual(np.sum(self.mask_model.get_mask()), 16)
+        self.mask_model.grow()
+        self.assertEqual(np.sum(self.mask_model.get_mask()), 4 * np.sum(self.mask_model.get_img()))
+        self.mask_model.undo()
+        self.assertEqual(np.sum(self.mask_model.get_mask()), 16)
+        self.mask_model.redo()
+        self.assertEqual(np.sum(self.mask_model.get_mask()), 4 * np.sum(self.mask_model.get_img()))
+        self.mask_model.clear_mask()
+        self.assertFalse(np.any(self.mask_model.get_mask()))
+        self.mask_model.set_mask(np.ones((10, 10), dtype=bool))
+        self.assertTrue(np.all(self.mask_model.get_mask()))
+        self.mask_model.invert_mask()
+        self.assertFalse(np.any(self.mask_model.get_mask()))
+        self.mask_model.set_dimension((5, 5))
+        self.assertEqual(self.mask_model.get_mask().shape, (10, 10))
+
+    def test_roi_mask_is_cached_until_roi_changes(self):
+        self.mask_model.roi = [0, 2, 0, 2]
+        roi_mask = self.mask_model.roi_mask
+        self.assertEqual(roi_mask.dtype, bool)
+        self.assertIs(roi_mask, self.mask_model.roi_mask)
+
+        self.mask_model.roi = [0, 3, 0, 3]
+        self.assertEqual(np.sum(self.mask_model.roi_mask), 100 - 9)
+
+    def test_undo_and_redo(self):
+        self.mask_model.mask_rect(2, 2, 3, 3)
+        self.mask_model.mask_ellipse(7, 7, 2, 2)
+        after_ellipse = np.copy(self.mask_model.get_mask())
+        self.mask_model.invert_mask()
+
+        self.mask_model.undo()
+        self.assertTrue(np.array_equal(self.mask_model.get_mask(), after_ellipse))
+        self.mask_model.undo()
+        self.assertEqual(np.sum(self.mask_model.get_mask()), 9)
+        self.mask_model.undo()
+        self.assertEqual(np.sum(self.mask_model.get_mask()), 0)
+        self.mask_model.undo()
+        self.assertEqual(np.sum(self.mask_model.get_mask()), 0)
+
+        self.mask_model.redo()
+        self.mask_model.redo()
+        self.assertTrue(np.array_equal(self.mask_model.get_mask(), after_ellipse))
+        self.mask_model.redo()
+        self.assertTrue(np.array_equal(self.mask_model.get_mask(), np.logical_not(after_ellipse)))
+
+    def test_undo_polygon_only_stores_changed_region(self):
+        self.mask_model.set_dimension((1000, 1000))
+        self.mask_model.mask_polygon(np.array([10, 30, 20]), np.array([10, 10, 40]))
+        self.assertEqual(self.mask_model._history._undo_patches[-1].shape, (31, 21))
+        self.mask_model.undo()
+        self.assertEqual(np.sum(self.mask_model.get_mask()), 0)
+
     def test_save_mask(self):
         self.mask_model.mask_below_threshold(self.img, 1)
         self.mask_model.save_mask(os.path.join(data_path, "test_save.mask"))
 
         self.assertTrue(os.path.exists(os.path.join(data_path, "test_save.mask")))
 
+    def test_save_and_load_packed_mask(self):
+        self.mask_model.mask_rect(2, 2, 3, 3)
+        filename = os.path.join(data_path, 'test_save.h5')
+        try:
+            self.mask_model.save_mask(filename)
+            self.mask_model.clear_mask()
+            self.assertTrue(self.mask_model.load_mask(filename))
+            self.assertEqual(np.sum(self.mask_model.get_mask()), 9)
+        finally:
+            delete_if_exists(filename)
+
+    def test_remove_cosmic(self):
+        img = np.ones((50, 50)) * 100 + np.random.RandomState(0).random_sample((50, 50))
+        img[20, 30] = 1e5
+        self.mask_model.set_dimension(img.shape)
+        self.mask_model.remove_cosmic(img, num_workers=1)
+        self.assertTrue(self.mask_model.get_mask()[20, 30])
+
+        self.mask_model.undo()
+        self.assertFalse(np.any(self.mask_model.get_mask()))
+
+    def test_remove_cosmic_does_not_fork_worker_processes(self):
+        img = np.ones((50, 50))
+        self.mask_model.set_dimension(img.shape)
+        with patch.object(sys.modules[MaskModel.__module__], 'find_cosmics',
+                          return_value=np.zeros(img.shape, dtype=bool)) as find_cosmics_mock:
+            self.mask_model.remove_cosmic(img)
+        self.assertIn(find_cosmics_mock.call_args[1]['start_method'], ['forkserver', 'spawn'])
+
     def test_find_center_of_circle_from_three_points(self):
         x0 = 2.0
         y0 = 3.5
@@ -20,8 +20,13 @@
 
 import os
 import shutil
+import tempfile
+import threading
+import time
 
 from mock import MagicMock
+from qtpy import QtWidgets
+from qtpy.QtTest import QSignalSpy
 
 from ..utility import QtTest
 from ...model.util.NewFileWatcher import NewFileInDirectoryWatcher
@@ -29,24 +34,119 @@ from ...model.util.NewFileWatcher import NewFileInDirectoryWatcher
 unittest_data_path = os.path.join(os.path.dirname(__file__), '../data')
 
 
+def wait_for_signals(signal_spy, count=1, timeout=5000):
+    """
+    Runs the event loop until the spied signal has been emitted count times or the timeout (in ms) is reached. Signals
+    emitted from the background thread can be recorded before QSignalSpy.wait is called, therefore the spy is waited
+    for in short intervals.
+    """
+    end_time = time.time() + timeout / 1000.0
+    while len(signal_spy) < count and time.time() < end_time:
+        signal_spy.wait(50)
+    return len(signal_spy) >= count
+
+
 class NewFileInDirectoryWatcherTest(QtTest):
     def setUp(self):
-        self.directory_watcher = NewFileInDirectoryWatcher(path=None)
+        self.temp_path = tempfile.mkdtemp()
+        self.directory_watcher = NewFileInDirectoryWatcher(path=None, check_interval=0.05)
+        self.callback_fcn = MagicMock()
+        self.directory_watcher.path = self.temp_path
+        self.directory_watcher.file_added.connect(self.callback_fcn)
+        self.directory_watcher.file_types.add('.tif')
+        self.file_added_spy = QSignalSpy(self.directory_watcher.file_added)
 
     def tearDown(self):
-        if os.path.exists(os.path.join(unittest_data_path, 'image_003.tif')):
-            os.remove(os.path.join(unittest_data_path, 'image_003.tif'))
+        self.directory_watcher.track_changes = False
+        self.directory_watcher.deactivate()
+        shutil.rmtree(self.temp_path)
+
+    def add_files(self, *filenames):
+        for filename in filenames:
+            shutil.copy2(os.path.join(unittest_data_path, 'CeO2_Pilatus1M.tif'), os.path.join(self.temp_path, filename))
+        self.directory_watcher._file_system_watcher.directoryChanged.emit(self.temp_path)
+
+    def get_emitted_filenames(self):
+        return [os.path.basename(call[0][0]) for call in self.callback_fcn.call_args_list]
 
     def test_getting_callback_for_new_file(self):
-        callback_fcn = MagicMock()
+        self.directory_watcher.activate()
+        self.add_files('image_003.tif')
 
-        self.directory_watcher.path = unittest_data_path
-        self.directory_watcher.file_added.connect(callback_fcn)
-        self.directory_watcher.file_types.add('.tif')
+        self.assertTrue(wait_for_signals(self.file_added_spy))
+        self.callback_fcn.assert_called_once_with(os.path.join(self.temp_path, 'image_003.tif'))
+
+    def test_no_callback_when_deactivated(self):
+        self.add_files('image_003.tif')
+        self.directory_watcher.activate()
+        self.directory_watcher.deactivate()
+        self.add_files('image_004.tif')
+
+        # the background thread has been joined by deactivate, so nothing can be emitted anymore
+        self.assertIsNone(self.directory_watcher._thread)
+        QtWidgets.QApplication.processEvents()
+        self.callback_fcn.assert_not_called()
+
+    def test_all_files_of_a_burst_are_emitted_in_order(self):
+        self.directory_watcher.activate()
+        self.add_files('image_002.tif', 'image_001.tif', 'notes.txt', 'image_003.tif')
+
+        self.assertTrue(wait_for_signals(self.file_added_spy, 3))
+        self.assertEqual(self.get_emitted_filenames(), ['image_001.tif', 'image_002.tif', 'image_003.tif'])
+
+    def test_skip_to_latest_file(self):
+        self.directory_watcher.queue_policy = 'latest'
+        self.directory_watcher.activate()
+        self.add_files('image_001.tif', 'image_002.tif', 'image_003.tif')
+
+        self.assertTrue(wait_for_signals(self.file_added_spy))
+        self.directory_watcher.deactivate()  # joins the background thread, no further files can be released
+        QtWidgets.QApplication.processEvents()
+        self.assertEqual(self.get_emitted_filenames(), ['image_003.tif'])
+
+    def test_queue_size_is_limited(self):
+        self.directory_watcher.max_queue_size = 2
+        self.directory_watcher.activate()
+        self.add_files('image_001.tif', 'image_002.tif', 'image_003.tif')
+
+        self.assertTrue(wait_for_signals(self.file_added_spy, 2))
+        self.assertEqual(self.get_emitted_filenames(), ['image_002.tif', 'image_003.tif'])
+
+    def test_file_is_emitted_after_it_is_completely_written(self):
+        self.directory_watcher.check_interval = 0.5
         self.directory_watcher.activate()
+        filename = os.path.join(self.temp_path, 'image_001.tif')
+
+        def write_file():
+            with open(filename, 'wb') as f:
+                for _ in range(6):
+                    f.write(b'0' * 100)
+                    f.flush()
+                    self.directory_watcher._directory_changed()
+                    time.sleep(0.03)
+
+        writer_thread = threading.Thread(target=write_file)
+        writer_thread.start()
+        writer_thread.join()
+        self.assertEqual(len(self.directory_watcher._ready_files), 0)
+        self.callback_fcn.assert_not_called()
+
+        self.assertTrue(wait_for_signals(self.file_added_spy))
+        self.callback_fcn.assert_called_once_with(filename)
+
+    def test_changes_are_reported_when_tracking(self):
+        self.add_files('image_001.tif', 'image_002.tif')
+        files_changed_spy = QSignalSpy(self.directory_watcher.files_changed)
+        self.directory_watcher.track_changes = True
 
-        shutil.copy2(os.path.join(unittest_data_path, 'image_001.tif'),
-                     os.path.join(unittest_data_path, 'image_003.tif'))
+        self.assertTrue(wait_for_signals(files_changed_spy))
+        self.assertEqual(files_changed_spy[0], [self.temp_path, ['image_001.tif', 'image_002.tif'], []])
 
-        self.directory_watcher._file_system_watcher.directoryChanged.emit('test')
-        callback_fcn.assert_called_with(os.path.join(unittest_data_path, 'image_003.tif'))
+        # report both changes with a single directory change
+        self.directory_watcher._file_system_watcher.blockSignals(True)
+        os.remove(os.path.join(self.temp_path, 'image_001.tif'))
+        self.add_files('image_003.tif')
+        self.directory_watcher._directory_changed()
+        self.assertTrue(wait_for_signals(files_changed_spy, 2))
+        self.assertEqual(files_changed_spy[1], [self.temp_path, ['image_003.tif'], ['image_001.tif']])
+        self.callback_fcn.assert_not_called()
@@ -20,6 +20,8 @@
 
 import unittest
 import os
+import shutil
+import tempfile
 import numpy as np
 from numpy.testing import assert_array_almost_equal
 
@@ -53,4 +55,17 @@ class OverlayModelTest(unittest.TestCase):
         self.overlay_model.add_overlay_file(filename)
 
         self.assertEqual(len(self.overlay_model.overlays), 1)
-        self.assertEqual(self.overlay_model.get_overlay(0).name, ''.join(os.path.basename(filename).split('.')[0:-1]))
\ No newline at end of file
+        self.assertEqual(self.overlay_model.get_overlay(0).name, ''.join(os.path.basename(filename).split('.')[0:-1]))
+
+    def test_add_overlay_from_binary_file(self):
+        pattern = Pattern()
+        pattern.load(os.path.join(data_path, 'pattern_001.xy'))
+        temp_path = tempfile.mkdtemp()
+        binary_filename = os.path.join(temp_path, 'pattern_001.h5')
+        pattern.save(binary_filename)
+
+        self.overlay_model.add_overlay_file(binary_filename)
+        shutil.rmtree(temp_path)
+        self.assertEqual(self.overlay_model.get_overlay(0).name, 'pattern_001')
+        np.testing.assert_array_equal(self.overlay_model.get_overlay(0).x, pattern.x)
+        np.testing.assert_array_equal(self.overlay_model.get_overlay(0).y, pattern.y)
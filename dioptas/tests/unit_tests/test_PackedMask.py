@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from ...model.util.PackedMask import pack_mask, unpack_mask, write_mask_dataset, read_mask_dataset, \
+    save_mask_file, load_mask_file
+
+
+class PackedMaskTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = tempfile.mkdtemp()
+        self.mask = np.random.random((37, 51)) > 0.7
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def test_pack_and_unpack(self):
+        packed_mask = pack_mask(self.mask)
+        self.assertEqual(packed_mask.dtype, np.uint8)
+        self.assertEqual(packed_mask.size, int(np.ceil(self.mask.size / 8)))
+
+        unpacked_mask = unpack_mask(packed_mask, self.mask.shape)
+        self.assertEqual(unpacked_mask.dtype, bool)
+        self.assertTrue(np.array_equal(unpacked_mask, self.mask))
+
+    def test_pack_non_boolean_mask(self):
+        mask = self.mask.astype(np.int8)
+        self.assertTrue(np.array_equal(unpack_mask(pack_mask(mask), mask.shape), self.mask))
+
+    def test_save_and_load_mask_file(self):
+        filename = os.path.join(self.temp_path, 'test.h5')
+        save_mask_file(filename, self.mask)
+        self.assertTrue(np.array_equal(load_mask_file(filename), self.mask))
+
+    def test_load_file_without_mask(self):
+        filename = os.path.join(self.temp_path, 'test.h5')
+        with h5py.File(filename, 'w') as f:
+            f.create_dataset('data', data=np.zeros(10))
+        with self.assertRaises(ValueError):
+            load_mask_file(filename)
+
+    def test_shared_masks_are_stored_once(self):
+        filename = os.path.join(self.temp_path, 'test.h5')
+        other_mask = np.logical_not(self.mask)
+        with h5py.File(filename, 'w') as f:
+            shared_group = f.create_group('masks')
+            for ind, mask in enumerate([self.mask, other_mask, self.mask]):
+                write_mask_dataset(f.create_group(str(ind)), 'mask', mask, shared_group=shared_group)
+
+        with h5py.File(filename, 'r') as f:
+            self.assertEqual(len(f['masks']), 2)
+            self.assertTrue(np.array_equal(read_mask_dataset(f['0/mask']), self.mask))
+            self.assertTrue(np.array_equal(read_mask_dataset(f['1/mask']), other_mask))
+            self.assertTrue(np.array_equal(read_mask_dataset(f['2/mask']), self.mask))
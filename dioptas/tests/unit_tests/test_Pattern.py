@@ -22,6 +22,7 @@ import unittest
 import os
 
 import numpy as np
+from mock import patch
 
 from ...model.util.Pattern import BkgNotInRangeError
 from ...model.util import Pattern
@@ -228,5 +229,23 @@ class PatternTest(unittest.TestCase):
         self.assertEqual(len(spec), 234)
 
 
+    def test_automatic_background_is_not_fitted_again_for_scaling_and_offset(self):
+        x = np.linspace(0, 24, 2500)
+        y = gaussian(x, 10, 6, 0.1) + x * 0.4 + 5.0
+        pattern = Pattern(x, y)
+        pattern.set_auto_background_subtraction([2, 50, 50])
+        _, y_spec = pattern.data
+
+        with patch('dioptas.model.util.BackgroundExtraction.extract_background') as extract_background_mock:
+            pattern.scaling = 2
+            pattern.offset = 3
+            pattern.set_smoothing(1)
+            pattern.set_smoothing(0)
+            self.assertFalse(extract_background_mock.called)
+
+        _, y_scaled_spec = pattern.data
+        self.array_almost_equal(y_scaled_spec, y_spec * 2)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import numpy as np
+
+from ...model.util.Pattern import Pattern
+from ...model.util.PatternCombiner import PatternCombiner, combine_pattern_data
+
+
+class PatternCombinerTest(unittest.TestCase):
+    def setUp(self):
+        self.combiner = PatternCombiner()
+
+    def test_non_overlapping_parts_are_kept(self):
+        x1 = np.linspace(0, 10, 101)
+        x2 = np.linspace(7, 15, 81)
+        x, y = combine_pattern_data([(x2, np.ones(x2.shape) * 2), (x1, np.ones(x1.shape))])
+
+        self.assertTrue(np.all(np.diff(x) > 0))
+        np.testing.assert_array_almost_equal(x, np.linspace(0, 15, 151))
+        np.testing.assert_array_almost_equal(y[x < 7], 1)
+        np.testing.assert_array_almost_equal(y[x > 10], 2)
+
+    def test_overlap_is_blended_without_steps(self):
+        x1 = np.linspace(0, 10, 101)
+        x2 = np.linspace(7, 15, 81)
+        x, y = combine_pattern_data([(x1, np.ones(x1.shape)), (x2, np.ones(x2.shape) * 2)])
+
+        overlap = (x >= 7) & (x <= 10)
+        self.assertTrue(np.all(np.diff(y[overlap]) >= 0))
+        self.assertAlmostEqual(y[np.argmin(np.abs(x - 8.5))], 1.5, places=5)
+        self.assertLess(np.max(np.abs(np.diff(y))), 0.1)
+
+    def test_contained_pattern(self):
+        x1 = np.linspace(0, 10, 101)
+        x2 = np.linspace(4, 6, 21)
+        x, y = combine_pattern_data([(x1, np.ones(x1.shape)), (x2, np.ones(x2.shape) * 3)])
+
+        np.testing.assert_array_almost_equal(x, x1)
+        self.assertAlmostEqual(y[0], 1)
+        self.assertAlmostEqual(y[-1], 1)
+        self.assertAlmostEqual(y[40], 1, places=5)
+        self.assertAlmostEqual(y[60], 1, places=5)
+        self.assertGreater(y[50], 1.2)
+        self.assertLess(y[50], 3)
+
+    def test_result_is_cached_until_pattern_changes(self):
+        pattern1 = Pattern(np.linspace(0, 10, 101), np.ones(101))
+        pattern2 = Pattern(np.linspace(7, 15, 81), np.ones(81) * 2)
+
+        combined_pattern = self.combiner.combine([pattern1, pattern2])
+        self.assertEqual(combined_pattern.name, "Combined Pattern")
+        self.assertIs(self.combiner.combine([pattern1, pattern2]), combined_pattern)
+
+        pattern2.data = np.linspace(7, 15, 81), np.ones(81) * 3
+        new_combined_pattern = self.combiner.combine([pattern1, pattern2])
+        self.assertIsNot(new_combined_pattern, combined_pattern)
+        self.assertAlmostEqual(new_combined_pattern.y[-1], 3)
+
+        self.assertIsNot(self.combiner.combine([pattern1]), new_combined_pattern)
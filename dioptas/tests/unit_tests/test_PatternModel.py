@@ -20,11 +20,14 @@
 
 import unittest
 import os
+import shutil
+import tempfile
 import numpy as np
 from numpy.testing import assert_array_almost_equal
 
 from ...model.PatternModel import Pattern, PatternModel
 from ...model.util.PeakShapes import gaussian
+from ...model.util.PatternFile import read_binary_pattern
 
 unittest_path = os.path.dirname(__file__)
 data_path = os.path.join(unittest_path, '../data')
@@ -36,6 +39,10 @@ class PatternModelTest(unittest.TestCase):
         self.y = np.sin(self.x)
         self.pattern = Pattern(self.x, self.y)
         self.pattern_model = PatternModel()
+        self.temp_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
 
     def test_set_pattern(self):
         self.pattern_model.set_pattern(self.x, self.y, 'hoho')
@@ -73,5 +80,42 @@ class PatternModelTest(unittest.TestCase):
         self.assertAlmostEqual(np.sum(y_spec - y), 0)
 
 
+    def test_saved_text_patterns_are_the_same_as_formatted_point_by_point(self):
+        self.pattern_model.set_pattern(self.x, self.y * 1000, 'hoho', '2th_deg')
+        filename = os.path.join(self.temp_path, 'test.xy')
+
+        self.pattern_model.save_pattern(filename, header='# header')
+        with open(filename) as f:
+            content = f.read()
+        expected = '# header\n' + ''.join('{0:.9E}  {1:.9E}\n'.format(x, y) for x, y in zip(self.x, self.y * 1000))
+        self.assertEqual(content, expected)
+
+        filename = os.path.join(self.temp_path, 'test.fxye')
+        self.pattern_model.save_pattern(filename, header='NUM_POINTS MIN_X_VAL STEP_X_VAL')
+        with open(filename) as f:
+            lines = f.readlines()
+        self.assertEqual(lines[0], '100 10 15.0505\n')
+        self.assertEqual(lines[5], '\t{0:.6g}\t{1:.6g}\t{2:.6g}\n'.format(100 * self.x[4], self.y[4] * 1000,
+                                                                          np.sqrt(abs(self.y[4] * 1000))))
+
+        filename = os.path.join(self.temp_path, 'test.chi')
+        self.pattern_model.save_pattern(filename)
+        pattern_model = PatternModel()
+        pattern_model.load_pattern(filename)
+        assert_array_almost_equal(pattern_model.pattern.x, self.x)
+
+    def test_save_and_load_binary_pattern(self):
+        self.pattern_model.set_pattern(self.x, self.y, 'hoho', 'q_A^-1')
+        filename = os.path.join(self.temp_path, 'test.h5')
+        self.pattern_model.save_pattern(filename, header='# header')
+
+        pattern_model = PatternModel()
+        pattern_model.load_pattern(filename)
+        np.testing.assert_array_equal(pattern_model.pattern.x, self.x)
+        np.testing.assert_array_equal(pattern_model.pattern.y, self.y)
+        self.assertEqual(pattern_model.pattern.name, 'test')
+        self.assertEqual(read_binary_pattern(filename)[2], 'q_A^-1')
+
+
 if __name__ == '__main__':
     unittest.main()
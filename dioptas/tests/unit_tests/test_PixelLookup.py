@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import unittest
+
+import numpy as np
+from pyFAI.azimuthalIntegrator import AzimuthalIntegrator
+
+from ...model.util.PixelLookup import PixelLookup, get_continuous_segments
+
+unittest_path = os.path.dirname(__file__)
+data_path = os.path.join(unittest_path, '../data')
+
+
+class PixelLookupTest(unittest.TestCase):
+    def setUp(self):
+        self.geometry = AzimuthalIntegrator()
+        self.geometry.load(os.path.join(data_path, 'CeO2_Pilatus1M.poni'))
+        self.shape = (1043, 981)
+        self.lookup = PixelLookup()
+
+    def assert_pixel_positions_are_correct(self):
+        tth_array = np.fromfunction(self.geometry.tth, self.shape, dtype=np.float32)
+        chi_array = np.fromfunction(self.geometry.chi, self.shape, dtype=np.float32)
+        random_state = np.random.RandomState(0)
+        for ind1, ind2 in zip(random_state.randint(0, self.shape[0], 20), random_state.randint(0, self.shape[1], 20)):
+            position = self.lookup.get_pixel_position(self.geometry, self.shape, tth_array[ind1, ind2],
+                                                      chi_array[ind1, ind2])
+            self.assertIsNotNone(position)
+            self.assertAlmostEqual(position[0], ind1, places=3)
+            self.assertAlmostEqual(position[1], ind2, places=3)
+
+    def test_pixel_positions(self):
+        self.assert_pixel_positions_are_correct()
+
+    def test_pixel_positions_after_geometry_change(self):
+        self.assert_pixel_positions_are_correct()
+        self.geometry.rot1 += 0.05
+        self.geometry.dist *= 1.2
+        self.assert_pixel_positions_are_correct()
+
+    def test_position_outside_of_detector(self):
+        self.assertIsNone(self.lookup.get_pixel_position(self.geometry, self.shape, np.deg2rad(60), 0))
+        self.assertIsNone(self.lookup.get_pixel_position(self.geometry, self.shape, np.deg2rad(30), np.pi))
+
+    def test_ring_segments(self):
+        tth = np.deg2rad(10)
+        segments = self.lookup.get_ring_segments(self.geometry, self.shape, tth)
+        self.assertEqual(len(segments), 1)
+        # the full ring is closed
+        self.assertTrue(np.array_equal(segments[0][0], segments[0][-1]))
+        self.assertTrue(np.allclose(self.geometry.tth(segments[0][:, 0], segments[0][:, 1]), tth))
+
+    def test_ring_segments_cut_by_the_detector_edges(self):
+        segments = self.lookup.get_ring_segments(self.geometry, self.shape, np.deg2rad(25))
+        self.assertEqual(len(segments), 4)
+        for segment in segments:
+            self.assertTrue(np.all(segment >= -0.5))
+            self.assertTrue(np.all(segment <= np.array(self.shape) - 0.5))
+
+    def test_get_continuous_segments(self):
+        positions = np.arange(20, dtype=np.float64).reshape(10, 2)
+        positions[[2, 6, 7]] = np.nan
+        segments = get_continuous_segments(positions)
+        self.assertEqual(len(segments), 2)
+        self.assertTrue(np.array_equal(segments[0], positions[3:6]))
+        self.assertTrue(np.array_equal(segments[1], np.concatenate((positions[8:], positions[:2]))))
+
+        self.assertEqual(get_continuous_segments(np.full((5, 2), np.nan)), [])
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import unittest
+
+import numpy as np
+from pyFAI.azimuthalIntegrator import AzimuthalIntegrator
+
+from ...model.util.RingPixelIndex import RingPixelIndex, get_spline_filename
+
+unittest_path = os.path.dirname(__file__)
+data_path = os.path.join(unittest_path, '../data')
+
+
+class RingPixelIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.geometry = AzimuthalIntegrator()
+        self.geometry.load(os.path.join(data_path, 'CeO2_Pilatus1M.poni'))
+        self.shape = (1043, 981)
+        self.index = RingPixelIndex()
+        self.delta_tth = np.deg2rad(0.1)
+
+    def assert_ring_pixels_are_correct(self, tth):
+        ring_pixels = self.index.get_ring_pixels(self.geometry, self.shape, tth, self.delta_tth)
+        tth_array = np.fromfunction(self.geometry.tth, self.shape, dtype=np.float32)
+        expected_pixels = np.flatnonzero(np.abs(tth_array - tth) <= self.delta_tth)
+        self.assertGreater(len(expected_pixels), 0)
+        self.assertTrue(np.array_equal(ring_pixels, expected_pixels))
+
+    def test_ring_pixels(self):
+        for tth in np.deg2rad([3, 7.5, 12]):
+            self.assert_ring_pixels_are_correct(tth)
+
+    def test_index_is_reused_for_small_geometry_changes(self):
+        self.assert_ring_pixels_are_correct(np.deg2rad(7.5))
+        order = self.index._order
+
+        self.geometry.poni1 += 2e-5
+        self.geometry.rot1 += 1e-4
+        self.assert_ring_pixels_are_correct(np.deg2rad(7.5))
+        self.assertIs(self.index._order, order)
+
+    def test_index_is_rebuilt_for_large_geometry_changes(self):
+        self.assert_ring_pixels_are_correct(np.deg2rad(7.5))
+        order = self.index._order
+
+        self.geometry.poni1 += 1e-3
+        self.assert_ring_pixels_are_correct(np.deg2rad(7.5))
+        self.assertIsNot(self.index._order, order)
+
+    def test_index_is_rebuilt_for_different_shape(self):
+        self.assert_ring_pixels_are_correct(np.deg2rad(7.5))
+        self.shape = (500, 400)
+        self.assert_ring_pixels_are_correct(np.deg2rad(7.5))
+
+    def test_spline_filename_of_detector(self):
+        class OldDetector(object):
+            splineFile = 'old.spline'
+
+        class NewDetector(object):
+            splinefile = 'new.spline'
+
+            @property
+            def splineFile(self):
+                raise AssertionError('deprecated attribute used')
+
+        self.assertEqual(get_spline_filename(OldDetector()), 'old.spline')
+        self.assertEqual(get_spline_filename(NewDetector()), 'new.spline')
+        self.assertIsNone(get_spline_filename(self.geometry.detector))
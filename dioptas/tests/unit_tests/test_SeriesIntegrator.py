@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import h5py
+
+from ...model.Configuration import Configuration
+from ...model.SeriesIntegrator import SeriesIntegrator
+from ...model.util.LambdaLoader import LambdaImage
+
+unittest_path = os.path.dirname(__file__)
+data_path = os.path.join(unittest_path, '../data')
+
+
+def create_lambda_file(filename, data, module_position=(0, 0, 0)):
+    with h5py.File(filename, 'w') as f:
+        f.create_dataset('entry/instrument/detector/description', data=[b'Lambda'])
+        f.create_dataset('entry/instrument/detector/data', data=data)
+        f.create_dataset('entry/instrument/detector/translation/distance', data=np.array(module_position))
+
+
+class SeriesIntegratorTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = tempfile.mkdtemp()
+        self.configuration = Configuration()
+        self.configuration.calibration_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.poni'))
+        self.configuration.img_model.load(os.path.join(data_path, 'CeO2_Pilatus1M.tif'))
+
+        # the lambda loader flips the images vertically
+        img_data = self.configuration.img_model.raw_img_data[::-1]
+        self.num_frames = 5
+        self.series_filename = os.path.join(self.temp_path, 'series_m1.nxs')
+        create_lambda_file(self.series_filename,
+                           np.array([img_data * (ind + 1) for ind in range(self.num_frames)], dtype=np.int32))
+        self.output_filename = os.path.join(self.temp_path, 'series.h5')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def test_integrate_series(self):
+        num_points = 1000
+        self.configuration.integration_rad_points = num_points
+        _, y_reference = self.configuration.calibration_model.integrate_1d(num_points=num_points,
+                                                                           remove_empty_bins=False)
+
+        series_integrator = SeriesIntegrator(self.configuration, chunk_size=2)
+        self.assertEqual(series_integrator.integrate(self.series_filename, self.output_filename), self.num_frames)
+
+        with h5py.File(self.output_filename, 'r') as f:
+            self.assertEqual(f['x'].attrs['unit'], '2th_deg')
+            intensity = f['intensity'][...]
+        self.assertEqual(intensity.shape, (self.num_frames, num_points))
+        for ind in range(self.num_frames):
+            np.testing.assert_array_almost_equal(intensity[ind] / np.nanmax(y_reference),
+                                                 (ind + 1) * y_reference / np.nanmax(y_reference))
+
+    def test_integrate_part_of_series_and_abort(self):
+        series_integrator = SeriesIntegrator(self.configuration, chunk_size=2)
+        integrated_frames = []
+
+        def callback(ind, num_frames):
+            integrated_frames.append(ind)
+            return ind < 1
+
+        self.assertEqual(series_integrator.integrate(self.series_filename, self.output_filename, start=1,
+                                                     callback=callback), 2)
+        self.assertEqual(integrated_frames, [0, 1])
+        with h5py.File(self.output_filename, 'r') as f:
+            self.assertEqual(f['intensity'].shape[0], 2)
+            self.assertEqual(f.attrs['first_frame'], 1)
+
+    def test_integrate_single_image(self):
+        series_integrator = SeriesIntegrator(self.configuration)
+        self.assertEqual(series_integrator.integrate(os.path.join(data_path, 'CeO2_Pilatus1M.tif'),
+                                                     self.output_filename), 1)
+
+
+class LambdaImageTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def test_get_images_stitches_modules(self):
+        module1 = np.ones((4, 3, 5))
+        module2 = np.ones((4, 3, 5)) * 2
+        create_lambda_file(os.path.join(self.temp_path, 'test_m1.nxs'), module1, (0, 0, 0))
+        create_lambda_file(os.path.join(self.temp_path, 'test_m2.nxs'), module2, (2, 4, 0))
+
+        lambda_image = LambdaImage(os.path.join(self.temp_path, 'test_m1.nxs'))
+        images = lambda_image.get_images(1, 10)
+        self.assertEqual(images.shape, (3, 7, 7))
+
+        image = images[0][::-1]
+        self.assertTrue(np.all(image[:3, :5] == 1))
+        self.assertTrue(np.all(image[3] == 0))
+        self.assertTrue(np.all(image[4:, 2:] == 2))
+        np.testing.assert_array_equal(lambda_image.get_image(1), images[0])
+
+    def test_single_module_is_memory_mapped(self):
+        data = np.arange(4 * 3 * 5, dtype=np.int32).reshape((4, 3, 5))
+        create_lambda_file(os.path.join(self.temp_path, 'test_m1.nxs'), data)
+
+        lambda_image = LambdaImage(os.path.join(self.temp_path, 'test_m1.nxs'))
+        images = lambda_image.get_images(1, 3)
+        self.assertIsInstance(images, np.memmap)
+        np.testing.assert_array_equal(images, data[1:3, ::-1])
@@ -19,8 +19,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import unittest
 import numpy as np
+from mock import patch
 
 from ...model.util import extract_background
+from ...model.util.BackgroundExtraction import BackgroundCache, get_linear_transformation
+from ...model.util.smooth_bruckner_python import smooth_bruckner as smooth_bruckner_python
 from ...model.util.PeakShapes import gaussian
 
 
@@ -101,3 +104,69 @@ class TestBackgroundExtraction(unittest.TestCase):
 
         y_extracted_bkg = extract_background(x, y_measurement, 1)
         self.assertAlmostEqual(np.sum(y_data - (y_measurement - y_extracted_bkg)), 0)
+
+    def test_python_smoothing_is_the_same_as_the_reference_implementation(self):
+        y = np.random.RandomState(0).rand(1000) * 10 + np.linspace(0, 5, 1000)
+        y[::97] += 100
+        np.testing.assert_array_equal(smooth_bruckner_python(y, 20, 10), smooth_bruckner_reference(y, 20, 10))
+        np.testing.assert_array_equal(smooth_bruckner_python(y, 1, 3), smooth_bruckner_reference(y, 1, 3))
+
+
+class TestBackgroundCache(unittest.TestCase):
+    def setUp(self):
+        self.x = np.linspace(0, 24, 2500)
+        self.y = gaussian(self.x, 10, 6, 0.1) + self.x * 0.4 + 5.0
+        self.cache = BackgroundCache()
+
+    def test_scaled_input_reuses_the_background(self):
+        y_bkg = self.cache.extract_background(self.x, self.y, 1)
+        y_scaled_bkg = self.cache.extract_background(self.x, self.y * 3 + 2, 1)
+
+        np.testing.assert_array_almost_equal(y_scaled_bkg, y_bkg * 3 + 2)
+        np.testing.assert_array_almost_equal(y_scaled_bkg, extract_background(self.x, self.y * 3 + 2, 1))
+
+    def test_changed_input_is_fitted_again(self):
+        self.cache.extract_background(self.x, self.y, 1)
+        y_new = self.y + gaussian(self.x, 10, 15, 0.1)
+
+        with patch('dioptas.model.util.BackgroundExtraction.extract_background',
+                   wraps=extract_background) as extract_background_mock:
+            np.testing.assert_array_almost_equal(self.cache.extract_background(self.x, y_new, 1),
+                                                 extract_background(self.x, y_new, 1))
+            np.testing.assert_array_almost_equal(self.cache.extract_background(self.x, y_new, 0.5),
+                                                 extract_background(self.x, y_new, 0.5))
+            self.cache.extract_background(self.x, y_new, 0.5)
+            self.assertEqual(extract_background_mock.call_count, 2)
+
+    def test_get_linear_transformation(self):
+        self.assertEqual(get_linear_transformation(self.y, self.y), (1, 0))
+        scaling, offset = get_linear_transformation(self.y, self.y * 0.5 - 3)
+        self.assertAlmostEqual(scaling, 0.5)
+        self.assertAlmostEqual(offset, -3)
+        self.assertIsNone(get_linear_transformation(self.y, -self.y))
+        self.assertIsNone(get_linear_transformation(self.y, self.y ** 2))
+
+
+def smooth_bruckner_reference(y, smooth_points, iterations):
+    """
+    Straightforward implementation of the bruckner smoothing working on a numpy array.
+    """
+    N_data = y.size
+    N = smooth_points
+    window_size = N * 2. + 1
+    y_extended = np.concatenate((np.ones(N) * y[0], y, np.ones(N) * y[-1]))
+
+    y_avg = np.average(y_extended)
+    y_c = y_avg + 2. * (y_avg - np.min(y_extended))
+    y_extended[y_extended > y_c] = y_c
+
+    for j in range(iterations):
+        window_avg = np.average(y_extended[0: 2 * N + 1])
+        for i in range(N, N_data - 1 - N - 1):
+            if y_extended[i] > window_avg:
+                y_new = window_avg
+                window_avg += ((window_avg - y_extended[i]) + (y_extended[i + N + 1] - y_extended[i - N])) / window_size
+                y_extended[i] = y_new
+            else:
+                window_avg += (y_extended[i + N + 1] - y_extended[i - N]) / window_size
+    return y_extended[N:N + N_data]
@@ -19,6 +19,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
 import unittest
+
+import numpy as np
 try:
     from urllib import pathname2url
 except ImportError:
@@ -26,7 +28,8 @@ except ImportError:
 
 from CifFile import ReadCif
 
-from ...model.util.cif import CifPhase, CifConverter
+from ...model.util.cif import CifPhase, CifConverter, get_laue_group, get_rotation_matrix, get_orbit_keys, \
+    compute_d_hkl
 
 unittest_path = os.path.dirname(__file__)
 data_path = os.path.join(unittest_path, '../data')
@@ -109,5 +112,41 @@ class TestCifModule(unittest.TestCase):
         cif_converter = CifConverter(0.31, min_d_spacing=1, min_intensity=5)
         jcpds_phase = cif_converter.convert_cif_to_jcpds(os.path.join(cif_path, 'ICSD_triclinic.cif'))
 
+    def test_symmetry_unique_reflections(self):
+        fcc_cif = ReadCif(get_cif_url('fcc.cif'))
+        cif_phase = CifPhase(fcc_cif[fcc_cif.keys()[0]])
+        cif_converter = CifConverter(0.31, min_d_spacing=1.5)
+        hkl, d_hkl, multiplicities = cif_converter._calculate_hkl_within_sphere_and_min_d_spacing(cif_phase)
+        reflections = cif_converter._calculate_reflection_intensities(cif_phase, hkl, d_hkl, multiplicities)
 
+        self.assertEqual([(r.h, r.k, r.l) for r in reflections[:3]], [(1, 1, 1), (2, 0, 0), (2, 2, 0)])
+        self.assertEqual([r.multiplicity for r in reflections[:3]], [8, 6, 12])
+        # all reflections are represented
+        h, k, l = np.mgrid[-3:4, -3:4, -3:4].reshape(3, -1)[:, np.arange(7 ** 3) != 7 ** 3 // 2]  # without (0, 0, 0)
+        self.assertEqual(np.sum(multiplicities), np.sum(compute_d_hkl(h, k, l, cif_phase) > 1.5))
 
+    def test_laue_group(self):
+        fcc_cif = ReadCif(get_cif_url('fcc.cif'))
+        self.assertEqual(len(get_laue_group(CifPhase(fcc_cif[fcc_cif.keys()[0]]))), 48)
+        hcp_cif = ReadCif(get_cif_url('hcp.cif'))
+        self.assertEqual(len(get_laue_group(CifPhase(hcp_cif[hcp_cif.keys()[0]]))), 24)
+        # only Friedel's law
+        self.assertEqual(len(get_laue_group(None)), 2)
+
+    def test_get_rotation_matrix(self):
+        rotation = get_rotation_matrix('-y, x-y, z+1./3')
+        self.assertTrue(np.array_equal(rotation, [[0, -1, 0], [1, -1, 0], [0, 0, 1]]))
+        self.assertIsNone(get_rotation_matrix('x, y, w'))
+
+    def test_equivalent_reflections_have_the_same_d_spacing(self):
+        hcp_cif = ReadCif(get_cif_url('hcp.cif'))
+        cif_phase = CifPhase(hcp_cif[hcp_cif.keys()[0]])
+        hkl = np.array([[1, 0, 0], [0, 1, 0], [-1, 1, 0], [1, 1, 0], [1, 0, 1], [0, -1, -1]])
+        keys = get_orbit_keys(hkl, get_laue_group(cif_phase))
+        self.assertEqual(len(set(keys[[0, 1, 2]])), 1)
+        self.assertEqual(len(set(keys[[4, 5]])), 1)
+        self.assertNotEqual(keys[0], keys[3])
+        self.assertNotEqual(keys[0], keys[4])
+
+        d_hkl = compute_d_hkl(hkl[:, 0], hkl[:, 1], hkl[:, 2], cif_phase)
+        self.assertTrue(np.allclose(d_hkl[[0, 1, 2]], d_hkl[0]))
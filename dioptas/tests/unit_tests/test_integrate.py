@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Dioptas - GUI program for fast processing of 2D X-ray diffraction data
+# Principal author: Clemens Prescher (clemens.prescher@gmail.com)
+# Copyright (C) 2014-2019 GSECARS, University of Chicago, USA
+# Copyright (C) 2015-2018 Institute for Geology and Mineralogy, University of Cologne, Germany
+# Copyright (C) 2019 DESY, Hamburg, Germany
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from ..._integrate import main, collect_image_files
+
+unittest_path = os.path.dirname(__file__)
+data_path = os.path.join(unittest_path, '../data')
+
+
+class IntegrateCommandLineTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = tempfile.mkdtemp()
+        self.img_path = os.path.join(self.temp_path, 'images')
+        os.mkdir(self.img_path)
+        for ind in range(2):
+            shutil.copy(os.path.join(data_path, 'CeO2_Pilatus1M.tif'),
+                        os.path.join(self.img_path, 'CeO2_{0:03d}.tif'.format(ind)))
+        with open(os.path.join(self.img_path, 'notes.txt'), 'w') as f:
+            f.write('not an image')
+        self.output_path = os.path.join(self.temp_path, 'output')
+        self.poni_filename = os.path.join(data_path, 'CeO2_Pilatus1M.poni')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def test_collect_image_files_from_directory_and_glob(self):
+        self.assertEqual(len(collect_image_files([self.img_path])), 2)
+        self.assertEqual(len(collect_image_files([os.path.join(self.img_path, '*_001.tif')])), 1)
+
+    def test_integrate_directory_to_patterns_and_cakes(self):
+        main(['-c', self.poni_filename, '-o', self.output_path, '-f', '.xy,.chi', '--cake-formats', '.txt',
+              '--unit', 'q_A^-1', '--num-points', '500', '-w', '1', '-q', self.img_path])
+
+        self.assertEqual(sorted(os.listdir(self.output_path)),
+                         ['CeO2_000.chi', 'CeO2_000.txt', 'CeO2_000.xy',
+                          'CeO2_001.chi', 'CeO2_001.txt', 'CeO2_001.xy'])
+        data = np.loadtxt(os.path.join(self.output_path, 'CeO2_000.xy'))
+        self.assertLessEqual(len(data), 500)
+
+    def test_integrate_with_wrong_mask_dimension(self):
+        with self.assertRaises(SystemExit):
+            main(['-c', self.poni_filename, '-m', os.path.join(data_path, 'test.mask'), '-o', self.output_path,
+                  '-w', '1', '-q', self.img_path])
+
+    def test_integrate_series(self):
+        main(['-c', self.poni_filename, '-o', self.output_path, '--series', '-q',
+              os.path.join(self.img_path, 'CeO2_000.tif')])
+        self.assertEqual(os.listdir(self.output_path), ['CeO2_000.h5'])
+
+    def test_integrate_into_container(self):
+        main(['-c', self.poni_filename, '-o', self.output_path, '--container', 'run.h5', '-w', '1', '-q',
+              self.img_path])
+        self.assertEqual(os.listdir(self.output_path), ['run.h5'])
@@ -121,6 +121,7 @@ class IntegrationWidget(QtWidgets.QWidget):
         self.pattern_header_chi_cb = self.integration_control_widget.pattern_control_widget.chi_cb
         self.pattern_header_dat_cb = self.integration_control_widget.pattern_control_widget.dat_cb
         self.pattern_header_fxye_cb = self.integration_control_widget.pattern_control_widget.fxye_cb
+        self.pattern_batch_container_cb = self.integration_control_widget.pattern_control_widget.batch_container_cb
 
         phase_control_widget = self.integration_control_widget.phase_control_widget
         self.phase_widget = phase_control_widget
@@ -43,11 +43,14 @@ class PatternWidget(QtWidgets.QWidget):
         self.chi_cb = QtWidgets.QCheckBox('.chi')
         self.dat_cb = QtWidgets.QCheckBox('.dat')
         self.fxye_cb = QtWidgets.QCheckBox('.fxye')
+        self.batch_container_cb = QtWidgets.QCheckBox('batch .h5')
+        self.batch_container_cb.setToolTip('Collect all patterns of a batch integration in a single HDF5 file')
         self._pattern_types_gb_layout = QtWidgets.QHBoxLayout()
         self._pattern_types_gb_layout.addWidget(self.xy_cb)
         self._pattern_types_gb_layout.addWidget(self.chi_cb)
         self._pattern_types_gb_layout.addWidget(self.dat_cb)
         self._pattern_types_gb_layout.addWidget(self.fxye_cb)
+        self._pattern_types_gb_layout.addWidget(self.batch_container_cb)
         self.pattern_types_gc.setLayout(self._pattern_types_gb_layout)
 
         self._pattern_types_layout = QtWidgets.QHBoxLayout()
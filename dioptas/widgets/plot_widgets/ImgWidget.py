@@ -24,11 +24,11 @@ import pyqtgraph as pg
 from pyqtgraph import ViewBox
 from pyqtgraph.exporters.ImageExporter import ImageExporter
 import numpy as np
-from skimage.measure import find_contours
 from qtpy import QtCore, QtWidgets, QtGui
 
 from .HistogramLUTItem import HistogramLUTItem
 from ...model.util.HelperModule import calculate_color
+from ...model.util.ImagePyramid import ImagePyramid
 
 
 class ImgWidget(QtCore.QObject):
@@ -36,6 +36,10 @@ class ImgWidget(QtCore.QObject):
     mouse_left_clicked = QtCore.Signal(float, float)
     mouse_left_double_clicked = QtCore.Signal(float, float)
 
+    # images with a larger dimension are displayed using an ImagePyramid, only the resolution needed for the
+    # current zoom and the visible region of the image are passed to pyqtgraph
+    pyramid_min_size = 2048
+
     def __init__(self, pg_layout, orientation='vertical'):
         super(ImgWidget, self).__init__()
         self.pg_layout = pg_layout
@@ -53,8 +57,10 @@ class ImgWidget(QtCore.QObject):
     def create_graphics(self):
         self.img_view_box = self.pg_layout.addViewBox(1, 1)  # type: ViewBox
 
-        self.data_img_item = pg.ImageItem()
+        self.data_img_item = PyramidImageItem()
         self.img_view_box.addItem(self.data_img_item)
+        self.img_view_box.sigRangeChanged.connect(self._view_changed)
+        self.img_view_box.sigResized.connect(self._view_changed)
 
         self.img_histogram_LUT_horizontal = HistogramLUTItem(self.data_img_item)
         self.pg_layout.addItem(self.img_histogram_LUT_horizontal, 0, 1)
@@ -96,10 +102,35 @@ class ImgWidget(QtCore.QObject):
 
     def plot_image(self, img_data, auto_level=False):
         self.img_data = img_data
-        self.data_img_item.setImage(img_data.T, auto_level)
+        if self.pyramid_min_size is not None and max(img_data.shape) > self.pyramid_min_size:
+            self.data_img_item.set_pyramid(ImagePyramid(img_data))
+        else:
+            self.data_img_item.set_pyramid(None)
+            self.data_img_item.setImage(img_data.T, auto_level)
+        self.auto_range_rescale()
+        self.update_displayed_image(auto_level)
         if auto_level:
             self.auto_level()
-        self.auto_range_rescale()
+
+    def update_displayed_image(self, auto_level=False):
+        """
+        Updates the displayed level and region of the image pyramid for the current view.
+        """
+        if self.data_img_item.pyramid is not None:
+            self.data_img_item.update_view(self.img_view_box.viewRect(), self.get_view_pixel_size(), auto_level)
+
+    def get_view_pixel_size(self):
+        """
+        :return: number of image pixels per screen pixel
+        """
+        # calculated from the view range, because the transformation of the view box is only updated when painting
+        view_rect = self.img_view_box.viewRect()
+        if self.img_view_box.width() <= 0 or self.img_view_box.height() <= 0:
+            return 1
+        return min(view_rect.width() / self.img_view_box.width(), view_rect.height() / self.img_view_box.height())
+
+    def _view_changed(self, *_):
+        self.update_displayed_image()
 
     def save_img(self, filename):
         exporter = ImageExporter(self.img_view_box)
@@ -107,13 +138,15 @@ class ImgWidget(QtCore.QObject):
         exporter.export(filename)
 
     def set_range(self, x_range, y_range):
-        img_bounds = self.img_view_box.childrenBoundingRect()
+        if self.data_img_item.pyramid is not None:
+            img_bounds = QtCore.QRectF(0, 0, self.img_data.shape[1], self.img_data.shape[0])
+        else:
+            img_bounds = self.img_view_box.childrenBoundingRect()
         if x_range[0] <= img_bounds.left() and \
                 x_range[1] >= img_bounds.right() and \
                 y_range[0] <= img_bounds.bottom() and \
                 y_range[1] >= img_bounds.top():
-            self.img_view_box.autoRange()
-            self._max_range = True
+            self.auto_range()
             return
         self.img_view_box.setRange(xRange=x_range, yRange=y_range)
         self._max_range = False
@@ -170,7 +203,7 @@ class ImgWidget(QtCore.QObject):
         self.img_scatter_plot_item.show()
 
     def mouseMoved(self, pos):
-        pos = self.data_img_item.mapFromScene(pos)
+        pos = self.img_view_box.mapSceneToView(pos)
         self.mouse_moved.emit(pos.x(), pos.y())
 
     def modify_mouse_behavior(self):
@@ -263,11 +296,18 @@ class ImgWidget(QtCore.QObject):
                 pg.ViewBox.wheelEvent(self.img_view_box, ev)
 
     def auto_range(self):
-        self.img_view_box.autoRange()
+        if self.data_img_item.pyramid is not None:
+            # only a part of the image might be displayed, so the bounding rect of the items is not the image
+            self.img_view_box.setRange(QtCore.QRectF(0, 0, self.img_data.shape[1], self.img_data.shape[0]))
+        else:
+            self.img_view_box.autoRange()
         self._max_range = True
 
 
 class CalibrationCakeWidget(ImgWidget):
+    # the cake axes are calculated from the image item coordinates, which are only the image pixels without pyramid
+    pyramid_min_size = None
+
     def __init__(self, pg_layout, orientation='vertical'):
         super(CalibrationCakeWidget, self).__init__(pg_layout, orientation)
         self.img_view_box.setAspectLocked(False)
@@ -370,22 +410,19 @@ class IntegrationImgWidget(MaskImgWidget):
         for plot_item in self.circle_plot_items:
             self.img_view_box.addItem(plot_item)
 
-    def set_circle_line(self, tth, cur_tth):
+    def set_circle_line(self, segments):
         """
-        sets the circle plot items to a specfic two theta (tth) value
-        :param tth: array of twotheta for the image
-        :param cur_tth: two theta value for the line
+        sets the circle plot items to the line of a specific two theta value
+        :param segments: list of arrays with the pixel indices (shape (n, 2)) of the continuous parts of the line
         """
-        tth_ind = find_contours(tth, cur_tth)
-
         # delete old graphs
         for plot_item in self.circle_plot_items:
             plot_item.setData(x=[], y=[])
 
-        for plot_ind, tth in enumerate(tth_ind):
-            x_plot = tth[:, 1] + 0.5
-            y_plot = tth[:, 0] + 0.5
-            self.circle_plot_items[plot_ind].setData(x=x_plot, y=y_plot)
+        for plot_item, segment in zip(self.circle_plot_items, segments):
+            x_plot = segment[:, 1] + 0.5
+            y_plot = segment[:, 0] + 0.5
+            plot_item.setData(x=x_plot, y=y_plot)
 
     def activate_circle_scatter(self):
         for plot_item in self.circle_plot_items:
@@ -593,6 +630,88 @@ class CakePhasePlot(object):
                 self.plot_item.removeItem(item)
 
 
+class PyramidImageItem(pg.ImageItem):
+    """
+    ImageItem which can display an ImagePyramid. Only the visible region (with a margin for panning) of the pyramid
+    level matching the zoom is passed to pyqtgraph, the item is scaled and shifted so that its coordinates are
+    still the pixel coordinates of the full resolution image. The histogram is taken from the pyramid, so that it
+    does not change with the displayed region.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PyramidImageItem, self).__init__(*args, **kwargs)
+        self.pyramid = None
+        self.displayed_level = None
+        self.displayed_region = None
+
+    def set_pyramid(self, pyramid):
+        """
+        :param pyramid: ImagePyramid, which is displayed after the next call of update_view, or None for displaying
+                        the image given to setImage directly
+        """
+        self.pyramid = pyramid
+        self.displayed_level = None
+        self.displayed_region = None
+        if pyramid is None:
+            self.resetTransform()
+
+    def update_view(self, view_rect, pixel_size, auto_level=False):
+        """
+        Displays the pyramid level and region needed for the view, the image data is only updated if the level
+        changes or the view is outside of the currently displayed region.
+        :param view_rect: visible region in image pixel coordinates (x along the second, y along the first image axis)
+        :param pixel_size: number of image pixels per screen pixel
+        """
+        level = self.pyramid.get_level_for_pixel_size(pixel_size)
+        level_data = self.pyramid.get_level(level)
+        scale = 2 ** level
+
+        visible_region = get_region(view_rect, scale, level_data.shape, margin=0)
+        if level == self.displayed_level and is_inside(visible_region, self.displayed_region):
+            return
+
+        region = get_region(view_rect, scale, level_data.shape, margin=0.5)
+        (row_min, row_max), (col_min, col_max) = region
+        if row_max <= row_min or col_max <= col_min:
+            # the view is completely outside of the image
+            region = (0, level_data.shape[0]), (0, level_data.shape[1])
+            (row_min, row_max), (col_min, col_max) = region
+
+        self.displayed_level = level
+        self.displayed_region = region
+        self.setImage(level_data[row_min:row_max, col_min:col_max].T, auto_level)
+        self.setRect(QtCore.QRectF(col_min * scale, row_min * scale,
+                                   (col_max - col_min) * scale, (row_max - row_min) * scale))
+
+    def getHistogram(self, bins='auto', *args, **kwargs):
+        if self.pyramid is None:
+            return super(PyramidImageItem, self).getHistogram(bins, *args, **kwargs)
+        return self.pyramid.get_histogram(1000 if bins == 'auto' else bins)
+
+
+def get_region(view_rect, scale, shape, margin):
+    """
+    :param view_rect: QRectF in image pixel coordinates
+    :param scale: number of image pixels per pixel of the pyramid level
+    :param shape: shape of the pyramid level
+    :param margin: margin added on each side, relative to the size of the view
+    :return: ((row_min, row_max), (col_min, col_max)) in pixels of the pyramid level, clipped to its shape
+    """
+    x_margin = view_rect.width() * margin
+    y_margin = view_rect.height() * margin
+    col_min = int(np.clip(np.floor((view_rect.left() - x_margin) / scale), 0, shape[1]))
+    col_max = int(np.clip(np.ceil((view_rect.right() + x_margin) / scale), 0, shape[1]))
+    row_min = int(np.clip(np.floor((view_rect.top() - y_margin) / scale), 0, shape[0]))
+    row_max = int(np.clip(np.ceil((view_rect.bottom() + y_margin) / scale), 0, shape[0]))
+    return (row_min, row_max), (col_min, col_max)
+
+
+def is_inside(region, outer_region):
+    if outer_region is None:
+        return False
+    return all(outer[0] <= inner[0] and inner[1] <= outer[1] for inner, outer in zip(region, outer_region))
+
+
 mask_pen = QtGui.QPen(QtGui.QColor(255, 255, 255), 0.5)
 
 